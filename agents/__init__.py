@@ -2,4 +2,8 @@ from .q_agent import *
 from .cleanup_agent import *
 from .util import *
 from .zerod_u_coord import *
-from .oned_u_coord import *
\ No newline at end of file
+from .zerod_value_iteration import *
+from .oned_u_coord import *
+from .rollout import *
+from .metrics import *
+from .checkpoint import *
\ No newline at end of file
@@ -0,0 +1,184 @@
+import copy
+import json
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+
+def snapshot(state):
+    """
+    Deep copy of a nested state (dicts, lists, tensors, arrays), with every tensor detached and copied to the CPU.
+    Unlike a state_dict, which references the live parameters, the snapshot no longer changes as training continues.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, np.ndarray):
+        return state.copy()
+    if isinstance(state, dict):
+        return {key: snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(value) for value in state)
+    return copy.deepcopy(state)
+
+
+def atomic_write(path, write):
+    """
+    Call write(f) on a temporary file next to path, then move it over path, so readers only ever see a complete file.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class CheckpointManager:
+    """
+    Keeps the checkpoints of a training run in directory: latest.pt, rewritten on every save so a crashed run can resume,
+    and episode_<n>.pt for the keep episodes with the highest reward, listed best first in index.json.
+    save takes a deep CPU snapshot of the agent's state_dict (network, optimizer, scheduler, epsilon and replay memory for
+    the coordinators and QAgent) together with the random number generator states, and a background thread writes it with
+    an atomic rename, so training continues while the file is written and a crash never leaves a torn checkpoint.
+    With resume=True the run already in directory is continued: its best episodes stay ranked against the new ones. A new
+    run removes the checkpoints an earlier run left in directory, so they are neither ranked against nor overwritten by
+    its own.
+    """
+
+    def __init__(self, directory, keep=3, save_latest=True, resume=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.keep = keep
+        self.save_latest = save_latest
+        self.index_path = os.path.join(directory, "index.json")
+        self.best = []
+        if resume and os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.best = json.load(f)["best"]
+        elif not resume:
+            for file in os.listdir(directory):
+                if file == "index.json" or file == "latest.pt" or (file.startswith("episode_") and file.endswith(".pt")):
+                    os.remove(os.path.join(directory, file))
+
+        self.pending = queue.Queue(maxsize=2)
+        self.error = None
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def save(self, agent, episode, reward, **extra):
+        """
+        Checkpoint agent (an object with state_dict, or a state dict itself) after episode. Returns True if the
+        episode is among the keep best so far.
+        """
+        self.raise_writer_error()
+        reward = float(reward)
+        is_best = len(self.best) < self.keep or reward > self.best[-1]["reward"]
+        if not (is_best or self.save_latest):
+            return False
+
+        files = ["latest.pt"] if self.save_latest else []
+        evicted = []
+        if is_best:
+            file = f"episode_{episode}.pt"
+            self.best = [entry for entry in self.best if entry["file"] != file]
+            self.best.append({"episode": episode, "reward": reward, "file": file})
+            self.best.sort(key=lambda entry: -entry["reward"])
+            evicted = [entry["file"] for entry in self.best[self.keep:]]
+            self.best = self.best[:self.keep]
+            files.append(file)
+
+        state = agent.state_dict() if hasattr(agent, "state_dict") else agent
+        payload = snapshot({
+            "episode": episode,
+            "reward": reward,
+            "agent": state,
+            "extra": extra,
+            "rng": {"random": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()},
+        })
+        self.pending.put((payload, files, evicted, list(self.best)))
+        return is_best
+
+    def write_loop(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self.write(*item)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.pending.task_done()
+
+    def write(self, payload, files, evicted, best):
+        for file in files:
+            atomic_write(os.path.join(self.directory, file), lambda f: torch.save(payload, f))
+        # the index only ever names files that are fully written
+        atomic_write(self.index_path, lambda f: f.write(json.dumps({"best": best}, indent=2).encode()))
+        for file in evicted:
+            if all(entry["file"] != file for entry in best):
+                os.remove(os.path.join(self.directory, file))
+
+    def raise_writer_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"checkpoint writer for {self.directory} failed") from self.error
+
+    def wait(self):
+        """
+        Block until every checkpoint saved so far is on disk.
+        """
+        self.pending.join()
+        self.raise_writer_error()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.pending.put(None)
+            self.writer.join()
+        self.raise_writer_error()
+
+    def path(self, which="latest"):
+        """
+        Path of the latest checkpoint, the best one, or the one of a given episode.
+        """
+        if which == "latest":
+            return os.path.join(self.directory, "latest.pt")
+        if which == "best":
+            if not self.best:
+                raise FileNotFoundError(f"no checkpoints in {self.directory}")
+            return os.path.join(self.directory, self.best[0]["file"])
+        return os.path.join(self.directory, f"episode_{which}.pt")
+
+    def exists(self, which="latest"):
+        return (which != "best" or bool(self.best)) and os.path.exists(self.path(which))
+
+    def load(self, which="latest"):
+        """
+        Returns the checkpoint payload: episode, reward, agent state, extra and rng states.
+        """
+        # the payload holds numpy arrays and RNG states as well as tensors, so it is not a weights-only file
+        return torch.load(self.path(which), map_location="cpu", weights_only=False)
+
+    def restore(self, agent, which="latest", restore_rng=False):
+        """
+        Load a checkpoint into agent with load_state_dict, optionally restoring the random number generators too.
+        Returns the payload.
+        """
+        payload = self.load(which)
+        agent.load_state_dict(payload["agent"])
+        if restore_rng:
+            random.setstate(payload["rng"]["random"])
+            np.random.set_state(payload["rng"]["numpy"])
+            torch.set_rng_state(payload["rng"]["torch"])
+        return payload
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -10,3 +10,100 @@ class GreedyCleanUpAgent(CleanupAgent):
     def __init__(self, agent_id, start_pos, region):
         super().__init__(agent_id, start_pos)
         self.region = region  # region == 1 for apples and -1 for waste
+
+
+class AgentView:
+    """
+    Thin view of one row of an AgentTable, exposing the pos / region / reward attributes of a GreedyCleanUpAgent.
+    """
+    __slots__ = ('table', 'index', 'agent_id')
+
+    def __init__(self, table, index, agent_id):
+        self.table = table
+        self.index = index
+        self.agent_id = agent_id
+
+    @property
+    def pos(self):
+        if self.table.pos.ndim == 1:
+            return self.table.pos.item(self.index)
+        return self.table.pos[self.index].copy()
+
+    @pos.setter
+    def pos(self, value):
+        self.table.pos[self.index] = value
+        self.table.changed()
+
+    @property
+    def region(self):
+        return self.table.region_of(self.table.region.item(self.index))
+
+    @region.setter
+    def region(self, value):
+        self.table.region[self.index] = getattr(value, 'value', value)
+        self.table.changed()
+
+    @property
+    def reward(self):
+        return self.table.reward.item(self.index)
+
+    @reward.setter
+    def reward(self, value):
+        self.table.reward[self.index] = value
+
+
+class AgentTable:
+    """
+    Struct-of-arrays state of a fixed set of agents: pos (N,) or (N, pos_dims), region (N,) and reward (N,), with row k
+    belonging to ids[k]. Behaves like the {agent_id: agent} dict the environments used to keep, handing out AgentView
+    objects, while vectorised code works on the arrays directly.
+    Regions are stored as their integer value; region_type (e.g. an Enum) converts them back for the views.
+    on_change, if given, is called after every pos or region write through a view or assign, so an environment can
+    invalidate what it cached about its agents; writes to the arrays themselves are not seen.
+    """
+
+    def __init__(self, agent_ids, pos_dims=0, region=0, region_type=None, on_change=None):
+        self.ids = list(agent_ids)
+        self.slots = {id: k for k, id in enumerate(self.ids)}
+        num_agents = len(self.ids)
+        self.pos = np.zeros(num_agents if pos_dims == 0 else (num_agents, pos_dims), dtype=np.int64)
+        self.region = np.full(num_agents, getattr(region, 'value', region), dtype=np.int8)
+        self.reward = np.zeros(num_agents)
+        self.regions = {} if region_type is None else {r.value: r for r in region_type}
+        self.views = {id: AgentView(self, k, id) for k, id in enumerate(self.ids)}
+        self.on_change = on_change
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def region_of(self, value):
+        return self.regions.get(value, value)
+
+    def assign(self, agent_ids, region):
+        """
+        Set the region of the given agents in one write.
+        """
+        self.region[[self.slots[id] for id in agent_ids]] = getattr(region, 'value', region)
+        self.changed()
+
+    def __getitem__(self, agent_id):
+        return self.views[agent_id]
+
+    def __contains__(self, agent_id):
+        return agent_id in self.views
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def keys(self):
+        return self.views.keys()
+
+    def values(self):
+        return self.views.values()
+
+    def items(self):
+        return self.views.items()
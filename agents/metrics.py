@@ -0,0 +1,178 @@
+import math
+import os
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+DATASETS = ("steps", "episodes")
+
+
+def part_files(path):
+    """
+    Sorted names of the complete part files of a dataset directory.
+    """
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if name.startswith("part-") and name.endswith(".parquet"))
+
+
+class MetricsLogger:
+    """
+    Columnar metrics of a training run, stored as two Parquet datasets in directory: steps/ with one row per
+    (episode, step) holding the per-step series (apples, dirt, pickers, cleaners, ...) and episodes/ with one row per
+    episode holding its reward and any other scalars.
+    Episodes are buffered in memory and handed to a background writer thread every flush_every episodes, which writes
+    them as a new part file of each dataset (written under a hidden name, then renamed), so the training loop never
+    formats or writes text and a killed run keeps every flushed part readable. summary() gives a fixed-size console line
+    over the last window episodes in place of printing the whole reward history.
+    A new run removes the parts left in directory by an earlier one; with resume=True the parts are kept and new ones are
+    added after them, and read_metrics keeps the last logging of an episode that was run again.
+    Every episode must log the same series and scalars.
+    """
+
+    def __init__(self, directory, flush_every=20, window=20, resume=False):
+        self.directory = directory
+        self.next_part = 0
+        for name in DATASETS:
+            path = os.path.join(directory, name)
+            os.makedirs(path, exist_ok=True)
+            for file in part_files(path):
+                if resume:
+                    self.next_part = max(self.next_part, int(file[len("part-"):-len(".parquet")]) + 1)
+                else:
+                    os.remove(os.path.join(path, file))
+        self.flush_every = flush_every
+        self.step_buffer = []
+        self.episode_buffer = []
+        self.recent = deque(maxlen=window)
+        self.best_reward = -math.inf
+        self.best_episode = None
+        self.num_episodes = 0
+
+        # bounded, so a slow disk applies back-pressure instead of piling up tables in memory
+        self.pending = queue.Queue(maxsize=4)
+        self.error = None
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def log_episode(self, episode, reward, series=None, **scalars):
+        """
+        Record one episode. series maps column names to equal-length per-step sequences; scalars become columns of the
+        episode row.
+        """
+        reward = float(reward)
+        self.episode_buffer.append({"episode": episode, "reward": reward, **{name: float(value) for name, value in scalars.items()}})
+        if series:
+            columns = {name: np.asarray(values, dtype=np.float64) for name, values in series.items()}
+            num_steps = len(next(iter(columns.values())))
+            columns = {"episode": np.full(num_steps, episode, dtype=np.int64), "step": np.arange(num_steps, dtype=np.int64), **columns}
+            self.step_buffer.append(columns)
+
+        self.num_episodes += 1
+        self.recent.append(reward)
+        if reward > self.best_reward:
+            self.best_reward = reward
+            self.best_episode = episode
+        if len(self.episode_buffer) >= self.flush_every:
+            self.flush()
+
+    def summary(self):
+        if not self.recent:
+            return "no episodes logged"
+        return (f"episodes: {self.num_episodes}  last: {self.recent[-1]:.1f}  "
+                f"mean of last {len(self.recent)}: {np.mean(self.recent):.1f}  best: {self.best_reward:.1f} (episode {self.best_episode})")
+
+    def flush(self):
+        """
+        Hand the buffered episodes to the writer thread.
+        """
+        self.raise_writer_error()
+        if not self.episode_buffer:
+            return
+        tables = {"episodes": pa.Table.from_pylist(self.episode_buffer)}
+        if self.step_buffer:
+            tables["steps"] = pa.table({name: np.concatenate([chunk[name] for chunk in self.step_buffer]) for name in self.step_buffer[0]})
+        self.episode_buffer = []
+        self.step_buffer = []
+        self.pending.put(tables)
+
+    def write_loop(self):
+        try:
+            while True:
+                tables = self.pending.get()
+                if tables is None:
+                    break
+                for name, table in tables.items():
+                    self.write_part(name, table)
+                self.next_part += 1
+        except Exception as e:
+            self.error = e
+            # keep draining so producers blocked on the queue are released
+            while self.pending.get() is not None:
+                pass
+
+    def write_part(self, name, table):
+        # readers skip files starting with ".", so a part only shows up once it is complete
+        file = f"part-{self.next_part:06d}.parquet"
+        temporary = os.path.join(self.directory, name, f".{file}.tmp")
+        pq.write_table(table, temporary)
+        os.replace(temporary, os.path.join(self.directory, name, file))
+
+    def raise_writer_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"metrics writer for {self.directory} failed") from self.error
+
+    def close(self):
+        """
+        Flush the remaining episodes and wait for the writer thread to write them.
+        """
+        if not self.writer.is_alive():
+            return
+        try:
+            self.flush()
+        finally:
+            self.pending.put(None)
+            self.writer.join()
+        self.raise_writer_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def last_logged(table, starts):
+    """
+    Rows of table (in part order) that belong to the last logging of their episode, given the row positions where a
+    logging of an episode starts.
+    """
+    episodes = table["episode"].to_numpy()
+    starts = starts[::-1]
+    logged, first = np.unique(episodes[starts], return_index=True)
+    last_start = starts[first][np.searchsorted(logged, episodes)]
+    return table.filter(pa.array(np.arange(len(episodes)) >= last_start))
+
+
+def read_metrics(directory):
+    """
+    Returns (steps, episodes) as pyarrow tables; steps is None if no per-step series were logged.
+    Episodes logged again after a resume from an earlier checkpoint only keep their last logging.
+    """
+    tables = {}
+    for name in DATASETS:
+        path = os.path.join(directory, name)
+        tables[name] = pq.read_table(path) if part_files(path) else None
+    steps, episodes = tables["steps"], tables["episodes"]
+    if episodes is None:
+        raise FileNotFoundError(f"no metrics in {directory}")
+    episodes = last_logged(episodes, np.arange(len(episodes)))
+    if steps is not None:
+        steps = last_logged(steps, np.flatnonzero(steps["step"].to_numpy() == 0))
+    return steps, episodes
@@ -1,12 +1,13 @@
 import random
 from environments.one_d_cleanup_env import OneDCleanupEnv
+from environments.profiling import NULL_PROFILER, profiled
 from models import UNetwork
 import torch
-from agents.util import ReplayBuffer
+from agents.util import ReplayBuffer, PrioritizedReplayBuffer
 import numpy as np
 
 class OneDUCoordinator:
-    def __init__(self, device, env: OneDCleanupEnv, num_agents, num_roles, u_layers: list[tuple[int, int]],  buffer_size=10000, batch_size=64, lr=0.001, gamma=0.9999, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.05):
+    def __init__(self, device, env: OneDCleanupEnv, num_agents, num_roles, u_layers: list[tuple[int, int]],  buffer_size=10000, batch_size=64, lr=0.001, gamma=0.9999, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.05, prioritized_replay=False, profiler=None, inference=None, inference_sync_every=10, seed=None):
         self.num_agents = num_agents
         self.num_roles = num_roles
         self.batch_size = batch_size
@@ -17,6 +18,8 @@ class OneDUCoordinator:
         self.epsilon_min = epsilon_min
 
         self.env = env
+        # shares the environment's profiler unless given its own, so one summary covers the whole step
+        self.profiler = getattr(env, "profiler", NULL_PROFILER) if profiler is None else profiler
 
         self.device = device
 
@@ -24,29 +27,35 @@ class OneDUCoordinator:
         self.u_optimizer = torch.optim.Adam(self.u_network.parameters(), lr=lr)
         self.scheduler = torch.optim.lr_scheduler.StepLR(self.u_optimizer, step_size=100, gamma=0.6)
 
-        self.memory = ReplayBuffer(buffer_size)
+        # the state counts are network inputs, so every column is float; seed drives the buffer's own sampling generator
+        memory_dtypes = (np.float32,) * 3
+        self.memory = PrioritizedReplayBuffer(buffer_size, dtypes=memory_dtypes, seed=seed) if prioritized_replay else ReplayBuffer(buffer_size, dtypes=memory_dtypes, seed=seed)
+        # optional models.InferenceServer owned by this coordinator; when set, generate_roles is batched through it and
+        # every inference_sync_every optimizer steps push the new weights to it
+        self.inference = inference
+        self.inference_sync_every = inference_sync_every
+        self.train_steps = 0
+        self.sync_inference()
 
+        # reused by generate_roles for the next state of every picker/cleaner split
+        self.split_states = torch.zeros((num_agents + 1, 4), device=self.device)
+
+    @profiled("generate_roles")
     def generate_roles(self):
         if random.random() < max(self.epsilon, self.epsilon_min):
+            self.profiler.count("random_roles")
             num_dirt_agents = random.randint(0, self.num_agents)
             return num_dirt_agents, self.num_agents - num_dirt_agents
         
-        all_imm_rewards = []
-        all_next_states = []
-        for i in range(self.num_agents + 1):
-            new_p = self.num_agents - i
-            new_c = i
-            assignments = self.env.get_greedy_assignments(new_p, new_c)
-            actions = self.env.get_greedy_actions(assignments)
-            observations, rewards = self.env.simulate_step(actions)
-            future_state = observations["coordinator"]
-            exp_imm_reward = sum(rewards.values())
-            all_imm_rewards.append(exp_imm_reward)
-            future_state = torch.tensor(future_state).float().unsqueeze(0).to(self.device)
-            all_next_states.append(future_state)
-        all_next_states = torch.stack(all_next_states).float().to(self.device)
-        all_pred_rewards = self.u_network(all_next_states).flatten()
-        all_imm_rewards = torch.tensor(all_imm_rewards).float().to(self.device)
+        next_states, imm_rewards = self.env.evaluate_role_splits()
+        with self.profiler.phase("u_network"):
+            if self.inference is not None:
+                all_pred_rewards = self.inference(next_states).flatten().to(self.device)
+            else:
+                self.split_states.copy_(torch.from_numpy(next_states))
+                with torch.no_grad():
+                    all_pred_rewards = self.u_network(self.split_states).flatten()
+        all_imm_rewards = torch.from_numpy(imm_rewards).float().to(self.device)
         all_future_rewards = all_imm_rewards + self.gamma * all_pred_rewards
         max_reward_dirt_agents = round(torch.argmax(all_future_rewards).item().real)
 
@@ -56,21 +65,49 @@ class OneDUCoordinator:
         self.memory.add((state, reward, next_state))
         self.epsilon *= self.epsilon_decay
         if len(self.memory) > self.batch_size:
-            experiences = self.memory.sample(self.batch_size)
-            self.train(experiences)
-
-    def train(self, experiences):
-        states, rewards, next_states = zip(*experiences)
+            indices = self.memory.sample_indices(self.batch_size)
+            self.train(self.memory.gather_tensors(indices, self.device), indices)
 
-        states = torch.from_numpy(np.stack(states)).float().to(self.device)
-        rewards = torch.from_numpy(np.vstack(rewards)).float().to(self.device)
-        next_states = torch.from_numpy(np.stack(next_states)).float().to(self.device)
+    @profiled("train")
+    def train(self, experiences, indices=None):
+        states, rewards, next_states = experiences
+        rewards = rewards.view(len(rewards), -1)
 
         current_values = self.u_network(states)
         next_values = self.u_network(next_states)
         expected_values = rewards + self.gamma * next_values
 
-        loss = torch.nn.functional.mse_loss(current_values, expected_values)
+        if indices is None:
+            loss = torch.nn.functional.mse_loss(current_values, expected_values)
+        else:
+            td_errors = expected_values - current_values
+            weights = torch.from_numpy(self.memory.importance_weights(indices)).to(self.device).view(-1, 1)
+            loss = (weights * td_errors ** 2).mean()
+            self.memory.update_priorities(indices, td_errors.detach().abs().cpu().numpy().flatten())
         self.u_optimizer.zero_grad()
         loss.backward()
-        self.u_optimizer.step()
\ No newline at end of file
+        self.u_optimizer.step()
+        self.train_steps += 1
+        if self.train_steps % self.inference_sync_every == 0:
+            self.sync_inference()
+
+    def state_dict(self):
+        return {
+            "u_network": self.u_network.state_dict(),
+            "u_optimizer": self.u_optimizer.state_dict(),
+            "scheduler": self.scheduler.state_dict(),
+            "epsilon": self.epsilon,
+            "memory": self.memory.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.u_network.load_state_dict(state["u_network"])
+        self.u_optimizer.load_state_dict(state["u_optimizer"])
+        self.scheduler.load_state_dict(state["scheduler"])
+        self.epsilon = state["epsilon"]
+        self.memory.load_state_dict(state["memory"])
+        self.sync_inference()
+
+    def sync_inference(self):
+        if self.inference is not None:
+            self.inference.update(self.u_network.state_dict(), owner=self)
\ No newline at end of file
@@ -1,12 +1,12 @@
 from models.qnet import QNetwork
 import torch
 import numpy as np
-from agents.util import ReplayBuffer
+from agents.util import ReplayBuffer, PrioritizedReplayBuffer
 
 import random
 class QAgent:
     def __init__(self, device, num_action_outputs, action_size, state_dim, q_layers: list[tuple[int, int]], buffer_size=1000,
-                 batch_size=128, lr=0.001, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.05, gamma=0.99, verbose=False):
+                 batch_size=128, lr=0.001, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.05, gamma=0.99, verbose=False, prioritized_replay=False, inference=None, inference_sync_every=10, seed=None):
         self.device = device
         
         self.num_action_outputs = num_action_outputs
@@ -18,7 +18,15 @@ class QAgent:
         self.q_optimizer = torch.optim.Adam(self.q_network.parameters(), lr=lr)
         self.scheduler = torch.optim.lr_scheduler.StepLR(self.q_optimizer, step_size=100, gamma=0.6)
 
-        self.memory = ReplayBuffer(buffer_size)
+        # actions index the Q-values, the other columns are network inputs; seed drives the buffer's own sampling generator
+        memory_dtypes = (np.float32, np.int64, np.float32, np.float32)
+        self.memory = PrioritizedReplayBuffer(buffer_size, dtypes=memory_dtypes, seed=seed) if prioritized_replay else ReplayBuffer(buffer_size, dtypes=memory_dtypes, seed=seed)
+        # optional models.InferenceServer owned by this agent, batching act's Q-network forward; every
+        # inference_sync_every optimizer steps push the new weights to it
+        self.inference = inference
+        self.inference_sync_every = inference_sync_every
+        self.train_steps = 0
+        self.sync_inference()
 
         self.epsilon = epsilon
         self.epsilon_decay = epsilon_decay
@@ -26,9 +34,12 @@ class QAgent:
         self.gamma = gamma
 
     def act(self, state):
-        state = torch.from_numpy(state).float().unsqueeze(0).to(self.device)
-        q_values = self.q_network(state)
         if random.random() > max(self.epsilon, 0.05):
+            if self.inference is not None:
+                q_values = self.inference(state[None])
+            else:
+                state = torch.from_numpy(state).float().unsqueeze(0).to(self.device)
+                q_values = self.q_network(state)
             return torch.argmax(q_values, dim=2).cpu().numpy()
         else:
             return np.random.choice(self.action_size, (1, self.num_action_outputs))
@@ -41,13 +52,10 @@ class QAgent:
         self.epsilon = max(self.epsilon, self.epsilon_min)
 
     def train(self):
-        experiences = self.memory.sample(self.batch_size)
-        states, actions, rewards, next_states = zip(*experiences)
-
-        states = torch.from_numpy(np.stack(states)).float().to(self.device)
-        actions = torch.from_numpy(np.vstack(actions)).long().unsqueeze(2).to(self.device)
-        rewards = torch.from_numpy(np.vstack(rewards)).float().unsqueeze(2).to(self.device)
-        next_states = torch.from_numpy(np.stack(next_states)).float().to(self.device)
+        indices = self.memory.sample_indices(self.batch_size)
+        states, actions, rewards, next_states = self.memory.gather_tensors(indices, self.device)
+        actions = actions.long().view(len(actions), -1).unsqueeze(2)
+        rewards = rewards.view(len(rewards), -1).unsqueeze(2)
 
         q_values = self.q_network(states)
         q_values = q_values.gather(2, actions)
@@ -57,7 +65,34 @@ class QAgent:
 
         expected_q_values = rewards + self.gamma * next_q_values
 
-        loss = torch.nn.functional.mse_loss(q_values, expected_q_values)
+        td_errors = expected_q_values - q_values
+        weights = torch.from_numpy(self.memory.importance_weights(indices)).to(self.device).view(-1, 1, 1)
+        loss = (weights * td_errors ** 2).mean()
+        self.memory.update_priorities(indices, td_errors.detach().abs().mean(dim=(1, 2)).cpu().numpy())
         self.q_optimizer.zero_grad()
         loss.backward()
-        self.q_optimizer.step()
\ No newline at end of file
+        self.q_optimizer.step()
+        self.train_steps += 1
+        if self.train_steps % self.inference_sync_every == 0:
+            self.sync_inference()
+
+    def state_dict(self):
+        return {
+            "q_network": self.q_network.state_dict(),
+            "q_optimizer": self.q_optimizer.state_dict(),
+            "scheduler": self.scheduler.state_dict(),
+            "epsilon": self.epsilon,
+            "memory": self.memory.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.q_network.load_state_dict(state["q_network"])
+        self.q_optimizer.load_state_dict(state["q_optimizer"])
+        self.scheduler.load_state_dict(state["scheduler"])
+        self.epsilon = state["epsilon"]
+        self.memory.load_state_dict(state["memory"])
+        self.sync_inference()
+
+    def sync_inference(self):
+        if self.inference is not None:
+            self.inference.update(self.q_network.state_dict(), owner=self)
\ No newline at end of file
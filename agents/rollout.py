@@ -0,0 +1,190 @@
+import multiprocessing as mp
+import queue
+import random
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+
+from environments.one_d_cleanup_env import OneDCleanupEnv
+from agents.oned_u_coord import OneDUCoordinator
+
+# columns of a trajectory row: coordinator state (4), reward (1), next coordinator state (4)
+TRANSITION_WIDTH = 9
+
+
+def heuristic_roles(state, num_agents):
+    """
+    Returns (num_cleaners, num_pickers), assigning agents to dirt in proportion to the dirt share of apples + dirt.
+    """
+    num_apples, num_dirt, _, _ = state
+    num_cleaners = round(num_agents * num_dirt / (num_apples + num_dirt))
+    return num_cleaners, num_agents - num_cleaners
+
+
+def rollout_worker(worker_id, env_kwargs, u_layers, steps_per_episode, buffer_name, commands, results, seed):
+    """
+    Worker process loop. Waits for a command, runs one episode and writes its transitions into the shared trajectory buffer.
+    A command is a tuple (state_dict, epsilon); state_dict may be None to keep the current weights, and a None command
+    stops the worker. An exception is reported as (worker_id, None, traceback) before the worker exits. seed is the worker's own seed; forked workers inherit the parent's random state, so every worker
+    must reseed.
+    """
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    buffer = SharedMemory(name=buffer_name)
+    trajectory = np.ndarray((steps_per_episode, TRANSITION_WIDTH), dtype=np.float32, buffer=buffer.buf)
+
+    env = OneDCleanupEnv(**env_kwargs)
+    # seeds the environment's generator, which later resets keep drawing from
+    env.reset(seed=seed)
+    coordinator = None
+    if u_layers is not None:
+        coordinator = OneDUCoordinator(torch.device("cpu"), env, env.num_agents, 2, u_layers)
+
+    try:
+        while True:
+            command = commands.get()
+            if command is None:
+                break
+            state_dict, epsilon = command
+            if coordinator is not None:
+                if state_dict is not None:
+                    coordinator.u_network.load_state_dict(state_dict)
+                coordinator.epsilon = epsilon
+
+            states, info = env.reset()
+            state = states["coordinator"]
+            num_steps = 0
+            for step in range(steps_per_episode):
+                if coordinator is not None:
+                    num_cleaners, num_pickers = coordinator.generate_roles()
+                else:
+                    num_cleaners, num_pickers = heuristic_roles(state, env.num_agents)
+                actions = env.get_greedy_action_arrays(env.get_greedy_roles(num_pickers, num_cleaners))
+                next_states, rewards, dones, _, info = env.step(actions)
+                next_state = next_states["coordinator"]
+
+                trajectory[step, :4] = state
+                trajectory[step, 4] = sum(rewards.values())
+                trajectory[step, 5:] = next_state
+                num_steps += 1
+
+                state = next_state
+                if dones["__all__"]:
+                    break
+
+            results.put((worker_id, num_steps, info["total_apple_consumed"]))
+    except Exception:
+        results.put((worker_id, None, traceback.format_exc()))
+    finally:
+        del trajectory
+        buffer.close()
+
+
+class RolloutWorkers:
+    """
+    Pool of worker processes, each running OneDCleanupEnv episodes with either the OneDUCoordinator policy or the
+    dirt-ratio heuristic.
+    Every worker owns a shared-memory trajectory buffer of shape (steps_per_episode, 9) holding (state, reward, next_state)
+    rows, so finished episodes reach the learner without pickling. The learner pushes new U-network weights with broadcast;
+    workers pick them up at the start of their next episode.
+    Worker seeds are spawned from np.random.SeedSequence(seed), so workers never share a random state (seed=None draws
+    fresh OS entropy).
+    Workers are forked where possible, so create the pool before starting any thread (checkpoint or metrics writers, an
+    inference server): a forked child only gets the calling thread, and a lock another thread held stays locked in it.
+    episodes raises if a worker fails or dies, checking every poll_interval seconds.
+    """
+
+    def __init__(self, num_workers, env_kwargs, u_layers=None, steps_per_episode=1000, seed=None, poll_interval=1.0):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.steps_per_episode = steps_per_episode
+        self.state_dict = None
+        self.epsilon = 0.0
+        self.pending = set()
+
+        # forked workers do not re-import the launching script, so the flat training scripts need no __main__ guard
+        ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+        self.results = ctx.Queue()
+        worker_seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(num_workers)]
+        self.commands = []
+        self.buffers = []
+        self.trajectories = []
+        self.processes = []
+        for worker_id in range(num_workers):
+            buffer = SharedMemory(create=True, size=steps_per_episode * TRANSITION_WIDTH * np.dtype(np.float32).itemsize)
+            commands = ctx.Queue()
+            process = ctx.Process(target=rollout_worker, args=(worker_id, env_kwargs, u_layers, steps_per_episode, buffer.name, commands, self.results, worker_seeds[worker_id]), daemon=True)
+            process.start()
+            self.buffers.append(buffer)
+            self.trajectories.append(np.ndarray((steps_per_episode, TRANSITION_WIDTH), dtype=np.float32, buffer=buffer.buf))
+            self.commands.append(commands)
+            self.processes.append(process)
+
+    def broadcast(self, state_dict, epsilon=0.0):
+        """
+        Set the U-network weights and exploration rate used by every worker from its next episode on.
+        """
+        self.state_dict = {name: tensor.detach().cpu().clone() for name, tensor in state_dict.items()}
+        self.epsilon = epsilon
+        self.pending = set(range(self.num_workers))
+
+    def dispatch(self, worker_id):
+        state_dict = None
+        if worker_id in self.pending:
+            state_dict = self.state_dict
+            self.pending.discard(worker_id)
+        self.commands[worker_id].put((state_dict, self.epsilon))
+
+    def episodes(self, num_episodes):
+        """
+        Run num_episodes episodes across the workers, yielding (states, rewards, next_states, ending_reward) for each
+        as soon as it finishes. A worker's next episode is dispatched once the consumer asks for the following one, so
+        weights broadcast while handling an episode are used from that worker's next episode on; the other workers keep
+        running meanwhile.
+        """
+        in_flight = 0
+        for worker_id in range(min(self.num_workers, num_episodes)):
+            self.dispatch(worker_id)
+            in_flight += 1
+        dispatched = in_flight
+
+        while in_flight > 0:
+            worker_id, num_steps, ending_reward = self.next_result()
+            trajectory = self.trajectories[worker_id][:num_steps].copy()
+            in_flight -= 1
+            yield trajectory[:, :4], trajectory[:, 4], trajectory[:, 5:], ending_reward
+            if dispatched < num_episodes:
+                self.dispatch(worker_id)
+                dispatched += 1
+                in_flight += 1
+
+    def next_result(self):
+        """
+        Wait for the next finished episode, raising if a worker reported an exception or died without reporting.
+        """
+        while True:
+            try:
+                worker_id, num_steps, ending_reward = self.results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                for worker_id, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        raise RuntimeError(f"rollout worker {worker_id} died with exit code {process.exitcode}")
+                continue
+            if num_steps is None:
+                raise RuntimeError(f"rollout worker {worker_id} failed:\n{ending_reward}")
+            return worker_id, num_steps, ending_reward
+
+    def close(self):
+        for commands in self.commands:
+            commands.put(None)
+        for process in self.processes:
+            process.join()
+        self.trajectories = []
+        for buffer in self.buffers:
+            buffer.close()
+            buffer.unlink()
@@ -1,16 +1,182 @@
-from collections import deque
-import random
+import numpy as np
+import torch
 
 class ReplayBuffer:
-    def __init__(self, buffer_size):
+    """
+    Fixed-size ring buffer of experience tuples.
+    Each field of the experience is stored in its own preallocated column of shape (buffer_size, *field_shape), allocated
+    from the first experience added, so sampling is a single fancy-index per column.
+    Each column keeps the dtype of its field in the first experience (so integer actions stay integers), except that
+    floating fields are stored as dtype; dtypes, one per field, overrides that.
+    seed (an int, a np.random.Generator or None for fresh entropy) drives the sampling; the buffer owns its generator and
+    never draws from the global np.random state.
+    """
+
+    def __init__(self, buffer_size, dtype=np.float32, dtypes=None, seed=None):
         self.buffer_size = buffer_size
-        self.memory = deque(maxlen=buffer_size)
+        self.dtype = dtype
+        self.dtypes = dtypes
+        self.columns = None
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def column_dtype(self, field):
+        dtype = np.asarray(field).dtype
+        return self.dtype if np.issubdtype(dtype, np.floating) else dtype
 
     def add(self, experience):
-        self.memory.append(experience)
+        if self.columns is None:
+            dtypes = [self.column_dtype(field) for field in experience] if self.dtypes is None else self.dtypes
+            self.columns = [np.zeros((self.buffer_size, *np.shape(field)), dtype=dtype) for field, dtype in zip(experience, dtypes)]
+        for column, field in zip(self.columns, experience):
+            column[self.position] = field
+        self.position = (self.position + 1) % self.buffer_size
+        self.size = min(self.size + 1, self.buffer_size)
+
+    def sample_indices(self, batch_size):
+        return self.rng.choice(self.size, batch_size, replace=False)
 
     def sample(self, batch_size):
-        return random.sample(self.memory, batch_size)
-    
+        """
+        Sample batch_size distinct experiences.
+        Returns a list of experience tuples, as added (with each field read back from its column).
+        """
+        return list(zip(*self.sample_columns(batch_size)))
+
+    def sample_columns(self, batch_size):
+        """
+        Same as sample, but returns a tuple with one (batch_size, *field_shape) array per experience field.
+        """
+        return self.gather(self.sample_indices(batch_size))
+
+    def sample_tensors(self, batch_size, device):
+        """
+        Same as sample_columns, but returns the fields as tensors on the given device.
+        """
+        return self.gather_tensors(self.sample_indices(batch_size), device)
+
+    def gather(self, indices):
+        """
+        Returns a tuple with one (len(indices), *field_shape) array per experience field.
+        """
+        return tuple(column[indices] for column in self.columns)
+
+    def gather_tensors(self, indices, device):
+        return tuple(torch.from_numpy(field).to(device) for field in self.gather(indices))
+
+    def importance_weights(self, indices):
+        """
+        Importance-sampling weights of the given sampled experiences; uniform sampling needs no correction.
+        """
+        return np.ones(len(indices), dtype=np.float32)
+
+    def update_priorities(self, indices, td_errors):
+        pass
+
+    def state_dict(self):
+        """
+        Contents and sampling state of the buffer. The arrays are the live ones, as with torch's state_dict.
+        """
+        return {"columns": self.columns, "position": self.position, "size": self.size, "rng": self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        self.columns = None if state["columns"] is None else [np.array(column) for column in state["columns"]]
+        self.position = state["position"]
+        self.size = state["size"]
+        self.rng.bit_generator.state = state["rng"]
+
     def __len__(self):
-        return len(self.memory)
\ No newline at end of file
+        return self.size
+
+
+class SumTree:
+    """
+    Binary tree whose leaves hold non-negative priorities and whose inner nodes hold the sum of their children.
+    Supports O(log n) priority updates and O(log n) sampling proportional to priority, both vectorised over a batch.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.tree = np.zeros(2 * self.capacity)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.capacity]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.capacity
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Returns the leaf index of each value, i.e. the first leaf whose prefix sum of priorities exceeds the value.
+        A value past the total (through float rounding) falls back to the last leaf with non-zero priority.
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:
+            left = 2 * nodes
+            # never descend into an all-zero subtree, so a non-empty tree always returns a non-zero leaf
+            go_right = (values >= self.tree[left]) & (self.tree[left + 1] > 0)
+            values -= np.where(go_right, self.tree[left], 0)
+            nodes = left + go_right
+        return nodes - self.capacity
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer sampling experiences proportionally to priority ** alpha (prioritized experience replay).
+    New experiences get the largest priority seen so far; update_priorities sets priorities from TD errors and
+    importance_weights corrects for the non-uniform sampling, with beta annealed towards 1 on every call.
+    """
+
+    def __init__(self, buffer_size, alpha=0.6, beta=0.4, beta_increment=1e-4, epsilon=1e-5, dtype=np.float32, dtypes=None, seed=None):
+        super().__init__(buffer_size, dtype, dtypes, seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.tree = SumTree(buffer_size)
+        self.max_priority = 1.0
+
+    def add(self, experience):
+        self.tree.update([self.position], [self.max_priority ** self.alpha])
+        super().add(experience)
+
+    def sample_indices(self, batch_size):
+        # stratified sampling: one draw from each of batch_size equal slices of the total priority
+        segment = self.tree.total() / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        indices = self.tree.find(values)
+        assert np.all(self.tree.get(indices) > 0), "sampled an experience with zero priority"
+        return indices
+
+    def importance_weights(self, indices):
+        probabilities = self.tree.get(indices) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities ** self.alpha)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update(tree=self.tree.tree, beta=self.beta, max_priority=self.max_priority)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.tree = np.array(state["tree"], dtype=np.float64)
+        self.beta = state["beta"]
+        self.max_priority = state["max_priority"]
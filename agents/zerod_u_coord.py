@@ -3,11 +3,11 @@ import random
 from environments.zero_d_cleanup_env import ZeroDCleanupEnv
 from models import UNetwork
 import torch
-from agents.util import ReplayBuffer
+from agents.util import ReplayBuffer, PrioritizedReplayBuffer
 import numpy as np
 
 class ZeroDUCoordinator:
-    def __init__(self, device, num_action_outputs, action_size, u_layers: list[tuple[int, int]], buffer_size=10000, batch_size=64, lr=0.001, gamma=0.9999, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.05):
+    def __init__(self, device, num_action_outputs, action_size, u_layers: list[tuple[int, int]], buffer_size=10000, batch_size=64, lr=0.001, gamma=0.9999, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.05, prioritized_replay=False, value_table=None, inference=None, inference_sync_every=10, seed=None):
         self.num_action_outputs = num_action_outputs
         self.action_size = action_size
         self.batch_size = batch_size
@@ -23,7 +23,20 @@ class ZeroDUCoordinator:
         self.u_optimizer = torch.optim.Adam(self.u_network.parameters(), lr=lr)
         self.scheduler = torch.optim.lr_scheduler.StepLR(self.u_optimizer, step_size=100, gamma=0.6)
 
-        self.memory = ReplayBuffer(buffer_size)
+        # the state counts are network inputs, so every column is float; seed drives the buffer's own sampling generator
+        memory_dtypes = (np.float32,) * 3
+        self.memory = PrioritizedReplayBuffer(buffer_size, dtypes=memory_dtypes, seed=seed) if prioritized_replay else ReplayBuffer(buffer_size, dtypes=memory_dtypes, seed=seed)
+        # optional solved ZeroDValueIteration; when set, act looks values up in its table instead of the U-network, so it
+        # must discount like this coordinator
+        if value_table is not None and value_table.gamma != gamma:
+            raise ValueError(f"value table was solved with gamma={value_table.gamma}, the coordinator uses gamma={gamma}")
+        self.value_table = value_table
+        # optional models.InferenceServer owned by this coordinator, batching the U-network forward of act; every
+        # inference_sync_every optimizer steps push the new weights to it
+        self.inference = inference
+        self.inference_sync_every = inference_sync_every
+        self.train_steps = 0
+        self.sync_inference()
     
     def value(self, state):
         state = torch.from_numpy(state).float().unsqueeze(0).to(self.device)
@@ -45,7 +58,12 @@ class ZeroDUCoordinator:
             future_state = torch.tensor(future_state).float().unsqueeze(0).to(self.device)
             all_next_states.append(future_state)
         all_next_states = torch.stack(all_next_states).float().to(self.device)
-        all_pred_rewards = self.u_network(all_next_states).flatten()
+        if self.value_table is not None:
+            all_pred_rewards = torch.from_numpy(self.value_table.value(all_next_states.cpu().numpy())).float().to(self.device).flatten()
+        elif self.inference is not None:
+            all_pred_rewards = self.inference(all_next_states.cpu()).flatten().to(self.device)
+        else:
+            all_pred_rewards = self.u_network(all_next_states).flatten()
         all_imm_rewards = torch.tensor(all_imm_rewards).float().to(self.device)
         all_future_rewards = all_imm_rewards + self.gamma * all_pred_rewards
         max_reward_dirt_agents = round(torch.argmax(all_future_rewards).item().real)
@@ -59,21 +77,48 @@ class ZeroDUCoordinator:
         self.memory.add((state, reward, next_state))
         self.epsilon *= self.epsilon_decay
         if len(self.memory) > self.batch_size:
-            experiences = self.memory.sample(self.batch_size)
-            self.train(experiences)
+            indices = self.memory.sample_indices(self.batch_size)
+            self.train(self.memory.gather_tensors(indices, self.device), indices)
 
-    def train(self, experiences):
-        states, rewards, next_states = zip(*experiences)
-
-        states = torch.from_numpy(np.stack(states)).float().to(self.device)
-        rewards = torch.from_numpy(np.vstack(rewards)).float().to(self.device)
-        next_states = torch.from_numpy(np.stack(next_states)).float().to(self.device)
+    def train(self, experiences, indices=None):
+        states, rewards, next_states = experiences
+        rewards = rewards.view(len(rewards), -1)
 
         current_values = self.u_network(states)
         next_values = self.u_network(next_states)
         expected_values = rewards + self.gamma * next_values
 
-        loss = torch.nn.functional.mse_loss(current_values, expected_values)
+        if indices is None:
+            loss = torch.nn.functional.mse_loss(current_values, expected_values)
+        else:
+            td_errors = expected_values - current_values
+            weights = torch.from_numpy(self.memory.importance_weights(indices)).to(self.device).view(-1, 1)
+            loss = (weights * td_errors ** 2).mean()
+            self.memory.update_priorities(indices, td_errors.detach().abs().cpu().numpy().flatten())
         self.u_optimizer.zero_grad()
         loss.backward()
-        self.u_optimizer.step()
\ No newline at end of file
+        self.u_optimizer.step()
+        self.train_steps += 1
+        if self.train_steps % self.inference_sync_every == 0:
+            self.sync_inference()
+
+    def state_dict(self):
+        return {
+            "u_network": self.u_network.state_dict(),
+            "u_optimizer": self.u_optimizer.state_dict(),
+            "scheduler": self.scheduler.state_dict(),
+            "epsilon": self.epsilon,
+            "memory": self.memory.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.u_network.load_state_dict(state["u_network"])
+        self.u_optimizer.load_state_dict(state["u_optimizer"])
+        self.scheduler.load_state_dict(state["scheduler"])
+        self.epsilon = state["epsilon"]
+        self.memory.load_state_dict(state["memory"])
+        self.sync_inference()
+
+    def sync_inference(self):
+        if self.inference is not None:
+            self.inference.update(self.u_network.state_dict(), owner=self)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import numpy as np
+from scipy import sparse
+
+from environments.zero_d_cleanup_env import ZeroDCleanupEnv, log_comb
+
+
+class ZeroDValueIteration:
+    """
+    Exact value iteration for ZeroDCleanupEnv over the integer grid of (apples, dirt) in [0, area]^2.
+    The model is the one transition_P describes: pickers consume a hypergeometric number of apples and cleaners a
+    hypergeometric number of dirt cells, independently, after which the environment's expected spawning is applied and the
+    resulting point is spread bilinearly over the grid. Because the two consumptions are independent, transition_P
+    factorises into one sparse (area + 1, area + 1) matrix per side and action, and a Bellman backup for every action is
+    A_p @ W @ D_c^T rather than a product with a (area + 1)^2 square transition matrix.
+    The pickers/cleaners part of the state does not influence the future, so value(state) only reads apples and dirt and
+    can stand in for the U-network in ZeroDUCoordinator, which requires gamma to be the coordinator's own (0.9999 by
+    default; backups then contract slowly and solve may need a looser tol or more max_iterations).
+    """
+
+    def __init__(self, env: ZeroDCleanupEnv, gamma):
+        self.area = env.area
+        self.num_agents = env.num_agents
+        self.gamma = gamma
+        self.thresholdDepletion = env.thresholdDepletion
+        self.thresholdRestoration = env.thresholdRestoration
+        self.apple_spawn_prob = env.starting_apple_spawn_prob
+        self.waste_spawn_prob = env.starting_waste_spawn_prob
+
+        self.grid = np.arange(self.area + 1, dtype=np.float64)
+        self.consumption = [self.consumption_matrix(n) for n in range(self.num_agents + 1)]
+        # immediate reward of every action, (N + 1, area + 1, 1): column i of the action axis has i cleaners
+        pickers = self.num_agents - np.arange(self.num_agents + 1)
+        self.rewards = (self.grid[None, :] * pickers[:, None] / self.area)[:, :, None]
+
+        # where each post-consumption grid point lands once apples and waste have spawned
+        apples, dirt = np.meshgrid(self.grid, self.grid, indexing="ij")
+        spawned_apples, spawned_dirt = self.spawn(apples, dirt)
+        self.spawn_weights = self.bilinear_weights(spawned_apples, spawned_dirt)
+
+        self.values = np.zeros((self.area + 1, self.area + 1))
+        self.policy = np.zeros((self.area + 1, self.area + 1), dtype=np.int64)
+        self.iterations = 0
+
+    def consumption_matrix(self, n):
+        """
+        Sparse matrix M with M[x, x - k] = P(k of x occupied cells are hit by n agents placed on distinct cells of area),
+        the hypergeometric factor of transition_P.
+        """
+        x = self.grid[:, None]
+        k = np.arange(n + 1, dtype=np.float64)[None, :]
+        log_p = log_comb(x, k, self.area) + log_comb(self.area - x, n - k, self.area) - log_comb(self.area, n, self.area)
+        probabilities = np.exp(log_p)
+        rows, ks = np.nonzero(probabilities)
+        return sparse.csr_matrix((probabilities[rows, ks], (rows, rows - ks)), shape=(self.area + 1, self.area + 1))
+
+    def spawn(self, apples, dirt):
+        """
+        ZeroDCleanupEnv.compute_probabilities followed by spawn_apples_and_waste, on arrays of post-consumption counts.
+        """
+        waste_density = dirt / self.area
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = (1 - (waste_density - self.thresholdRestoration) / (self.thresholdDepletion - self.thresholdRestoration)) * self.apple_spawn_prob
+        apple_prob = np.where(waste_density <= self.thresholdRestoration, self.apple_spawn_prob, scaled)
+        depleted = waste_density >= self.thresholdDepletion
+        apple_prob = np.where(depleted, 0.0, apple_prob)
+        waste_prob = np.where(depleted, 0.0, self.waste_spawn_prob)
+        return apples + (self.area - np.trunc(apples)) * apple_prob, dirt + waste_prob
+
+    def bilinear_weights(self, apples, dirt):
+        """
+        Returns (a0, d0, wa, wd): the lower grid corner of each point and its fractional offset, clipped to the grid.
+        """
+        apples = np.clip(apples, 0, self.area)
+        dirt = np.clip(dirt, 0, self.area)
+        a0 = np.minimum(np.floor(apples).astype(np.int64), self.area - 1)
+        d0 = np.minimum(np.floor(dirt).astype(np.int64), self.area - 1)
+        return a0, d0, apples - a0, dirt - d0
+
+    def interpolate(self, table, weights):
+        a0, d0, wa, wd = weights
+        return ((1 - wa) * (1 - wd) * table[a0, d0] + wa * (1 - wd) * table[a0 + 1, d0]
+                + (1 - wa) * wd * table[a0, d0 + 1] + wa * wd * table[a0 + 1, d0 + 1])
+
+    def q_values(self, values=None):
+        """
+        One Bellman backup. Returns the (N + 1, area + 1, area + 1) action values, action i having i cleaners.
+        """
+        values = self.values if values is None else values
+        next_values = self.interpolate(values, self.spawn_weights)
+        q = np.empty((self.num_agents + 1, self.area + 1, self.area + 1))
+        for num_cleaners in range(self.num_agents + 1):
+            apple_side = self.consumption[self.num_agents - num_cleaners] @ next_values
+            q[num_cleaners] = (self.consumption[num_cleaners] @ apple_side.T).T
+        return self.rewards + self.gamma * q
+
+    def solve(self, tol=1e-6, max_iterations=100000):
+        """
+        Iterate Bellman backups until the largest value change is below tol. Returns the value table.
+        """
+        for iteration in range(max_iterations):
+            q = self.q_values()
+            values = q.max(axis=0)
+            delta = np.abs(values - self.values).max()
+            self.values = values
+            self.iterations += 1
+            if delta < tol:
+                break
+        self.policy = self.q_values().argmax(axis=0)
+        return self.values
+
+    def value(self, state):
+        """
+        Optimal value of one state or an array of states with apples and dirt in the first two columns, interpolated
+        between grid points. Shaped like the U-network output: (..., 1).
+        """
+        state = np.asarray(state, dtype=np.float64)
+        weights = self.bilinear_weights(state[..., 0], state[..., 1])
+        return self.interpolate(self.values, weights)[..., None]
+
+    def num_cleaners(self, state):
+        """
+        Greedy number of cleaners at the grid point nearest to the state.
+        """
+        apples = int(np.clip(np.rint(state[0]), 0, self.area))
+        dirt = int(np.clip(np.rint(state[1]), 0, self.area))
+        return int(self.policy[apples, dirt])
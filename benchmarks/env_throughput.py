@@ -0,0 +1,286 @@
+"""
+Step-throughput benchmarks for the 0-D, 1-D and 2-D Cleanup environments.
+
+    python -m benchmarks.env_throughput --output results.json
+    python -m benchmarks.env_throughput --baseline results.json --tolerance 0.1 --repeats 5
+
+Every case runs repeats times, each in a fresh process, and keeps the run with the lowest median latency (min-of-k), so
+one noisy run does not count as a slowdown. Memory is the tracemalloc peak while building the environment and running
+the warmup steps, after the environment modules are imported, so it is the environment's own footprint rather than the
+interpreter's and the libraries'. Results are written as JSON; with --baseline the run is compared case by case against
+a saved result file on that min-of-k median latency, and the exit code is 1 if any case slowed down by more than
+tolerance.
+"""
+import argparse
+import importlib
+import json
+import multiprocessing as mp
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def zero_d_env(num_agents, area):
+    from environments.zero_d_cleanup_env import ZeroDCleanupEnv
+    return ZeroDCleanupEnv([str(i) for i in range(num_agents)], num_agents=num_agents, area=area)
+
+
+def one_d_env(num_agents, area):
+    from environments.one_d_cleanup_env import OneDCleanupEnv
+    # agent ids start at 1: the agent maps use 0 for an empty cell
+    return OneDCleanupEnv([str(i + 1) for i in range(num_agents)], num_agents=num_agents, area=area)
+
+
+def two_d_env(num_agents, height, width):
+    from environments.cleanup_env import CleanupEnv
+    return CleanupEnv(num_agents=num_agents, height=height, width=width, greedy=True)
+
+
+def one_d_greedy_actions(env):
+    num_cleaners = env.num_agents // 2
+    return env.get_greedy_actions(env.get_greedy_assignments(env.num_agents - num_cleaners, num_cleaners))
+
+
+def zero_d_step(params):
+    env = zero_d_env(params["num_agents"], params["area"])
+    env.reset(seed=0)
+    ids = sorted(env.get_agent_ids())
+    rng = np.random.default_rng(0)
+
+    def prepare():
+        return dict(zip(ids, rng.integers(0, 2, len(ids)).tolist()))
+
+    def run(actions):
+        if env.step(actions)[2]["__all__"]:
+            env.reset()
+    return prepare, run
+
+
+def one_d_step(params):
+    env = one_d_env(params["num_agents"], params["area"])
+    env.reset(seed=0)
+
+    def run(actions):
+        if env.step(actions)[2]["__all__"]:
+            env.reset()
+    return lambda: one_d_greedy_actions(env), run
+
+
+def one_d_simulate_step(params):
+    env = one_d_env(params["num_agents"], params["area"])
+    env.reset(seed=0)
+
+    def prepare():
+        actions = one_d_greedy_actions(env)
+        env.step(actions)
+        return one_d_greedy_actions(env)
+    return prepare, env.simulate_step
+
+
+def one_d_get_greedy_assignments(params):
+    env = one_d_env(params["num_agents"], params["area"])
+    env.reset(seed=0)
+    num_cleaners = params["num_agents"] // 2
+
+    def prepare():
+        env.step(one_d_greedy_actions(env))
+        return num_cleaners
+    return prepare, lambda num_cleaners: env.get_greedy_assignments(env.num_agents - num_cleaners, num_cleaners)
+
+
+def one_d_greedy_policy(params):
+    env = one_d_env(params["num_agents"], params["area"])
+    env.reset(seed=0)
+    num_cleaners = params["num_agents"] // 2
+
+    def prepare():
+        env.step(one_d_greedy_actions(env))
+        return num_cleaners
+    return prepare, lambda num_cleaners: env.get_greedy_action_arrays(env.get_greedy_roles(env.num_agents - num_cleaners, num_cleaners))
+
+
+def two_d_step(params):
+    random.seed(0)
+    env = two_d_env(params["num_agents"], params["height"], params["width"])
+    env.reset(seed=0)
+
+    def run(actions):
+        if env.step(actions)[2]["__all__"]:
+            env.reset()
+    return env.greedily_move_to_closest_object, run
+
+
+def two_d_greedily_move_to_closest_object(params):
+    random.seed(0)
+    env = two_d_env(params["num_agents"], params["height"], params["width"])
+    env.reset(seed=0)
+
+    def prepare():
+        env.step(env.greedily_move_to_closest_object())
+    return prepare, lambda _: env.greedily_move_to_closest_object()
+
+
+# imported before memory tracing starts, so the import cost is not counted against a case
+ENV_MODULES = ["environments.zero_d_cleanup_env", "environments.one_d_cleanup_env", "environments.cleanup_env"]
+
+# case name -> function building (prepare, run) from the case parameters; only run(prepare()) is timed
+CASES = {
+    "zero_d.step": zero_d_step,
+    "one_d.step": one_d_step,
+    "one_d.simulate_step": one_d_simulate_step,
+    "one_d.get_greedy_assignments": one_d_get_greedy_assignments,
+    "one_d.greedy_policy": one_d_greedy_policy,
+    "two_d.step": two_d_step,
+    "two_d.greedily_move_to_closest_object": two_d_greedily_move_to_closest_object,
+}
+
+
+def sweep(agent_counts, areas, grids):
+    """
+    Yields (case, params) for every case and size, skipping sizes with more agents than cells.
+    """
+    for num_agents in agent_counts:
+        for area in areas:
+            yield "zero_d.step", {"num_agents": num_agents, "area": area}
+            if num_agents <= area:
+                for case in ("one_d.step", "one_d.simulate_step", "one_d.get_greedy_assignments", "one_d.greedy_policy"):
+                    yield case, {"num_agents": num_agents, "area": area}
+        for height, width in grids:
+            if num_agents <= height * width // 2:
+                for case in ("two_d.step", "two_d.greedily_move_to_closest_object"):
+                    yield case, {"num_agents": num_agents, "height": height, "width": width}
+
+
+def run_case(case, params, steps, warmup):
+    """
+    Times steps calls of the case after warmup untimed ones. Runs in the benchmark's worker process.
+    """
+    for module in ENV_MODULES:
+        importlib.import_module(module)
+    tracemalloc.start()
+    prepare, run = CASES[case](params)
+    for _ in range(warmup):
+        run(prepare())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies = np.empty(steps)
+    for i in range(steps):
+        argument = prepare()
+        start = time.perf_counter()
+        run(argument)
+        latencies[i] = time.perf_counter() - start
+    return {
+        "case": case,
+        "params": params,
+        "steps": steps,
+        "steps_per_sec": steps / latencies.sum(),
+        "latency_us": {
+            "mean": latencies.mean() * 1e6,
+            "p50": np.percentile(latencies, 50) * 1e6,
+            "p90": np.percentile(latencies, 90) * 1e6,
+            "p99": np.percentile(latencies, 99) * 1e6,
+        },
+        "env_peak_mb": peak / 2 ** 20,
+    }
+
+
+def run_repeated(ctx, case, params, steps, warmup, repeats):
+    """
+    Runs the case repeats times, each in a fresh process, and returns the result with the lowest median latency, with
+    every run's median under latency_us.p50_runs.
+    """
+    runs = []
+    for _ in range(repeats):
+        with ctx.Pool(1) as pool:
+            runs.append(pool.apply(run_case, (case, params, steps, warmup)))
+    result = min(runs, key=lambda run: run["latency_us"]["p50"])
+    result["repeats"] = repeats
+    result["latency_us"]["p50_runs"] = [run["latency_us"]["p50"] for run in runs]
+    return result
+
+
+def case_key(result):
+    return result["case"], tuple(sorted(result["params"].items()))
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints each case's (min-of-k) median latency against the baseline. Returns the cases whose median grew by more than
+    tolerance.
+    """
+    previous = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            print(f"{result['case']:40s} {str(result['params']):55s} {result['latency_us']['p50']:10.1f}us  (new)")
+            continue
+        ratio = result["latency_us"]["p50"] / before["latency_us"]["p50"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        print(f"{result['case']:40s} {str(result['params']):55s} p50 {before['latency_us']['p50']:10.1f}us -> {result['latency_us']['p50']:10.1f}us  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cleanup environment step-throughput benchmarks")
+    parser.add_argument("--agents", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--areas", type=int, nargs="+", default=[150, 1500])
+    parser.add_argument("--grids", type=str, nargs="+", default=["25x18", "100x72"], help="2-D grid sizes as HEIGHTxWIDTH")
+    parser.add_argument("--cases", type=str, nargs="+", default=None, help="only run these cases")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3, help="runs per case; the one with the lowest median latency is kept")
+    parser.add_argument("--output", type=str, default=None, help="write results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None, help="compare against this JSON result file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative growth of the median latency before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    grids = [tuple(int(x) for x in grid.split("x")) for grid in args.grids]
+    cases = [(case, params) for case, params in sweep(args.agents, args.areas, grids) if args.cases is None or case in args.cases]
+
+    results = []
+    ctx = mp.get_context("spawn")
+    for case, params in cases:
+        result = run_repeated(ctx, case, params, args.steps, args.warmup, args.repeats)
+        results.append(result)
+        if args.baseline is None:
+            latency = result["latency_us"]
+            print(f"{case:40s} {str(params):55s} {result['steps_per_sec']:12.1f} steps/s  p50 {latency['p50']:10.1f}us  p99 {latency['p99']:10.1f}us  {result['env_peak_mb']:8.2f} MB")
+
+    report = {"meta": metadata(), "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
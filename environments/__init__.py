@@ -1,3 +1,7 @@
 from .cleanup_env import *
 from .zero_d_cleanup_env import *
-from .one_d_cleanup_env import *
\ No newline at end of file
+from .one_d_cleanup_env import *
+from .batched_one_d_cleanup_env import *
+from .batched_zero_d_cleanup_env import *
+from .profiling import *
+from .vector_env import *
\ No newline at end of file
@@ -0,0 +1,327 @@
+import numpy as np
+
+# CleanupRegion values, as stored in region arrays
+APPLE = 1
+WASTE = -1
+
+
+def batched_perform_moves(apple_map, waste_map, apple_agent_map, waste_agent_map, pos, region, agent_ids, action_regions, directions):
+    """
+    Apply one step of agent actions to B independent 1-D cleanup states at once.
+    All maps are (B, area) arrays, pos/region/action_regions/directions are (B, N) arrays and agent_ids is a (N,) array of
+    the integer ids written into the agent maps. Agents are processed one at a time in column order (the same order as the
+    action dict in OneDCleanupEnv.perform_step), so collisions resolve exactly as in switch_region / move_agent.
+    The arrays are updated in place.
+    Returns a tuple (apples_consumed, dirt_consumed, num_pickers, num_cleaners) with shapes (B, N), (B, N), (B,), (B,).
+    """
+    batch_size, num_agents = pos.shape
+    area = apple_map.shape[1]
+    rows = np.arange(batch_size)
+
+    apples_consumed = np.zeros((batch_size, num_agents), dtype=np.int64)
+    dirt_consumed = np.zeros((batch_size, num_agents), dtype=np.int64)
+    num_pickers = np.zeros(batch_size, dtype=np.int64)
+    num_cleaners = np.zeros(batch_size, dtype=np.int64)
+
+    for j in range(num_agents):
+        agent_id = agent_ids[j]
+        p = pos[:, j]
+        current = region[:, j]
+        target = action_regions[:, j]
+        switching = target != current
+
+        # switch_region
+        to_apple = switching & (target == APPLE)
+        to_apple &= apple_agent_map[rows, p] == 0
+        r, q = rows[to_apple], p[to_apple]
+        apple_agent_map[r, q] = agent_id
+        waste_agent_map[r, q] = 0
+        region[to_apple, j] = APPLE
+        eaten = to_apple & apple_map[rows, p]
+        apple_map[rows[eaten], p[eaten]] = False
+        apples_consumed[eaten, j] = 1
+
+        to_waste = switching & (target == WASTE)
+        to_waste &= waste_agent_map[rows, p] == 0
+        r, q = rows[to_waste], p[to_waste]
+        apple_agent_map[r, q] = 0
+        waste_agent_map[r, q] = agent_id
+        region[to_waste, j] = WASTE
+        cleaned = to_waste & waste_map[rows, p]
+        waste_map[rows[cleaned], p[cleaned]] = False
+        dirt_consumed[cleaned, j] = 1
+
+        num_pickers += switching & (region[:, j] == APPLE)
+        num_cleaners += switching & (region[:, j] == WASTE)
+
+        # move_agent
+        new_pos = p + directions[:, j]
+        in_bounds = (new_pos >= 0) & (new_pos < area)
+        clipped = np.clip(new_pos, 0, area - 1)
+        for value, obj_map, agent_map, consumed in ((APPLE, apple_map, apple_agent_map, apples_consumed), (WASTE, waste_map, waste_agent_map, dirt_consumed)):
+            moving = ~switching & (current == value)
+            if value == APPLE:
+                num_pickers += moving
+            else:
+                num_cleaners += moving
+            moving &= in_bounds
+            moving &= agent_map[rows, clipped] == 0
+            r, old, new = rows[moving], p[moving], new_pos[moving]
+            agent_map[r, new] = agent_id
+            agent_map[r, old] = 0
+            pos[moving, j] = new
+            hit = obj_map[r, new]
+            obj_map[r[hit], new[hit]] = False
+            consumed[r[hit], j] = 1
+
+    return apples_consumed, dirt_consumed, num_pickers, num_cleaners
+
+
+def batched_closest(occupancy, pos, inclusive=True):
+    """
+    Returns a tuple (u, d) of (B, N) arrays where u is the distance from each position to the closest occupied cell above it
+    and d is the distance to the closest occupied cell below it, or np.inf if there is none.
+    If inclusive is True the cell at the position itself counts as above (as in OneDCleanupEnv.closest_objective),
+    otherwise it is ignored (as in OneDCleanupEnv.closest_agents).
+    """
+    batch_size, area = occupancy.shape
+    cells = np.arange(area)
+    rows = np.arange(batch_size)[:, None]
+
+    last = np.maximum.accumulate(np.where(occupancy, cells, -1), axis=1)
+    # pad so that pos + 1 (and pos - 1 for the exclusive lookup) are always valid indices
+    last = np.concatenate([np.full((batch_size, 1), -1), last], axis=1)
+    above = last[rows, pos + 1] if inclusive else last[rows, pos]
+    u = np.where(above >= 0, pos - above, np.inf)
+
+    nxt = np.minimum.accumulate(np.where(occupancy, cells, area)[:, ::-1], axis=1)[:, ::-1]
+    nxt = np.concatenate([nxt, np.full((batch_size, 1), area)], axis=1)
+    below = nxt[rows, pos + 1]
+    d = np.where(below < area, below - pos, np.inf)
+    return u, d
+
+
+class BatchedOneDCleanupEnv:
+    """
+    Batch of B independent 1-dimensional Cleanup environments stepped together.
+    The game is identical to OneDCleanupEnv, but every map is a (B, area) array and actions, rewards and observations are
+    arrays with a leading batch dimension, so a single call advances all B episodes.
+    """
+
+    def __init__(self, agent_ids, batch_size=64, num_agents=10, area=150, thresholdDepletion: float=0.4, thresholdRestoration: float=0, wasteSpawnProbability: float=0.5, appleRespawnProbability: float=0.05, dirt_multiplier=10, use_randomness=True, seed=None):
+        """
+        Initialise the environment.
+        """
+        self.agent_id_list = list(agent_ids)
+        self.agent_ids = np.array([int(id) for id in self.agent_id_list], dtype=np.int32)
+        self.batch_size = batch_size
+        self.num_agents = num_agents
+        self.timestamp = 0
+
+        self.potential_apple_area = area
+        self.potential_waste_area = area
+
+        self.starting_apple_spawn_prob = appleRespawnProbability
+        self.starting_waste_spawn_prob = wasteSpawnProbability
+
+        self.thresholdDepletion = thresholdDepletion
+        self.thresholdRestoration = thresholdRestoration
+        self.dirt_multiplier = dirt_multiplier
+
+        self.use_randomness = use_randomness
+        self.rng = np.random.default_rng(seed)
+
+        self.allocate_state()
+
+    def allocate_state(self):
+        shape = (self.batch_size, self.potential_apple_area)
+        self.apple_map = np.zeros(shape, dtype=bool)
+        self.waste_map = np.zeros(shape, dtype=bool)
+        self.apple_agent_map = np.zeros(shape, dtype=np.int32)
+        self.waste_agent_map = np.zeros(shape, dtype=np.int32)
+        self.pos = np.zeros((self.batch_size, self.num_agents), dtype=np.int64)
+        self.region = np.full((self.batch_size, self.num_agents), WASTE, dtype=np.int8)
+
+        self.num_apples = np.zeros(self.batch_size, dtype=np.int64)
+        self.num_dirt = np.full(self.batch_size, 78, dtype=np.int64)
+        self.num_pickers = np.zeros(self.batch_size, dtype=np.int64)
+        self.num_cleaners = np.full(self.batch_size, self.num_agents, dtype=np.int64)
+
+        self.total_apple_consumed = np.zeros(self.batch_size, dtype=np.int64)
+        self.step_apple_consumed = np.zeros(self.batch_size, dtype=np.int64)
+
+    def reset(self, seed=None, options: dict = {}) -> tuple:
+        """
+        Reset all B environments. Agents are distributed uniformly across the dirt area, as in OneDCleanupEnv.reset.
+        """
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.timestamp = 0
+        self.allocate_state()
+
+        rows = np.arange(self.batch_size)[:, None]
+        if self.use_randomness:
+            # a random permutation per row, truncated, is a sample without replacement
+            keys = self.rng.random((self.batch_size, self.potential_waste_area))
+            dirt_init_locations = np.argsort(keys, axis=1)[:, :78]
+        else:
+            dirt_init_locations = np.broadcast_to(np.linspace(0, self.potential_waste_area - 1, 78, dtype=int), (self.batch_size, 78))
+        self.waste_map[rows, dirt_init_locations] = True
+
+        order = np.argsort(self.agent_id_list, kind="stable")
+        locs = np.array([int((i / self.num_agents) * self.potential_waste_area) for i in range(self.num_agents)])
+        self.pos[:, order] = locs
+        self.waste_agent_map[:, locs] = self.agent_ids[order]
+        self.num_dirt -= self.waste_map[:, locs].sum(axis=1)
+        self.waste_map[:, locs] = False
+
+        return self.observe(), self.info()
+
+    def step(self, actions: tuple[np.ndarray, np.ndarray]) -> tuple:
+        """
+        Take a step in all B environments.
+        actions is a tuple (regions, directions) of (B, N) arrays holding the CleanupRegion value and the direction of
+        each agent.
+        """
+        self.timestamp += 1
+
+        rewards = self.perform_step(actions)
+        self.step_apple_consumed = rewards.sum(axis=1)
+        self.total_apple_consumed += self.step_apple_consumed
+
+        dones = np.full(self.batch_size, self.timestamp == 1000)
+        return self.observe(), rewards, dones, np.zeros(self.batch_size, dtype=bool), self.info()
+
+    def perform_step(self, actions: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        action_regions, directions = actions
+        action_regions = np.broadcast_to(action_regions, self.pos.shape)
+        directions = np.broadcast_to(directions, self.pos.shape)
+        apples_consumed, dirt_consumed, self.num_pickers, self.num_cleaners = batched_perform_moves(self.apple_map, self.waste_map, self.apple_agent_map, self.waste_agent_map, self.pos, self.region, self.agent_ids, action_regions, directions)
+        self.num_apples -= apples_consumed.sum(axis=1)
+        self.num_dirt -= dirt_consumed.sum(axis=1)
+
+        current_apple_spawn_prob, current_waste_spawn_prob = self.compute_probabilities(self.num_dirt)
+        if self.use_randomness:
+            num_apples_spawned, num_waste_spawned = self.spawn_apples_and_waste(current_apple_spawn_prob, current_waste_spawn_prob)
+        else:
+            num_apples_spawned, num_waste_spawned = self.deterministic_spawn_apples_and_waste(current_apple_spawn_prob, current_waste_spawn_prob)
+        self.num_apples += num_apples_spawned
+        self.num_dirt += num_waste_spawned
+
+        return apples_consumed
+
+    def compute_probabilities(self, num_dirt):
+        """
+        Vectorised OneDCleanupEnv.compute_probabilities. Returns (B,) arrays of apple and waste spawn probabilities.
+        """
+        waste_density = num_dirt / self.potential_waste_area if self.potential_waste_area > 0 else np.zeros(len(num_dirt))
+        depleted = waste_density >= self.thresholdDepletion
+        if self.thresholdDepletion != self.thresholdRestoration:
+            scaled = (1 - (waste_density - self.thresholdRestoration) / (self.thresholdDepletion - self.thresholdRestoration)) * self.starting_apple_spawn_prob
+        else:
+            scaled = np.full(len(num_dirt), self.starting_apple_spawn_prob)
+        current_apple_spawn_prob = np.where(waste_density <= self.thresholdRestoration, self.starting_apple_spawn_prob, scaled)
+        current_apple_spawn_prob = np.where(depleted, 0, current_apple_spawn_prob)
+        current_waste_spawn_prob = np.where(depleted, 0, self.starting_waste_spawn_prob)
+        return current_apple_spawn_prob, current_waste_spawn_prob
+
+    def free_cells(self):
+        free_apple = ~self.apple_map & (self.apple_agent_map == 0)
+        free_waste = ~self.waste_map & (self.waste_agent_map == 0)
+        return free_apple, free_waste
+
+    def spawn_waste(self, eligible, free_waste):
+        """
+        Spawn one waste point on a uniformly random free cell in every eligible row.
+        """
+        rows = np.arange(self.batch_size)
+        keys = self.rng.random(free_waste.shape)
+        keys[~free_waste] = -1
+        locs = np.argmax(keys, axis=1)
+        eligible = eligible & free_waste.any(axis=1)
+        self.waste_map[rows[eligible], locs[eligible]] = True
+        return eligible
+
+    def deterministic_spawn_apples_and_waste(self, current_apple_spawn_prob, current_waste_spawn_prob):
+        num_apples_spawned = np.trunc(current_apple_spawn_prob * (self.potential_apple_area - self.num_apples - self.num_pickers)).astype(np.int64)
+        free_apple, free_waste = self.free_cells()
+
+        # spawn apples on num_apples_spawned random free cells, multiple can spawn per step
+        keys = self.rng.random(free_apple.shape)
+        keys[~free_apple] = 2
+        ranks = np.argsort(np.argsort(keys, axis=1), axis=1)
+        self.apple_map |= free_apple & (ranks < num_apples_spawned[:, None])
+
+        # spawn one waste point, only one can spawn per step
+        num_waste_spawned = self.spawn_waste(self.num_dirt + self.num_cleaners < self.potential_waste_area, free_waste)
+
+        return num_apples_spawned, num_waste_spawned.astype(np.int64)
+
+    def spawn_apples_and_waste(self, current_apple_spawn_prob, current_waste_spawn_prob):
+        free_apple, free_waste = self.free_cells()
+
+        # spawn apples, multiple can spawn per step
+        spawned = free_apple & (self.rng.random(free_apple.shape) < current_apple_spawn_prob[:, None])
+        self.apple_map |= spawned
+
+        # spawn one waste point, only one can spawn per step
+        eligible = (self.num_dirt + self.num_cleaners < self.potential_waste_area) & (self.rng.random(self.batch_size) < current_waste_spawn_prob)
+        num_waste_spawned = self.spawn_waste(eligible, free_waste)
+
+        return spawned.sum(axis=1), num_waste_spawned.astype(np.int64)
+
+    def closest_objective(self):
+        """
+        Returns a tuple (u, d) of (B, N) distances from every agent to the closest objective above and below it in its region.
+        """
+        in_apple = self.region == APPLE
+        apple_u, apple_d = batched_closest(self.apple_map, self.pos)
+        waste_u, waste_d = batched_closest(self.waste_map, self.pos)
+        return np.where(in_apple, apple_u, waste_u), np.where(in_apple, apple_d, waste_d)
+
+    def closest_agents(self):
+        """
+        Returns a tuple (u, d) of (B, N) distances from every agent to the closest other agent above and below it in its region.
+        """
+        in_apple = self.region == APPLE
+        apple_u, apple_d = batched_closest(self.apple_agent_map != 0, self.pos, inclusive=False)
+        waste_u, waste_d = batched_closest(self.waste_agent_map != 0, self.pos, inclusive=False)
+        return np.where(in_apple, apple_u, waste_u), np.where(in_apple, apple_d, waste_d)
+
+    def observe(self):
+        objective_u, objective_d = self.closest_objective()
+        agents_u, agents_d = self.closest_agents()
+        return {
+            'coordinator': np.stack([self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners], axis=1),
+            'agents': np.stack([objective_u, objective_d, agents_u, agents_d], axis=2),
+        }
+
+    def info(self):
+        return {
+            'total_apple_consumed': self.total_apple_consumed.copy(),
+            'step_apple_consumed': self.step_apple_consumed.copy(),
+            "apple": self.num_apples.copy(),
+            "dirt": self.num_dirt.copy(),
+            "picker": self.num_pickers.copy(),
+            "cleaner": self.num_cleaners.copy(),
+        }
+
+    def get_greedy_assignments(self, num_pickers):
+        """
+        Returns a (B, N) array of greedy role assignments (CleanupRegion values), where row b has num_pickers[b] pickers and
+        the remaining agents are cleaners. As in OneDCleanupEnv.get_greedy_assignments, the pickers are the agents closest
+        to an apple; ties are broken by agent order.
+        """
+        apple_u, apple_d = batched_closest(self.apple_map, self.pos)
+        apple_dist = np.minimum(apple_u, apple_d)
+        apple_rank = np.argsort(np.argsort(apple_dist, axis=1, kind="stable"), axis=1)
+        num_pickers = np.broadcast_to(num_pickers, (self.batch_size,))
+        return np.where(apple_rank < num_pickers[:, None], APPLE, WASTE).astype(np.int8)
+
+    def get_greedy_actions(self, roles):
+        """
+        Returns a tuple (regions, directions) of (B, N) arrays, moving each agent towards the closer of its two nearest objectives.
+        """
+        u, d = self.closest_objective()
+        directions = np.where(u >= d, 1, -1).astype(np.int8)
+        return roles, directions
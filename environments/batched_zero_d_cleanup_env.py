@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class BatchedZeroDCleanupEnv:
+    """
+    Batch of B independent 0-dimensional Cleanup environments advanced together.
+    The dynamics are those of ZeroDCleanupEnv, written as array arithmetic over a (B,) state, so whole batches of episodes
+    (e.g. a sweep over thresholdDepletion or appleRespawnProbability, given as (B,) arrays) run in one call per step.
+    """
+
+    def __init__(self, batch_size=1024, num_agents=10, area=150, thresholdDepletion=0.4, thresholdRestoration=0.0, wasteSpawnProbability=0.5, appleRespawnProbability=0.05, use_heuristic=False):
+        """
+        Initialise the environment. Every parameter other than batch_size and area may be a scalar or a (B,) array.
+        """
+        self.batch_size = batch_size
+        self.area = area
+        self.potential_waste_area = area
+        self.timestamp = 0
+
+        def per_env(value):
+            return np.broadcast_to(np.asarray(value, dtype=np.float64), (batch_size,))
+
+        self.num_agents = np.broadcast_to(np.asarray(num_agents, dtype=np.int64), (batch_size,))
+        self.thresholdDepletion = per_env(thresholdDepletion)
+        self.thresholdRestoration = per_env(thresholdRestoration)
+        self.starting_waste_spawn_prob = per_env(wasteSpawnProbability)
+        self.starting_apple_spawn_prob = per_env(appleRespawnProbability)
+        self.use_heuristic = use_heuristic
+
+        self.reset()
+
+    def reset(self, seed=None, options: dict = {}) -> tuple:
+        """
+        Reset all B environments.
+        """
+        self.timestamp = 0
+        self.num_dirt = np.full(self.batch_size, 78.0)
+        self.num_apples = np.zeros(self.batch_size)
+        self.num_pickers = np.zeros(self.batch_size, dtype=np.int64)
+        self.num_cleaners = np.zeros(self.batch_size, dtype=np.int64)
+        self.current_apple_spawn_prob, self.current_waste_spawn_prob = self.compute_probabilities(self.num_dirt)
+
+        self.total_apple_consumed = np.zeros(self.batch_size)
+        self.step_apple_consumed = np.zeros(self.batch_size)
+
+        return self.observe(), self.info()
+
+    def step(self, num_cleaners=None) -> tuple:
+        """
+        Take a step in all B environments, with num_cleaners[b] cleaners and the remaining agents picking apples in
+        environment b. num_cleaners is ignored when use_heuristic is set.
+        Returns (observations, rewards, dones, truncateds, info) with (B, 4) observations and (B,) everything else.
+        """
+        self.timestamp += 1
+
+        if self.use_heuristic:
+            num_cleaners = self.heuristic_cleaners()
+        self.num_cleaners = np.broadcast_to(np.asarray(num_cleaners, dtype=np.int64), (self.batch_size,)).copy()
+        self.num_pickers = self.num_agents - self.num_cleaners
+
+        rewards = self.get_immediate_reward(self.num_pickers)
+        self.num_apples = self.num_apples - rewards
+        self.num_dirt = self.num_dirt - (self.num_dirt * self.num_cleaners) / self.area
+        self.step_apple_consumed = rewards
+        self.total_apple_consumed = self.total_apple_consumed + rewards
+
+        self.current_apple_spawn_prob, self.current_waste_spawn_prob = self.compute_probabilities(self.num_dirt)
+        self.num_apples = self.num_apples + (self.area - np.trunc(self.num_apples)) * self.current_apple_spawn_prob
+        self.num_dirt = self.num_dirt + self.current_waste_spawn_prob
+
+        dones = np.full(self.batch_size, self.timestamp == 1000)
+        return self.observe(), rewards, dones, np.zeros(self.batch_size, dtype=bool), self.info()
+
+    def heuristic_cleaners(self):
+        agent_frequency_in_dirt = self.num_dirt / (self.num_apples + self.num_dirt)
+        return np.round(self.num_agents * agent_frequency_in_dirt).astype(np.int64)
+
+    def compute_probabilities(self, num_dirt):
+        """
+        Vectorised ZeroDCleanupEnv.compute_probabilities. Returns (B,) arrays of apple and waste spawn probabilities.
+        """
+        waste_density = num_dirt / self.potential_waste_area
+        depleted = waste_density >= self.thresholdDepletion
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = (1 - (waste_density - self.thresholdRestoration) / (self.thresholdDepletion - self.thresholdRestoration)) * self.starting_apple_spawn_prob
+        current_apple_spawn_prob = np.where(waste_density <= self.thresholdRestoration, self.starting_apple_spawn_prob, scaled)
+        current_apple_spawn_prob = np.where(depleted, 0.0, current_apple_spawn_prob)
+        current_waste_spawn_prob = np.where(depleted, 0.0, self.starting_waste_spawn_prob)
+        return current_apple_spawn_prob, current_waste_spawn_prob
+
+    def get_immediate_reward(self, n_pickers):
+        """
+        Immediate reward of n_pickers pickers in every environment; n_pickers may be (B,) or (B, K) for K candidate splits.
+        """
+        num_apples = self.num_apples if np.ndim(n_pickers) < 2 else self.num_apples[:, None]
+        return (num_apples * n_pickers) / self.area
+
+    def simulate_future_state(self, new_p, new_c):
+        """
+        Vectorised ZeroDCleanupEnv.simulate_future_state. new_p and new_c are (B,) or (B, K) arrays; returns an array with
+        a trailing axis of size 4 holding the expected (apples, dirt, pickers, cleaners).
+        """
+        new_p = np.asarray(new_p, dtype=np.float64)
+        new_c = np.asarray(new_c, dtype=np.float64)
+        expand = (slice(None), None) if new_p.ndim == 2 else (slice(None),)
+        num_apples, num_dirt = self.num_apples[expand], self.num_dirt[expand]
+        depletion, restoration = self.thresholdDepletion[expand], self.thresholdRestoration[expand]
+        apple_spawn_prob = self.starting_apple_spawn_prob[expand]
+
+        apple_left = num_apples - ((num_apples * new_p) / self.area)
+        dirt_left = num_dirt - ((num_dirt * new_c) / self.area)
+        cur_dirt_density = dirt_left / self.area
+        depleted = cur_dirt_density >= depletion
+        exp_new_dirt = np.where(depleted, dirt_left, dirt_left + 0.5)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exp_new_apple = np.where(depleted, apple_left, apple_left + (self.area - apple_left) * (1 - (cur_dirt_density - restoration) / (depletion - restoration)) * apple_spawn_prob)
+        return np.stack(np.broadcast_arrays(exp_new_apple, exp_new_dirt, new_p, new_c), axis=-1)
+
+    def evaluate_role_splits(self):
+        """
+        Returns (next_states, rewards) for every split of each environment's agents into pickers and cleaners:
+        next_states is (B, N + 1, 4) and rewards is (B, N + 1), where column i has i cleaners.
+        All environments must have the same number of agents.
+        """
+        num_agents = int(self.num_agents[0])
+        new_c = np.broadcast_to(np.arange(num_agents + 1), (self.batch_size, num_agents + 1))
+        new_p = num_agents - new_c
+        return self.simulate_future_state(new_p, new_c), self.get_immediate_reward(new_p)
+
+    def observe(self):
+        return np.stack([self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners], axis=1)
+
+    def info(self):
+        return {
+            'total_apple_consumed': self.total_apple_consumed,
+            'step_apple_consumed': self.step_apple_consumed,
+            "apple": self.num_apples,
+            "dirt": self.num_dirt,
+            "picker": self.num_pickers,
+            "cleaner": self.num_cleaners,
+        }
@@ -1,5 +1,4 @@
 from __future__ import annotations
-import random
 import numpy as np
 from gymnasium.spaces import Box, Dict, Discrete, MultiDiscrete, Tuple
 import seaborn as sns
@@ -8,7 +7,8 @@ import matplotlib.pyplot as plt
 from matplotlib import colors
 from ray.rllib.env import MultiAgentEnv
 
-from agents.cleanup_agent import CleanupAgent, GreedyCleanUpAgent
+from agents.cleanup_agent import AgentTable
+from environments.position_index import GridIndex
 
 thresholdDepletion = 0.4
 thresholdRestoration = 0.0
@@ -51,30 +51,25 @@ class CleanupEnv(MultiAgentEnv):
         self.current_apple_spawn_prob = appleRespawnProbability
         self.current_waste_spawn_prob = wasteSpawnProbability
         self.map = np.zeros((self.height, self.width))
-        for i in range(0, self.height, 2):
-            for j in range(self.dirt_end):
-                self.map[i][j] = -1
-                self.num_dirt += 1
+        self.map[0::2, :self.dirt_end] = -1
+        self.num_dirt = int(np.count_nonzero(self.map == -1))
+        self.index = GridIndex(self.map)
         self.compute_probabilities()
         self._agent_ids = self.setup_agents()
 
         super().__init__()
 
     def setup_agents(self):
-        agent_ids = set()
-        for i in range(self.num_agents):
-            agent_id = str(i)
-            spawn_point = [random.randint(0, self.height - 1), random.randint(0, self.width - 1)]
+        # greedy agents start as cleaners; region is unused otherwise
+        self.agents = AgentTable([str(i) for i in range(self.num_agents)], pos_dims=2, region=-1 if self.greedy else 0)
+        rng = self.np_random
+        for agent in self.agents.values():
+            spawn_point = [int(rng.integers(self.height)), int(rng.integers(self.width))]
             while spawn_point[0] % 2 == 0 and spawn_point[1] < self.dirt_end:
                 # do not spawn on dirt
-                spawn_point = [random.randint(0, self.height - 1), random.randint(0, self.width - 1)]
-            if not self.greedy:
-              agent = CleanupAgent(agent_id, spawn_point)
-            else:
-              agent = GreedyCleanUpAgent(agent_id, spawn_point, -1)
-            self.agents[agent_id] = agent
-            agent_ids.add(agent_id)
-        return agent_ids
+                spawn_point = [int(rng.integers(self.height)), int(rng.integers(self.width))]
+            agent.pos = spawn_point
+        return set(self.agents.ids)
 
     # def greedily_setup_agents(self):
     #     assert(self.greedy)
@@ -111,20 +106,15 @@ class CleanupEnv(MultiAgentEnv):
         self.map = np.zeros((self.height, self.width))
         self.current_apple_spawn_prob = appleRespawnProbability
         self.current_waste_spawn_prob = wasteSpawnProbability
-        for i in range(0, self.height, 2):
-            for j in range(self.dirt_end):
-                self.map[i][j] = -1
-                self.num_dirt += 1
+        self.map[0::2, :self.dirt_end] = -1
+        self.num_dirt = int(np.count_nonzero(self.map == -1))
+        self.index = GridIndex(self.map)
         self.compute_probabilities()
         self.setup_agents()
 
-        observations = {}
-        pos = np.zeros((self.num_agents, 2))
-        a_keys = sorted(self.agents.keys())  # key must be sorted
-        for agent_key in a_keys:
-            pos[int(agent_key)] = self.agents[agent_key].pos
-        for agent_key in a_keys:
-            observations[self.agents[agent_key].agent_id] = (pos, self.map)
+        # row k of the agent table is agent str(k)
+        pos = self.agents.pos.astype(np.float64)
+        observations = {agent_id: (pos, self.map) for agent_id in self.agents.ids}
         return observations, {}
 
     def step(self, actions):
@@ -182,12 +172,9 @@ class CleanupEnv(MultiAgentEnv):
         self.spawn_apples_and_waste(has_agent)
         if self.greedy:
             self.reassign_regions_of_greedy_agents()
-        pos = np.zeros((self.num_agents, 2))
-        a_keys = sorted(self.agents.keys())  # key must be sorted
-        for agent_key in a_keys:
-            pos[int(agent_key)] = self.agents[agent_key].pos
-        for agent_key in a_keys:
-            obs[self.agents[agent_key].agent_id] = (pos, self.map)
+        pos = self.agents.pos.astype(np.float64)
+        for agent_id in self.agents.ids:
+            obs[agent_id] = (pos, self.map)
 
         dones["__all__"] = self.timestamp == 1000
         return obs, rewards, dones, {"__all__": False}, {}
@@ -217,13 +204,20 @@ class CleanupEnv(MultiAgentEnv):
             actions[agent.agent_id] = self.get_greedy_action(agent)
         return actions
 
+    def set_cell(self, x, y, value):
+        """
+        Write a map cell, keeping the nearest-object index in sync.
+        """
+        self.index.set(x, y, self.map[x][y], value)
+        self.map[x][y] = value
+
     def calculate_reward(self, x, y):
         if self.map[x][y] == -1:
-            self.map[x][y] = 0
+            self.set_cell(x, y, 0)
             self.num_dirt -= 1
             return 0
         if self.map[x][y] == 1:
-            self.map[x][y] = 0
+            self.set_cell(x, y, 0)
             self.num_apples -= 1
             return 1
         return 0
@@ -245,48 +239,43 @@ class CleanupEnv(MultiAgentEnv):
                              * appleRespawnProbability
                 self.current_apple_spawn_prob = spawn_prob
 
-    def spawn_apples_and_waste(self, has_agent):
+    def spawn_apples_and_waste(self, has_agent, rng=None):
+        """
+        Every cell of the apple area spawns an apple with probability current_apple_spawn_prob (one masked Bernoulli draw
+        over the area, from rng or the environment's np_random), and at most one waste cell spawns. All draws come from rng,
+        so reset(seed=...) makes an episode reproducible.
+        """
+        rng = self.np_random if rng is None else rng
         # spawn apples, multiple can spawn per step
-        for i in range(self.height):
-            for j in range(self.apple_start, self.width, 1):
-                rand_num = np.random.rand(1)[0]
-                if rand_num < self.current_apple_spawn_prob and (i, j) not in has_agent:
-                    if (self.map[i][j] != 1):
-                        self.num_apples += 1
-                    self.map[i][j] = 1
+        spawned = rng.random((self.height, self.width - self.apple_start)) < self.current_apple_spawn_prob
+        for i, j in has_agent:
+            if j >= self.apple_start:
+                spawned[i, j - self.apple_start] = False
+        spawned &= self.map[:, self.apple_start:] != 1
+        for i, j in zip(*np.nonzero(spawned)):
+            self.set_cell(i, j + self.apple_start, 1)
+        self.num_apples += int(np.count_nonzero(spawned))
 
         # spawn one waste point, only one can spawn per step
         if self.num_dirt < self.potential_waste_area:
-            dirt_spawn = [random.randint(0, self.height - 1), random.randint(0, self.dirt_end)]
+            dirt_spawn = [int(rng.integers(self.height)), int(rng.integers(self.dirt_end + 1))]
             while self.map[dirt_spawn[0]][dirt_spawn[1]] == -1:  # do not spawn on already existing dirt
-                dirt_spawn = [random.randint(0, self.height - 1), random.randint(0, 5)]
+                dirt_spawn = [int(rng.integers(self.height)), int(rng.integers(6))]
 
-            rand_num = np.random.rand(1)[0]
+            rand_num = rng.random()
             if rand_num < self.current_waste_spawn_prob and (dirt_spawn[0], dirt_spawn[1]) not in has_agent:
-                self.map[dirt_spawn[0]][dirt_spawn[1]] = -1
+                self.set_cell(dirt_spawn[0], dirt_spawn[1], -1)
                 self.num_dirt += 1
 
     def find_nearest_apple_from_agent(self, agent):
         assert (self.greedy)
         x, y = agent.pos
-        closest_x, closest_y, min_distance = -1, -1, float('inf')
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.map[i][j] == 1 and abs(i - x) + abs(j - y) <= min_distance:
-                    min_distance = abs(i - x) + abs(j - y)
-                    closest_x, closest_y = i, j
-        return [closest_x, closest_y], min_distance
+        return self.index.apples.nearest(x, y)
 
     def find_nearest_waste_from_agent(self, agent):
         assert (self.greedy)
         x, y = agent.pos
-        closest_x, closest_y, min_distance = -1, -1, float('inf')
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.map[i][j] == -1 and abs(i - x) + abs(j - y) <= min_distance:
-                    min_distance = abs(i - x) + abs(j - y)
-                    closest_x, closest_y = i, j
-        return [closest_x, closest_y], min_distance
+        return self.index.waste.nearest(x, y)
 
     def get_greedy_action(self, agent):
         assert (self.greedy)
@@ -1,13 +1,15 @@
-import copy
-
 from ray.rllib.env import MultiAgentEnv
 
+import itertools
+import math
 import numpy as np
 import torch
 
-from agents import GreedyCleanUpAgent
-
-import random
+from agents import AgentTable
+from environments.position_index import FreeCells, PositionIndex
+from environments.one_d_step_kernel import NUMBA_AVAILABLE, observe_agents
+from environments.profiling import NULL_PROFILER, profiled
+from environments.batched_one_d_cleanup_env import batched_perform_moves
 
 from enum import Enum
 
@@ -17,6 +19,89 @@ class CleanupRegion(Enum):
     APPLE = 1
     WASTE = -1
 
+# apple / waste occupancy maps are boolean, agent maps hold integer agent ids (0 = empty)
+OCCUPANCY_DTYPE = np.bool_
+AGENT_MAP_DTYPE = np.int32
+MAP_NAMES = ("apple_map", "waste_map", "apple_agent_map", "waste_agent_map")
+
+
+def read_only(array):
+    """
+    Returns a read-only view of the array; no data is copied.
+    """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def unpack_map(packed, area):
+    """
+    Inverse of the bit packing applied by OneDCleanupEnv.map_snapshot(packed=True) to the occupancy maps.
+    """
+    return np.unpackbits(packed, count=area).astype(OCCUPANCY_DTYPE)
+
+class StepJournal:
+    """
+    Undo log of the map cells and agents changed while simulating a step on the live state.
+    """
+
+    def __init__(self):
+        self.cells = []
+        self.agents = []
+        self.free_cells = {}
+
+    def record_cell(self, map, index, name, pos):
+        self.cells.append((map, index, name, pos, map.item(pos)))
+        if index is not None and id(index) not in self.free_cells:
+            # undoing the swap-removes one at a time would bring back the free cells but not their order, on which the
+            # next spawn depends, so they are restored from a copy instead
+            self.free_cells[id(index)] = (index, index.free_apples.snapshot(), index.free_waste.snapshot())
+
+    def record_agent(self, agent):
+        self.agents.append((agent, agent.pos, agent.region))
+
+    def rollback(self):
+        for map, index, name, pos, value in reversed(self.cells):
+            map[pos] = value
+            if index is not None:
+                getattr(index, name).set(pos, value != 0)
+        for index, free_apples, free_waste in self.free_cells.values():
+            index.free_apples.restore(free_apples)
+            index.free_waste.restore(free_waste)
+        for agent, pos, region in reversed(self.agents):
+            agent.pos = pos
+            agent.region = region
+        self.cells.clear()
+        self.agents.clear()
+        self.free_cells.clear()
+
+
+class GreedyPlan:
+    """
+    The greedy policy of one state, from the distances (u, d) of every agent to the closest apple and waste above and
+    below it: the agents sorted by distance to the closest apple and to the closest waste, each agent's rank in the apple
+    ordering, and the greedy direction of each agent in its current region. Any split into pickers and cleaners is read
+    off the orderings in O(N).
+    """
+
+    def __init__(self, apple_u, apple_d, waste_u, waste_d, in_apple):
+        self.apple_order = np.argsort(np.minimum(apple_u, apple_d), kind="stable")
+        self.waste_order = np.argsort(np.minimum(waste_u, waste_d), kind="stable")
+        self.apple_rank = np.empty(len(apple_u), dtype=np.int64)
+        self.apple_rank[self.apple_order] = np.arange(len(apple_u))
+        # up (+1) unless the closest objective in the agent's region is strictly below
+        self.directions = np.where(np.where(in_apple, apple_u >= apple_d, waste_u >= waste_d), 1, -1).astype(np.int8)
+
+    def split(self, num_pickers, num_cleaners):
+        """
+        Returns (pickers, cleaners): the agent slots of the num_pickers agents closest to an apple, and of the
+        num_cleaners agents closest to waste among the rest.
+        """
+        pickers = self.apple_order[:num_pickers]
+        # agents already picking can't be assigned to both roles
+        cleaners = self.waste_order[self.apple_rank[self.waste_order] >= len(pickers)][:num_cleaners]
+        return pickers, cleaners
+
 class OneDCleanupEnv(MultiAgentEnv):
     """
     1-dimensional Cleanup environment. In this game, the agents must clean up the dirt from the river before apples can spawn.
@@ -26,13 +111,21 @@ class OneDCleanupEnv(MultiAgentEnv):
     Agents can move up and down within their area, and can cross over to the other area.
     """
 
-    def __init__(self, agent_ids, num_agents=10, area=150, thresholdDepletion: float=0.4, thresholdRestoration: float=0, wasteSpawnProbability: float=0.5, appleRespawnProbability: float=0.05, dirt_multiplier=10, use_randomness=True):
+    def __init__(self, agent_ids, num_agents=10, area=150, thresholdDepletion: float=0.4, thresholdRestoration: float=0, wasteSpawnProbability: float=0.5, appleRespawnProbability: float=0.05, dirt_multiplier=10, use_randomness=True, info_maps="view", profiler=None, observation_mode="dict", sentinel=None):
         """
         Initialise the environment.
+        info_maps selects how the maps appear in info: "view" for read-only views of the live maps, "snapshot" for
+        copies, "packed" for copies with the occupancy maps bit-packed, or None to leave them out.
+        profiler is an optional environments.profiling.PhaseProfiler timing the phases of every step; its per-episode
+        summary is added to the info of the last step as info["profile"].
+        observation_mode "array" makes step and reset return {"coordinator": (4,) float32 array, "agents": (num_agents, 4)
+        float32 array} in place of the dict of tuples, with sentinel (by default the area, at least as large as any
+        distance) in place of inf. See observe_arrays.
         """
 
         self._agent_ids = set(agent_ids)
-        self._agents = {id: GreedyCleanUpAgent(id, 0, CleanupRegion.WASTE) for id in self._agent_ids}
+        # pos / region writes through the agent views (the old dict-of-agents API) invalidate cached results too
+        self._agents = AgentTable(self._agent_ids, region=CleanupRegion.WASTE, region_type=CleanupRegion, on_change=self.new_state_version)
         self.num_agents = num_agents
         self.timestamp = 0
 
@@ -41,11 +134,11 @@ class OneDCleanupEnv(MultiAgentEnv):
         self.dirt_end = 1
 
         self.potential_apple_area = area
-        self.apple_map = np.zeros(self.potential_apple_area)
-        self.apple_agent_map = np.zeros(self.potential_apple_area)
         self.potential_waste_area = area
-        self.waste_map = np.zeros(self.potential_waste_area)
-        self.waste_agent_map = np.zeros(self.potential_waste_area)
+        self.allocate_maps()
+        self.info_maps = info_maps
+
+        self.index = PositionIndex(self.apple_map, self.waste_map, self.apple_agent_map, self.waste_agent_map)
 
         self.num_apples = 0
         self.num_dirt = 78
@@ -64,6 +157,24 @@ class OneDCleanupEnv(MultiAgentEnv):
         self.epoch = 0
 
         self.use_randomness = use_randomness
+        self.journal = None
+        self.profiler = NULL_PROFILER if profiler is None else profiler
+
+        # every change of the maps or agents takes a new state_version, never reused, so results cached against a
+        # version (greedy_plan) are valid exactly as long as the state is unchanged
+        self.state_versions = itertools.count()
+        self.state_version = next(self.state_versions)
+        self.cached_plan = (None, None)
+
+        self.observation_mode = observation_mode
+        self.sentinel = float(area if sentinel is None else sentinel)
+        if self.sentinel < area:
+            raise ValueError("The observation sentinel must be at least the area, so no distance reaches it.")
+        self.coordinator_buffer = np.zeros(4, dtype=np.float32)
+        self.agent_buffer = np.zeros((len(self._agents), 4), dtype=np.float32)
+        self.array_observations = {"coordinator": self.coordinator_buffer, "agents": self.agent_buffer}
+        # torch views sharing memory with the buffers
+        self.observation_tensors = {name: torch.from_numpy(buffer) for name, buffer in self.array_observations.items()}
 
     def reset(self, seed=None, options: dict = {}) -> tuple:
         """
@@ -71,12 +182,11 @@ class OneDCleanupEnv(MultiAgentEnv):
         """
         # Set seed
         super().reset(seed=seed)
+        if self.profiler.enabled and 0 < self.timestamp < 1000:
+            self.profiler.end_episode(timestamp=self.timestamp)
         self.timestamp = 0
 
-        self.apple_map = np.zeros(self.potential_apple_area)
-        self.apple_agent_map = np.zeros(self.potential_apple_area)
-        self.waste_map = np.zeros(self.potential_waste_area)
-        self.waste_agent_map = np.zeros(self.potential_waste_area)
+        self.allocate_maps()
 
         self.num_apples = 0
         self.num_dirt = 78
@@ -91,29 +201,24 @@ class OneDCleanupEnv(MultiAgentEnv):
         dirt_agent_ids = sorted(list(set(self.get_agent_ids())))
 
         if self.use_randomness:
-            dirt_init_locations = np.random.choice(self.potential_waste_area, size=self.num_dirt, replace=False)
+            dirt_init_locations = self.np_random.choice(self.potential_waste_area, size=self.num_dirt, replace=False)
         else:
             dirt_init_locations = np.linspace(0, self.potential_waste_area - 1, self.num_dirt, dtype=int)
         for i in dirt_init_locations:
             self.waste_map[i] = 1
 
-        for i, a_id in enumerate(dirt_agent_ids):
-            loc = int((i / self.num_cleaners) * self.potential_waste_area)
-            self._agents[a_id].region = CleanupRegion.WASTE
-            self._agents[a_id].pos = loc
-            self.waste_agent_map[loc] = int(a_id)
-            if self.waste_map[loc] == 1:  # if there is dirt on the spot
-                self.num_dirt -= 1
-                self.waste_map[loc] = 0
+        locs = (np.arange(len(dirt_agent_ids)) / self.num_cleaners * self.potential_waste_area).astype(np.int64)
+        self._agents.region[:] = CleanupRegion.WASTE.value
+        self._agents.pos[[self._agents.slots[a_id] for a_id in dirt_agent_ids]] = locs
+        self.waste_agent_map[locs] = [int(a_id) for a_id in dirt_agent_ids]
+        cleaned = np.unique(locs[self.waste_map[locs] == 1])  # agents placed on dirt clean it
+        self.waste_map[cleaned] = 0
 
-        observations: dict[str, tuple] = {
-            'coordinator': (self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners),
-        }
-        for a_id in self.get_agent_ids():
-            agent = self._agents[a_id]
-            closest_objective = self.closest_objective(agent.region, agent.pos)
-            closest_agents = self.closest_agents(agent.region, agent.pos)
-            observations[a_id] = (closest_objective[0], closest_objective[1], closest_agents[0], closest_agents[1])
+        self.index = PositionIndex(self.apple_map, self.waste_map, self.apple_agent_map, self.waste_agent_map)
+        self.num_apples, self.num_dirt = len(self.index.apples), len(self.index.waste)
+        self.state_version = next(self.state_versions)
+
+        observations = self.observe()
 
         info = {
             'total_apple_consumed': self.total_apple_consumed,
@@ -122,17 +227,16 @@ class OneDCleanupEnv(MultiAgentEnv):
             "dirt": self.num_dirt,
             "picker": self.num_pickers,
             "cleaner": self.num_cleaners,
-            "apple_map": self.apple_map,
-            "waste_map": self.waste_map,
-            "apple_agent_map": self.apple_agent_map,
-            "waste_agent_map": self.waste_agent_map,
         }
+        info.update(self.info_map_entries())
 
         return observations, info
 
-    def step(self, action_dict: dict[str, tuple[CleanupRegion, int]]) -> tuple:
+    def step(self, action_dict: dict[str, tuple[CleanupRegion, int]] | tuple[np.ndarray, np.ndarray]) -> tuple:
         """
         Take a step in the environment.
+        action_dict maps agent ids to (region, direction), or is a (regions, directions) pair of arrays as returned by
+        get_greedy_action_arrays, row k for the k-th agent of the agent table.
         """
         observations = {}
         rewards = {}
@@ -141,20 +245,16 @@ class OneDCleanupEnv(MultiAgentEnv):
 
         self.timestamp += 1
         self.step_reward = 0
+        profiler = self.profiler
 
-        rewards, self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners = self.perform_step(action_dict)
+        with profiler.phase("perform_step"):
+            rewards, self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners = self.perform_step(action_dict)
         reward = sum(rewards.values())
         self.step_reward += reward
         self.total_apple_consumed += reward
 
-        observations = {
-            'coordinator': (self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners),
-        }
-        for id in self.get_agent_ids():
-            agent = self._agents[id]
-            closest_objective = self.closest_objective(agent.region, agent.pos)
-            closest_agents = self.closest_agents(agent.region, agent.pos)
-            observations[id] = (closest_objective[0], closest_objective[1], closest_agents[0], closest_agents[1])
+        with profiler.phase("observe"):
+            observations = self.observe()
 
         info = {
             'total_apple_consumed': self.total_apple_consumed,
@@ -163,18 +263,52 @@ class OneDCleanupEnv(MultiAgentEnv):
             "dirt": self.num_dirt,
             "picker": self.num_pickers,
             "cleaner": self.num_cleaners,
-            "apple_map": self.apple_map,
-            "waste_map": self.waste_map,
-            "apple_agent_map": self.apple_agent_map,
-            "waste_agent_map": self.waste_agent_map,
         }
+        info.update(self.info_map_entries())
 
         if self.timestamp == 1000:
             dones["__all__"] = True
+            if profiler.enabled:
+                info["profile"] = profiler.end_episode(total_apple_consumed=self.total_apple_consumed)
 
         return observations, rewards, dones, {"__all__": False}, info
 
-    def perform_step(self, action_dict: dict[str, tuple[CleanupRegion, int]], agents=None, apple_map=None, waste_map=None, apple_agent_map=None, waste_agent_map=None) -> tuple:
+    def allocate_maps(self):
+        self.apple_map = np.zeros(self.potential_apple_area, dtype=OCCUPANCY_DTYPE)
+        self.apple_agent_map = np.zeros(self.potential_apple_area, dtype=AGENT_MAP_DTYPE)
+        self.waste_map = np.zeros(self.potential_waste_area, dtype=OCCUPANCY_DTYPE)
+        self.waste_agent_map = np.zeros(self.potential_waste_area, dtype=AGENT_MAP_DTYPE)
+
+    def map_views(self):
+        """
+        Returns the four maps as read-only views of the live state. They change as the environment steps; use
+        map_snapshot to keep a copy.
+        """
+        return {name: read_only(getattr(self, name)) for name in MAP_NAMES}
+
+    def map_snapshot(self, packed=False):
+        """
+        Returns copies of the four maps. With packed, the apple and waste occupancy maps are bit-packed with np.packbits
+        (see unpack_map), one bit per cell.
+        """
+        snapshot = {name: getattr(self, name).copy() for name in MAP_NAMES}
+        if packed:
+            snapshot["apple_map"] = np.packbits(self.apple_map)
+            snapshot["waste_map"] = np.packbits(self.waste_map)
+        return snapshot
+
+    def info_map_entries(self):
+        if self.info_maps == "view":
+            return self.map_views()
+        if self.info_maps == "snapshot":
+            return self.map_snapshot()
+        if self.info_maps == "packed":
+            return self.map_snapshot(packed=True)
+        return {}
+
+    def perform_step(self, action_dict: dict[str, tuple[CleanupRegion, int]] | tuple[np.ndarray, np.ndarray], agents=None, apple_map=None, waste_map=None, apple_agent_map=None, waste_agent_map=None, index=None) -> tuple:
+        if index is None and apple_map is None:
+            index = self.index
         if agents is None:
             agents = self._agents
         if apple_map is None:
@@ -186,99 +320,143 @@ class OneDCleanupEnv(MultiAgentEnv):
         if waste_agent_map is None:
             waste_agent_map = self.waste_agent_map
 
+        profiler = self.profiler
+        # phases of simulate_step are kept apart from those of real steps
+        prefix = "" if self.journal is None else "simulate_"
+
+        if isinstance(action_dict, dict):
+            actions = action_dict.items()
+        else:
+            regions, directions = action_dict
+            region_of = agents.region_of
+            actions = ((id, (region_of(region), direction)) for id, region, direction in zip(agents.ids, regions.tolist(), directions.tolist()))
+
         # Move agents
-        rewards = {}
-        num_dirt = self.num_dirt
-        num_apples = self.num_apples
-        num_pickers = 0
-        num_cleaners = 0
-        for id, action in action_dict.items():
-            region, direction = action
-            agent = agents[id]
-
-            if region != agent.region:
-                apples_consumed, dirt_consumed = self.switch_region(id, region, agents, apple_map, waste_map, apple_agent_map, waste_agent_map)
-
-                num_apples -= apples_consumed
-                num_dirt -= dirt_consumed
-                reward = apples_consumed
-                if agent.region == CleanupRegion.APPLE:
+        with profiler.phase(prefix + "move"):
+            rewards = {}
+            num_dirt = self.num_dirt
+            num_apples = self.num_apples
+            num_pickers = 0
+            num_cleaners = 0
+            num_switches = 0
+            for id, action in actions:
+                region, direction = action
+                agent = agents[id]
+
+                if region != agent.region:
+                    apples_consumed, dirt_consumed = self.switch_region(id, region, agents, apple_map, waste_map, apple_agent_map, waste_agent_map, index)
+                    num_switches += 1
+                    num_apples -= apples_consumed
+                    num_dirt -= dirt_consumed
+                    reward = apples_consumed
+                    if agent.region == CleanupRegion.APPLE:
+                        num_pickers += 1
+                    else:
+                        num_cleaners += 1
+                elif region == CleanupRegion.APPLE:
                     num_pickers += 1
+                    apples_consumed, dirt_consumed = self.move_agent(id, direction, agents, apple_map, waste_map, apple_agent_map, waste_agent_map, index)
+                    reward = apples_consumed
+                    num_apples -= apples_consumed
+                    num_dirt -= dirt_consumed
                 else:
                     num_cleaners += 1
-            elif region == CleanupRegion.APPLE:
-                num_pickers += 1
-                apples_consumed, dirt_consumed = self.move_agent(id, direction, agents, apple_map, waste_map, apple_agent_map, waste_agent_map)
-                reward = apples_consumed
-                num_apples -= apples_consumed
-                num_dirt -= dirt_consumed
+                    apples_consumed, dirt_consumed = self.move_agent(id, direction, agents, apple_map, waste_map, apple_agent_map, waste_agent_map, index)
+                    num_apples -= apples_consumed
+                    num_dirt -= dirt_consumed
+                    reward = 0
+                rewards[id] = reward
+        profiler.count(prefix + "region_switches", num_switches)
+
+        with profiler.phase(prefix + "spawn"):
+            current_apple_spawn_prob, current_waste_spawn_prob = self.compute_probabilities(num_dirt)
+            if self.use_randomness:
+                num_apples_spawned, num_waste_spawned = self.spawn_apples_and_waste(num_dirt, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map, apple_agent_map, waste_agent_map, index)
             else:
-                num_cleaners += 1
-                apples_consumed, dirt_consumed = self.move_agent(id, direction, agents, apple_map, waste_map, apple_agent_map, waste_agent_map)
-                num_apples -= apples_consumed
-                num_dirt -= dirt_consumed
-                reward = 0
-            rewards[id] = reward
-
-        current_apple_spawn_prob, current_waste_spawn_prob = self.compute_probabilities(num_dirt)
-        if self.use_randomness:
-            num_apples_spawned, num_waste_spawned = self.spawn_apples_and_waste(num_dirt, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map, apple_agent_map, waste_agent_map)
-        else:
-            num_apples_spawned, num_waste_spawned = self.deterministic_spawn_apples_and_waste(num_apples, num_dirt, num_pickers, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map, apple_agent_map, waste_agent_map)
+                num_apples_spawned, num_waste_spawned = self.deterministic_spawn_apples_and_waste(num_apples, num_dirt, num_pickers, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map, apple_agent_map, waste_agent_map, index)
 
-        num_apples += num_apples_spawned
-        num_dirt += num_waste_spawned
+        if index is not None:
+            # the index holds what is on the maps, so the counters cannot drift from them
+            num_apples, num_dirt = len(index.apples), len(index.waste)
+        else:
+            num_apples += num_apples_spawned
+            num_dirt += num_waste_spawned
 
         return rewards, num_apples, num_dirt, num_pickers, num_cleaners
 
-    def switch_region(self, id, region, agents, apple_map, waste_map, apple_agent_map, waste_agent_map):
+    def set_cell(self, map, index, name, pos, value):
+        """
+        Write a map cell, keeping the named sorted-position index and free cells (if any) and the undo journal (if
+        simulating) in sync.
+        """
+        if self.journal is not None:
+            self.journal.record_cell(map, index, name, pos)
+        map[pos] = value
+        if index is not None:
+            index.set(name, pos, value != 0)
+        self.state_version = next(self.state_versions)
+
+    def new_state_version(self):
+        self.state_version = next(self.state_versions)
+
+    def switch_region(self, id, region, agents, apple_map, waste_map, apple_agent_map, waste_agent_map, index=None):
         """
         Switch an agent's region.
         Returns a tuple (r, d) where r is the number of apples eaten and d is the number of dirt cleaned.
         """
         agent = agents[id]
+        pos = agent.pos
 
         if region == CleanupRegion.APPLE:
-            if apple_agent_map[agent.pos] != 0:
+            if apple_agent_map[pos]:
                 return 0, 0
-            apple_agent_map[agent.pos] = int(id)
-            waste_agent_map[agent.pos] = 0
+            if self.journal is not None:
+                self.journal.record_agent(agent)
+            self.set_cell(apple_agent_map, index, 'apple_agents', pos, int(id))
+            self.set_cell(waste_agent_map, index, 'waste_agents', pos, 0)
             agent.region = CleanupRegion.APPLE
-            if apple_map[agent.pos] != 0:
-                apple_map[agent.pos] = 0
+            if apple_map[pos]:
+                self.set_cell(apple_map, index, 'apples', pos, 0)
                 return 1, 0
         else:
-            if waste_agent_map[agent.pos] != 0:
+            if waste_agent_map[pos]:
                 return 0, 0
-            apple_agent_map[agent.pos] = 0
-            waste_agent_map[agent.pos] = int(id)
+            if self.journal is not None:
+                self.journal.record_agent(agent)
+            self.set_cell(apple_agent_map, index, 'apple_agents', pos, 0)
+            self.set_cell(waste_agent_map, index, 'waste_agents', pos, int(id))
             agent.region = CleanupRegion.WASTE
-            if waste_map[agent.pos] != 0:
-                waste_map[agent.pos] = 0
+            if waste_map[pos]:
+                self.set_cell(waste_map, index, 'waste', pos, 0)
                 return 0, 1
         return 0, 0
 
-    def move_agent(self, id, direction, agents, apple_map, waste_map, apple_agent_map, waste_agent_map):
+    def move_agent(self, id, direction, agents, apple_map, waste_map, apple_agent_map, waste_agent_map, index=None):
         """
         Move an agent.
         Returns a tuple (r, d) where r is the number of apples eaten and d is the number of dirt cleaned.
         """
         agent = agents[id]
-        map = apple_map if agent.region == CleanupRegion.APPLE else waste_map
-        agent_map = apple_agent_map if agent.region == CleanupRegion.APPLE else waste_agent_map
-        new_pos = agent.pos + direction
+        pos = agent.pos
+        in_apple = agent.region == CleanupRegion.APPLE
+        map = apple_map if in_apple else waste_map
+        agent_map = apple_agent_map if in_apple else waste_agent_map
+        new_pos = pos + direction
         if new_pos < 0 or new_pos >= len(map):
             return 0, 0
-        if agent_map[new_pos] != 0:
+        if agent_map[new_pos]:
             return 0, 0
 
-        agent_map[new_pos] = int(id)
-        agent_map[agent.pos] = 0
+        if self.journal is not None:
+            self.journal.record_agent(agent)
+        agent_positions = 'apple_agents' if in_apple else 'waste_agents'
+        self.set_cell(agent_map, index, agent_positions, new_pos, int(id))
+        self.set_cell(agent_map, index, agent_positions, pos, 0)
         agent.pos = new_pos
 
-        if map[new_pos] != 0:
-            map[new_pos] = 0
-            if agent.region == CleanupRegion.APPLE:
+        if map[new_pos]:
+            self.set_cell(map, index, 'apples' if in_apple else 'waste', new_pos, 0)
+            if in_apple:
                 return 1, 0
             else:
                 return 0, 1
@@ -302,56 +480,88 @@ class OneDCleanupEnv(MultiAgentEnv):
                 current_apple_spawn_prob = spawn_prob
         return current_apple_spawn_prob, current_waste_spawn_prob
     
-    def deterministic_spawn_apples_and_waste(self, num_apples, num_dirt, num_pickers, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map: np.ndarray, apple_agent_map, waste_agent_map):
-        num_apples_spawned = current_apple_spawn_prob * (self.potential_apple_area - num_apples - num_pickers)
-        num_waste_spawned = 1 if current_waste_spawn_prob > 0 else 0
+    def free_cells(self, map, agent_map, free=None):
+        """
+        The FreeCells of an area: the index's own if there is one, else a new set found by scanning the maps.
+        """
+        if free is not None:
+            return free
+        return FreeCells(len(map), np.flatnonzero((map == 0) & (agent_map == 0)))
+
+    def spawn_waste(self, num_dirt, num_cleaners, current_waste_spawn_prob, waste_map, waste_agent_map, index, rng):
+        """
+        Spawns at most one waste point, on a uniformly random free cell, as long as the waste area has room; with
+        use_randomness it spawns with probability current_waste_spawn_prob. Returns the number spawned.
+        """
+        if num_dirt + num_cleaners >= self.potential_waste_area:
+            return 0
+        if self.use_randomness and rng.random() >= current_waste_spawn_prob:
+            return 0
+        free = self.free_cells(waste_map, waste_agent_map, None if index is None else index.free_waste)
+        if len(free) == 0:
+            return 0
+        self.set_cell(waste_map, index, 'waste', free.members()[int(rng.random() * len(free))], 1)
+        return 1
+
+    def deterministic_spawn_apples_and_waste(self, num_apples, num_dirt, num_pickers, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map: np.ndarray, apple_agent_map, waste_agent_map, index=None, rng=None):
+        """
+        Spawning at the expected rates: int(current_apple_spawn_prob * free apple cells) apples, each on a uniformly random
+        remaining free cell, and one waste point as long as waste can spawn.
+        Returns the number of apples and waste actually spawned.
+        """
+        rng = self.np_random if rng is None else rng
+        free = self.free_cells(apple_map, apple_agent_map, None if index is None else index.free_apples)
+        num_apples_spawned = min(max(int(current_apple_spawn_prob * (self.potential_apple_area - num_apples - num_pickers)), 0), len(free))
 
         # spawn apples, multiple can spawn per step
-        remaining_apple_locs = np.where(np.logical_and(apple_map == 0, apple_agent_map == 0))[0]
-        if len(remaining_apple_locs) > 0:
-            apple_locs = random.sample(list(remaining_apple_locs), int(num_apples_spawned))
-            #apple_locs = remaining_apple_locs[:int(num_apples_spawned)]
-            apple_map[apple_locs] = 1
-
-        # spawn one waste point, only one can spawn per step
-        if num_dirt + num_cleaners < self.potential_waste_area:
-            remaining_waste_locs = np.where(np.logical_and(waste_map == 0, waste_agent_map == 0))[0]
-            if len(remaining_waste_locs) > 0:
-                loc = random.choice(remaining_waste_locs)
-                #loc = remaining_waste_locs[0]
-                waste_map[loc] = 1
-
-        #print(num_apples, num_apples_spawned, np.where(apple_map == 1)[0])
-        #print(num_dirt, num_waste_spawned, np.where(waste_map == 1)[0])
-
-        return int(num_apples_spawned), num_waste_spawned
-
-    def spawn_apples_and_waste(self, num_dirt, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map: np.ndarray, apple_agent_map, waste_agent_map):
+        for _ in range(num_apples_spawned):
+            loc = free.members()[int(rng.random() * len(free))]
+            self.set_cell(apple_map, index, 'apples', loc, 1)
+            free.discard(loc)
+
+        return num_apples_spawned, self.spawn_waste(num_dirt, num_cleaners, current_waste_spawn_prob, waste_map, waste_agent_map, index, rng)
+
+    def spawn_apples_and_waste(self, num_dirt, num_cleaners, current_apple_spawn_prob, current_waste_spawn_prob, apple_map, waste_map: np.ndarray, apple_agent_map, waste_agent_map, index=None, rng=None):
+        """
+        Stochastic spawning: every free apple cell spawns an apple with probability current_apple_spawn_prob, and at most
+        one waste cell spawns.
+        The spawning cells are found by stepping down the free cells with geometric gaps, one uniform per apple spawned
+        plus one, so a step costs O(spawned) rather than O(area). Random numbers come from rng, defaulting to the
+        environment's seeded np_random.
+        """
+        rng = self.np_random if rng is None else rng
         num_apples_spawned = 0
-        num_waste_spawned = 0
         # spawn apples, multiple can spawn per step
-        for x in range(self.potential_apple_area):
-            rand_num = np.random.rand(1)[0]
-            if rand_num < current_apple_spawn_prob and apple_agent_map[x] == 0 and apple_map[x] == 0:
-                apple_map[x] = 1
+        free = self.free_cells(apple_map, apple_agent_map, None if index is None else index.free_apples)
+        if current_apple_spawn_prob > 0:
+            # spawning swap-removes a cell from the free set, which only moves cells above it, so walk downwards
+            cells = free.members()
+            log_q = math.log1p(-current_apple_spawn_prob) if current_apple_spawn_prob < 1 else -math.inf
+            i = len(cells)
+            while True:
+                gap = math.log(1.0 - rng.random()) / log_q
+                if gap >= i:
+                    break
+                i -= 1 + int(gap)
+                loc = cells[i]
+                self.set_cell(apple_map, index, 'apples', loc, 1)
+                free.discard(loc)
                 num_apples_spawned += 1
 
-        # spawn one waste point, only one can spawn per step
-        if num_dirt + num_cleaners < self.potential_waste_area:
-            rand_num = np.random.rand(1)[0]
-            if rand_num < current_waste_spawn_prob:
-                remaining_locs = np.where(np.logical_and(waste_map == 0, waste_agent_map == 0))[0]
-                if len(remaining_locs) > 0:
-                    loc = random.choice(remaining_locs)
-                    waste_map[loc] = 1
-                    num_waste_spawned += 1
-
-        return num_apples_spawned, num_waste_spawned
+        return num_apples_spawned, self.spawn_waste(num_dirt, num_cleaners, current_waste_spawn_prob, waste_map, waste_agent_map, index, rng)
 
-    def closest_objective(self, region, pos, apple_map=None, waste_map=None):
+    def closest_objective(self, region, pos, apple_map=None, waste_map=None, index=None):
         """
         Returns a tuple (u, d) where u is the distance to the closest apple above the position and d is the distance to the closest apple below the position.
+        Uses the sorted-position index when querying the live maps (or when an index for the given maps is passed), and
+        falls back to scanning the given maps otherwise.
         """
+        if index is None and apple_map is None and waste_map is None:
+            index = self.index
+        if index is not None:
+            positions = index.apples if region == CleanupRegion.APPLE else index.waste
+            return positions.above(pos), positions.below(pos)
+
         if apple_map is None:
             apple_map = self.apple_map
         if waste_map is None:
@@ -368,10 +578,16 @@ class OneDCleanupEnv(MultiAgentEnv):
         d = np.inf if len(d) == 0 else d[0] + 1
         return u, d
 
-    def closest_agents(self, region, pos, apple_map=None, waste_map=None):
+    def closest_agents(self, region, pos, apple_map=None, waste_map=None, index=None):
         """
         Returns a tuple (u, d) where u is the distance to the closest apple above the position and d is the distance to the closest apple below the position.
         """
+        if index is None and apple_map is None and waste_map is None:
+            index = self.index
+        if index is not None:
+            positions = index.apple_agents if region == CleanupRegion.APPLE else index.waste_agents
+            return positions.above(pos, inclusive=False), positions.below(pos)
+
         if apple_map is None:
             apple_map = self.apple_agent_map
         if waste_map is None:
@@ -388,64 +604,180 @@ class OneDCleanupEnv(MultiAgentEnv):
         d = np.inf if len(d) == 0 else d[0] + 1
         return u, d
 
+    def observe(self):
+        """
+        The observations of the current state, as step and reset return them for the observation_mode.
+        """
+        if self.observation_mode == "array":
+            return self.observe_arrays()
+        observations: dict[str, tuple] = {
+            'coordinator': (self.num_apples, self.num_dirt, self.num_pickers, self.num_cleaners),
+        }
+        observations.update(self.agent_observations())
+        return observations
+
+    def observe_arrays(self):
+        """
+        Writes the coordinator state (apples, dirt, pickers, cleaners) and the agent observations (row k for the k-th agent
+        of the agent table, as in agent_observations, with the sentinel in place of inf) into the preallocated buffers and
+        returns them as {"coordinator": ..., "agents": ...}.
+        The buffers are refilled in place every step: copy them to keep an observation. observation_tensors holds torch
+        tensors sharing their memory.
+        """
+        coordinator = self.coordinator_buffer
+        coordinator[0] = self.num_apples
+        coordinator[1] = self.num_dirt
+        coordinator[2] = self.num_pickers
+        coordinator[3] = self.num_cleaners
+
+        agents = self._agents
+        out = self.agent_buffer
+        if NUMBA_AVAILABLE:
+            observe_agents(self.apple_map, self.waste_map, self.apple_agent_map, self.waste_agent_map, agents.pos, agents.region, out)
+        else:
+            in_apple = agents.region == CleanupRegion.APPLE.value
+            out[:, 0], out[:, 1] = self.index.closest_objectives(agents.pos, in_apple)
+            out[:, 2], out[:, 3] = self.index.closest_agents(agents.pos, in_apple)
+        np.minimum(out, self.sentinel, out=out)
+        return self.array_observations
+
+    def agent_observations(self):
+        """
+        Returns {agent_id: (objective_u, objective_d, agent_u, agent_d)} for every agent, computed for the whole agent
+        table at once from the sorted-position index.
+        """
+        agents = self._agents
+        in_apple = agents.region == CleanupRegion.APPLE.value
+        objective_u, objective_d = self.index.closest_objectives(agents.pos, in_apple)
+        agent_u, agent_d = self.index.closest_agents(agents.pos, in_apple)
+        return dict(zip(agents.ids, zip(objective_u.tolist(), objective_d.tolist(), agent_u.tolist(), agent_d.tolist())))
+
+    def greedy_plan(self):
+        """
+        The GreedyPlan of the current state, computed once per state_version and shared by every split asked for.
+        """
+        version, plan = self.cached_plan
+        if version != self.state_version:
+            agents = self._agents
+            apple_u, apple_d = self.index.apples.closest_many(agents.pos)
+            waste_u, waste_d = self.index.waste.closest_many(agents.pos)
+            plan = GreedyPlan(apple_u, apple_d, waste_u, waste_d, agents.region == CleanupRegion.APPLE.value)
+            self.cached_plan = (self.state_version, plan)
+        return plan
+
+    @profiled("get_greedy_assignments")
     def get_greedy_assignments(self, num_pickers: int, num_cleaners: int):
         """
         Returns a dictionary of greedy role assignments for each agent, where there are num_pickers pickers and num_cleaners cleaners.
         Assigns agents to the role that minimises their distance to the closest objective in that role.
         """
-        assignments = {}
-        agents = list(self._agents.values())
-        apple_ordering = sorted(agents, key=lambda agent: min(self.closest_objective(CleanupRegion.APPLE, agent.pos)))
-        waste_ordering = sorted(agents, key=lambda agent: min(self.closest_objective(CleanupRegion.WASTE, agent.pos)))
-        for i in range(num_pickers):
-            assignments[apple_ordering[i].agent_id] = CleanupRegion.APPLE
-            waste_ordering.remove(apple_ordering[i]) # remove the agent from the waste ordering so that it can't be assigned to both roles
-        for i in range(num_cleaners):
-            assignments[waste_ordering[i].agent_id] = CleanupRegion.WASTE
+        agents = self._agents
+        pickers, cleaners = self.greedy_plan().split(num_pickers, num_cleaners)
+
+        assignments = {agents.ids[k]: CleanupRegion.APPLE for k in pickers}
+        assignments.update((agents.ids[k], CleanupRegion.WASTE) for k in cleaners)
         return assignments
 
+    @profiled("get_greedy_assignments")
+    def get_greedy_roles(self, num_pickers: int, num_cleaners: int):
+        """
+        Array form of get_greedy_assignments: an int8 (N,) vector of CleanupRegion values, row k for the k-th agent of the
+        agent table, with 0 for agents given no role.
+        """
+        pickers, cleaners = self.greedy_plan().split(num_pickers, num_cleaners)
+        roles = np.zeros(len(self._agents), dtype=np.int8)
+        roles[pickers] = CleanupRegion.APPLE.value
+        roles[cleaners] = CleanupRegion.WASTE.value
+        return roles
+
+    @profiled("get_greedy_actions")
     def get_greedy_actions(self, roles: dict[str, CleanupRegion]):
         """
         Returns a dictionary of greedy actions for each agent.
         """
-        actions = {}
-        for id in self.get_agent_ids():
-            agent = self._agents[id]
-            role = roles[id]
-            closest_objective = self.closest_objective(agent.region, agent.pos)
-            closest_agents = self.closest_agents(agent.region, agent.pos)
-            if closest_objective[0] >= closest_objective[1]:
-                direction = 1
-            else:
-                direction = -1
+        agents = self._agents
+        directions = self.greedy_plan().directions.tolist()
+        return {id: (roles[id], direction) for id, direction in zip(agents.ids, directions)}
 
-            actions[id] = (role, direction)
+    @profiled("get_greedy_actions")
+    def get_greedy_action_arrays(self, roles: np.ndarray):
+        """
+        Array form of get_greedy_actions for a role vector from get_greedy_roles. Returns (regions, directions), int8 (N,)
+        vectors that step takes as they are; agents given no role keep their region.
+        """
+        regions = np.where(roles != 0, roles, self._agents.region)
+        return regions, self.greedy_plan().directions.copy()
 
-        return actions
+    @profiled("evaluate_role_splits")
+    def evaluate_role_splits(self):
+        """
+        Simulate the greedy step for every split of the agents into pickers and cleaners in one vectorised pass.
+        Row i corresponds to i cleaners and num_agents - i pickers, assigned with get_greedy_assignments and moved with
+        get_greedy_actions, as if simulate_step had been called for each split.
+        Returns a tuple (next_states, rewards) where next_states is a (num_agents + 1, 4) array of coordinator observations
+        and rewards is a (num_agents + 1,) array of immediate rewards.
+        When use_randomness is set, the number of spawned apples and waste is sampled independently per split.
+        """
+        agents = self._agents
+        num_agents = len(agents)
+        num_splits = num_agents + 1
+
+        # the orderings and directions only depend on the current state, so they are shared by all splits
+        apple_rank = self.greedy_plan().apple_rank
+        num_pickers = num_agents - np.arange(num_splits)
+        roles = np.where(apple_rank[None, :] < num_pickers[:, None], CleanupRegion.APPLE.value, CleanupRegion.WASTE.value)
+        directions = self.greedy_plan().directions.astype(np.int64)
+
+        apple_map = np.tile(self.apple_map != 0, (num_splits, 1))
+        waste_map = np.tile(self.waste_map != 0, (num_splits, 1))
+        apple_agent_map = np.tile(self.apple_agent_map.astype(np.int64), (num_splits, 1))
+        waste_agent_map = np.tile(self.waste_agent_map.astype(np.int64), (num_splits, 1))
+        pos = np.tile(agents.pos, (num_splits, 1))
+        region = np.tile(agents.region.astype(np.int64), (num_splits, 1))
+        agent_ids = np.array([int(id) for id in agents.ids])
+
+        apples_consumed, dirt_consumed, num_pickers, num_cleaners = batched_perform_moves(apple_map, waste_map, apple_agent_map, waste_agent_map, pos, region, agent_ids, roles, np.broadcast_to(directions, pos.shape))
+        rewards = apples_consumed.sum(axis=1)
+        num_apples = self.num_apples - rewards
+        num_dirt = self.num_dirt - dirt_consumed.sum(axis=1)
+
+        num_apples_spawned = np.zeros(num_splits, dtype=np.int64)
+        num_waste_spawned = np.zeros(num_splits, dtype=np.int64)
+        free_apple = (~apple_map & (apple_agent_map == 0)).sum(axis=1)
+        free_waste = (~waste_map & (waste_agent_map == 0)).sum(axis=1)
+        for i in range(num_splits):
+            current_apple_spawn_prob, current_waste_spawn_prob = self.compute_probabilities(num_dirt[i])
+            if self.use_randomness:
+                num_apples_spawned[i] = self.np_random.binomial(free_apple[i], current_apple_spawn_prob)
+                if num_dirt[i] + num_cleaners[i] < self.potential_waste_area and free_waste[i] > 0:
+                    num_waste_spawned[i] = self.np_random.random() < current_waste_spawn_prob
+            else:
+                num_apples_spawned[i] = min(int(current_apple_spawn_prob * (self.potential_apple_area - num_apples[i] - num_pickers[i])), free_apple[i])
+                num_waste_spawned[i] = num_dirt[i] + num_cleaners[i] < self.potential_waste_area and free_waste[i] > 0
 
+        next_states = np.stack([num_apples + num_apples_spawned, num_dirt + num_waste_spawned, num_pickers, num_cleaners], axis=1)
+        return next_states, rewards
+
+    @profiled("simulate_step")
     def simulate_step(self, actions: dict[str, tuple[CleanupRegion, int]]):
         """
         Simulate the future state of the environment after all agents perform their actions.
         Returns a tuple (observations, rewards) where observations is a dictionary of agent observations and rewards is a dictionary of agent rewards in the hypothetical future state.
+        The step is applied to the live state while recording an undo journal, and rolled back before returning.
         """
-        # copy maps so that we can update it without affecting the originals to simulate the future state
-        apple_map = copy.deepcopy(self.apple_map)
-        waste_map = copy.deepcopy(self.waste_map)
-        apple_agent_map = copy.deepcopy(self.apple_agent_map)
-        waste_agent_map = copy.deepcopy(self.waste_agent_map)
-        agents = copy.deepcopy(self._agents)
-        num_pickers = 0
-        num_cleaners = 0
-
-        rewards, num_apples, num_dirt, num_pickers, num_cleaners = self.perform_step(actions, agents, apple_map, waste_map, apple_agent_map, waste_agent_map)
-        observations = {
-            'coordinator': (num_apples, num_dirt, num_pickers, num_cleaners),
-        }
-        for id in self.get_agent_ids():
-            agent = agents[id]
-            closest_objective = self.closest_objective(agent.region, agent.pos, apple_map=apple_map, waste_map=waste_map)
-            closest_agents = self.closest_agents(agent.region, agent.pos, apple_map=apple_agent_map, waste_map=waste_agent_map)
-            observations[id] = (closest_objective[0], closest_objective[1], closest_agents[0], closest_agents[1])
+        self.journal = StepJournal()
+        version = self.state_version
+        try:
+            rewards, num_apples, num_dirt, num_pickers, num_cleaners = self.perform_step(actions)
+            observations = {
+                'coordinator': (num_apples, num_dirt, num_pickers, num_cleaners),
+            }
+            observations.update(self.agent_observations())
+        finally:
+            self.journal.rollback()
+            self.journal = None
+            # the state is the one before the step again
+            self.state_version = version
 
         return observations, rewards
 
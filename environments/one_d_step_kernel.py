@@ -0,0 +1,326 @@
+import math
+
+import numpy as np
+
+from environments.position_index import PositionIndex
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # without numba the kernels run as plain Python over the same arrays
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+APPLE = 1
+WASTE = -1
+
+
+@njit(cache=True)
+def compute_probabilities(num_dirt, area, thresholdDepletion, thresholdRestoration, starting_apple_spawn_prob, starting_waste_spawn_prob):
+    """
+    OneDCleanupEnv.compute_probabilities. Returns (apple_spawn_prob, waste_spawn_prob).
+    """
+    waste_density = 0.0
+    if area > 0:
+        waste_density = num_dirt / area
+    if waste_density >= thresholdDepletion:
+        return 0.0, 0.0
+    if waste_density <= thresholdRestoration:
+        return starting_apple_spawn_prob, starting_waste_spawn_prob
+    return (1 - (waste_density - thresholdRestoration) / (thresholdDepletion - thresholdRestoration)) * starting_apple_spawn_prob, starting_waste_spawn_prob
+
+
+@njit(cache=True)
+def closest(occupancy, pos, inclusive):
+    """
+    Returns (u, d): the distance from pos to the closest non-zero cell above it (pos itself included if inclusive) and
+    strictly below it, or inf.
+    """
+    u = np.inf
+    i = pos if inclusive else pos - 1
+    while i >= 0:
+        if occupancy[i] != 0:
+            u = pos - i
+            break
+        i -= 1
+    d = np.inf
+    i = pos + 1
+    while i < len(occupancy):
+        if occupancy[i] != 0:
+            d = i - pos
+            break
+        i += 1
+    return u, d
+
+
+@njit(cache=True)
+def observe_agents(apple_map, waste_map, apple_agent_map, waste_agent_map, pos, region, out):
+    """
+    Fills out (N, 4) with OneDCleanupEnv agent observations: closest objective (u, d) and closest agent (u, d) in each
+    agent's region.
+    """
+    for k in range(len(pos)):
+        if region[k] == APPLE:
+            out[k, 0], out[k, 1] = closest(apple_map, pos[k], True)
+            out[k, 2], out[k, 3] = closest(apple_agent_map, pos[k], False)
+        else:
+            out[k, 0], out[k, 1] = closest(waste_map, pos[k], True)
+            out[k, 2], out[k, 3] = closest(waste_agent_map, pos[k], False)
+
+
+@njit(cache=True)
+def greedy_roles(apple_map, waste_map, pos, num_pickers, num_cleaners, roles):
+    """
+    OneDCleanupEnv.get_greedy_assignments: fills roles (N,) with APPLE for the num_pickers agents closest to an apple,
+    WASTE for the next num_cleaners agents closest to waste, and 0 for anyone left over.
+    """
+    num_agents = len(pos)
+    apple_dist = np.empty(num_agents)
+    waste_dist = np.empty(num_agents)
+    for k in range(num_agents):
+        u, d = closest(apple_map, pos[k], True)
+        apple_dist[k] = min(u, d)
+        u, d = closest(waste_map, pos[k], True)
+        waste_dist[k] = min(u, d)
+    roles[:] = 0
+    apple_order = np.argsort(apple_dist, kind="mergesort")
+    for i in range(min(num_pickers, num_agents)):
+        roles[apple_order[i]] = APPLE
+    waste_order = np.argsort(waste_dist, kind="mergesort")
+    assigned = 0
+    for i in range(num_agents):
+        if assigned >= num_cleaners:
+            break
+        if roles[waste_order[i]] == 0:
+            roles[waste_order[i]] = WASTE
+            assigned += 1
+
+
+@njit(cache=True)
+def greedy_directions(apple_map, waste_map, pos, region, directions):
+    """
+    OneDCleanupEnv.get_greedy_actions: move up (+1) unless the closest objective in the agent's region is strictly below.
+    """
+    for k in range(len(pos)):
+        u, d = closest(apple_map if region[k] == APPLE else waste_map, pos[k], True)
+        directions[k] = 1 if u >= d else -1
+
+
+@njit(cache=True)
+def set_free(cells, slots, sizes, area, x, free):
+    """
+    FreeCells.set on row area (0 for apples, 1 for waste) of the (2, area) cells and slots arrays and the (2,) sizes.
+    """
+    slot = slots[area, x]
+    if free and slot < 0:
+        cells[area, sizes[area]] = x
+        slots[area, x] = sizes[area]
+        sizes[area] += 1
+    elif not free and slot >= 0:
+        sizes[area] -= 1
+        last = cells[area, sizes[area]]
+        cells[area, slot] = last
+        slots[area, last] = slot
+        slots[area, x] = -1
+
+
+@njit(cache=True)
+def refresh_free(occupancy, agent_map, cells, slots, sizes, area, x):
+    """
+    Update the free cells after a write to cell x of occupancy or agent_map, as PositionIndex.set does.
+    """
+    set_free(cells, slots, sizes, area, x, not occupancy[x] and agent_map[x] == 0)
+
+
+@njit(cache=True)
+def perform_moves(apple_map, waste_map, apple_agent_map, waste_agent_map, cells, slots, sizes, pos, region, agent_ids, action_regions, directions, rewards):
+    """
+    The movement part of OneDCleanupEnv.perform_step (switch_region / move_agent for each agent in order), applied in
+    place together with the free cells. Fills rewards (N,) and returns (apples_consumed, dirt_consumed, num_pickers,
+    num_cleaners).
+    """
+    area = len(apple_map)
+    apples_consumed = 0
+    dirt_consumed = 0
+    num_pickers = 0
+    num_cleaners = 0
+    for k in range(len(pos)):
+        p = pos[k]
+        apple = 0
+        dirt = 0
+        if action_regions[k] != region[k]:
+            # switch_region
+            if action_regions[k] == APPLE:
+                if apple_agent_map[p] == 0:
+                    apple_agent_map[p] = agent_ids[k]
+                    refresh_free(apple_map, apple_agent_map, cells, slots, sizes, 0, p)
+                    waste_agent_map[p] = 0
+                    refresh_free(waste_map, waste_agent_map, cells, slots, sizes, 1, p)
+                    region[k] = APPLE
+                    if apple_map[p]:
+                        apple_map[p] = False
+                        refresh_free(apple_map, apple_agent_map, cells, slots, sizes, 0, p)
+                        apple = 1
+            else:
+                if waste_agent_map[p] == 0:
+                    apple_agent_map[p] = 0
+                    refresh_free(apple_map, apple_agent_map, cells, slots, sizes, 0, p)
+                    waste_agent_map[p] = agent_ids[k]
+                    refresh_free(waste_map, waste_agent_map, cells, slots, sizes, 1, p)
+                    region[k] = WASTE
+                    if waste_map[p]:
+                        waste_map[p] = False
+                        refresh_free(waste_map, waste_agent_map, cells, slots, sizes, 1, p)
+                        dirt = 1
+            if region[k] == APPLE:
+                num_pickers += 1
+            else:
+                num_cleaners += 1
+        else:
+            # move_agent
+            in_apple = region[k] == APPLE
+            if in_apple:
+                num_pickers += 1
+            else:
+                num_cleaners += 1
+            occupancy = apple_map if in_apple else waste_map
+            agent_map = apple_agent_map if in_apple else waste_agent_map
+            free_area = 0 if in_apple else 1
+            new_pos = p + directions[k]
+            if 0 <= new_pos < area and agent_map[new_pos] == 0:
+                agent_map[new_pos] = agent_ids[k]
+                refresh_free(occupancy, agent_map, cells, slots, sizes, free_area, new_pos)
+                agent_map[p] = 0
+                refresh_free(occupancy, agent_map, cells, slots, sizes, free_area, p)
+                pos[k] = new_pos
+                if occupancy[new_pos]:
+                    occupancy[new_pos] = False
+                    refresh_free(occupancy, agent_map, cells, slots, sizes, free_area, new_pos)
+                    if in_apple:
+                        apple = 1
+                    else:
+                        dirt = 1
+        rewards[k] = apple
+        apples_consumed += apple
+        dirt_consumed += dirt
+    return apples_consumed, dirt_consumed, num_pickers, num_cleaners
+
+
+@njit(cache=True)
+def spawn(apple_map, waste_map, apple_agent_map, waste_agent_map, cells, slots, sizes, rng, num_apples, num_dirt, num_pickers, num_cleaners, apple_spawn_prob, waste_spawn_prob, use_randomness):
+    """
+    OneDCleanupEnv.spawn_apples_and_waste (use_randomness) or deterministic_spawn_apples_and_waste, drawing the same
+    numbers from the np.random.Generator rng and picking from the free cells in the same order. Returns
+    (num_apples_spawned, num_waste_spawned), the numbers actually spawned.
+    """
+    area = len(apple_map)
+    num_apples_spawned = 0
+    if use_randomness:
+        if apple_spawn_prob > 0:
+            log_q = math.log1p(-apple_spawn_prob) if apple_spawn_prob < 1 else -math.inf
+            i = sizes[0]
+            while True:
+                gap = math.log(1.0 - rng.random()) / log_q
+                if gap >= i:
+                    break
+                i -= 1 + int(gap)
+                x = cells[0, i]
+                apple_map[x] = True
+                refresh_free(apple_map, apple_agent_map, cells, slots, sizes, 0, x)
+                num_apples_spawned += 1
+    else:
+        num_apples_spawned = min(max(int(apple_spawn_prob * (area - num_apples - num_pickers)), 0), sizes[0])
+        for _ in range(num_apples_spawned):
+            x = cells[0, int(rng.random() * sizes[0])]
+            apple_map[x] = True
+            refresh_free(apple_map, apple_agent_map, cells, slots, sizes, 0, x)
+
+    if num_dirt + num_cleaners >= area:
+        return num_apples_spawned, 0
+    if use_randomness and rng.random() >= waste_spawn_prob:
+        return num_apples_spawned, 0
+    if sizes[1] == 0:
+        return num_apples_spawned, 0
+    x = cells[1, int(rng.random() * sizes[1])]
+    waste_map[x] = True
+    refresh_free(waste_map, waste_agent_map, cells, slots, sizes, 1, x)
+    return num_apples_spawned, 1
+
+
+@njit(cache=True)
+def heuristic_episode_kernel(apple_map, waste_map, apple_agent_map, waste_agent_map, cells, slots, sizes, pos, region, agent_ids, rng, num_apples, num_dirt, thresholdDepletion, thresholdRestoration, starting_apple_spawn_prob, starting_waste_spawn_prob, use_randomness, trajectory):
+    """
+    Runs len(trajectory) steps of the dirt-ratio heuristic with greedy assignments and actions, in place, drawing from
+    rng. Row t of trajectory receives (state, reward, next_state) as in agents.rollout; returns the final
+    (num_apples, num_dirt, num_pickers, num_cleaners, total_reward).
+    """
+    num_agents = len(pos)
+    area = len(apple_map)
+    roles = np.zeros(num_agents, dtype=np.int8)
+    directions = np.zeros(num_agents, dtype=np.int64)
+    rewards = np.zeros(num_agents, dtype=np.int64)
+    num_pickers = 0
+    num_cleaners = num_agents
+    total_reward = 0
+    for t in range(len(trajectory)):
+        trajectory[t, 0] = num_apples
+        trajectory[t, 1] = num_dirt
+        trajectory[t, 2] = num_pickers
+        trajectory[t, 3] = num_cleaners
+
+        num_cleaner = round(num_agents * (num_dirt / (num_apples + num_dirt)))
+        greedy_roles(apple_map, waste_map, pos, num_agents - num_cleaner, num_cleaner, roles)
+        greedy_directions(apple_map, waste_map, pos, region, directions)
+        apples_consumed, dirt_consumed, num_pickers, num_cleaners = perform_moves(apple_map, waste_map, apple_agent_map, waste_agent_map, cells, slots, sizes, pos, region, agent_ids, roles, directions, rewards)
+        num_apples -= apples_consumed
+        num_dirt -= dirt_consumed
+
+        apple_spawn_prob, waste_spawn_prob = compute_probabilities(num_dirt, area, thresholdDepletion, thresholdRestoration, starting_apple_spawn_prob, starting_waste_spawn_prob)
+        num_apples_spawned, num_waste_spawned = spawn(apple_map, waste_map, apple_agent_map, waste_agent_map, cells, slots, sizes, rng, num_apples, num_dirt, num_pickers, num_cleaners, apple_spawn_prob, waste_spawn_prob, use_randomness)
+        num_apples += num_apples_spawned
+        num_dirt += num_waste_spawned
+        total_reward += apples_consumed
+
+        trajectory[t, 4] = apples_consumed
+        trajectory[t, 5] = num_apples
+        trajectory[t, 6] = num_dirt
+        trajectory[t, 7] = num_pickers
+        trajectory[t, 8] = num_cleaners
+    return num_apples, num_dirt, num_pickers, num_cleaners, total_reward
+
+
+def heuristic_episode(env, num_steps):
+    """
+    Runs num_steps steps of the dirt-ratio heuristic (as in heuristic_script.py) on a freshly reset OneDCleanupEnv with
+    the compiled kernels, drawing the same random numbers from env.np_random as env.step would (numba shares the
+    generator's state). The environment is left
+    in the final state.
+    Returns (trajectory, total_reward) where trajectory is (num_steps, 9) rows of (state, reward, next_state).
+    """
+    agents = env._agents
+    trajectory = np.zeros((num_steps, 9))
+    agent_ids = np.array([int(id) for id in agents.ids], dtype=np.int64)
+    free_apples, free_waste = env.index.free_apples, env.index.free_waste
+    cells = np.stack([free_apples.cells, free_waste.cells])
+    slots = np.stack([free_apples.slots, free_waste.slots])
+    sizes = np.array([free_apples.size, free_waste.size], dtype=np.int64)
+    num_apples, num_dirt, num_pickers, num_cleaners, total_reward = heuristic_episode_kernel(
+        env.apple_map, env.waste_map, env.apple_agent_map, env.waste_agent_map, cells, slots, sizes, agents.pos, agents.region, agent_ids,
+        env.np_random, env.num_apples, env.num_dirt, float(env.thresholdDepletion), float(env.thresholdRestoration),
+        float(env.starting_apple_spawn_prob), float(env.starting_waste_spawn_prob), env.use_randomness, trajectory)
+
+    env.num_apples, env.num_dirt, env.num_pickers, env.num_cleaners = int(num_apples), int(num_dirt), int(num_pickers), int(num_cleaners)
+    env.timestamp += num_steps
+    env.step_reward = int(trajectory[-1, 4]) if num_steps else 0
+    env.total_apple_consumed += int(total_reward)
+    env.index = PositionIndex(env.apple_map, env.waste_map, env.apple_agent_map, env.waste_agent_map)
+    # the free cells keep the kernel's order, which later spawns depend on, rather than the rebuilt index's
+    env.index.free_apples.restore((cells[0], slots[0], sizes[0]))
+    env.index.free_waste.restore((cells[1], slots[1], sizes[1]))
+    env.state_version = next(env.state_versions)
+    return trajectory, total_reward
@@ -0,0 +1,230 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+class SortedPositions:
+    """
+    Sorted list of the occupied positions of a 1-D map.
+    Answers "closest occupied cell above / below" queries in O(log n) with bisect.
+    """
+
+    def __init__(self, positions=()):
+        self.positions = sorted(int(p) for p in positions)
+        # closest_many's search array, built on first use after a change
+        self.padded = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, pos):
+        i = bisect_left(self.positions, pos)
+        return i < len(self.positions) and self.positions[i] == pos
+
+    def add(self, pos):
+        i = bisect_left(self.positions, pos)
+        if i == len(self.positions) or self.positions[i] != pos:
+            self.positions.insert(i, int(pos))
+            self.padded = None
+
+    def discard(self, pos):
+        i = bisect_left(self.positions, pos)
+        if i < len(self.positions) and self.positions[i] == pos:
+            del self.positions[i]
+            self.padded = None
+
+    def set(self, pos, occupied):
+        if occupied:
+            self.add(pos)
+        else:
+            self.discard(pos)
+
+    def above(self, pos, inclusive=True):
+        """
+        Returns the distance from pos to the closest occupied position above it (pos itself included if inclusive), or np.inf.
+        """
+        i = bisect_right(self.positions, pos) if inclusive else bisect_left(self.positions, pos)
+        return pos - self.positions[i - 1] if i > 0 else np.inf
+
+    def below(self, pos):
+        """
+        Returns the distance from pos to the closest occupied position strictly below it, or np.inf.
+        """
+        i = bisect_right(self.positions, pos)
+        return self.positions[i] - pos if i < len(self.positions) else np.inf
+
+    def closest_many(self, pos, inclusive=True):
+        """
+        Vectorised (above(pos, inclusive), below(pos)) for an array of positions.
+        """
+        pos = np.asarray(pos)
+        if self.padded is None:
+            # filling from an int64 array is several times faster than np.array on the mixed list for long lists
+            self.padded = np.empty(len(self.positions) + 2)
+            self.padded[0], self.padded[-1] = -np.inf, np.inf
+            self.padded[1:-1] = np.fromiter(self.positions, np.int64, len(self.positions))
+        padded = self.padded
+        below = np.searchsorted(padded, pos, side='right')
+        above = below - 1 if inclusive else np.searchsorted(padded, pos, side='left') - 1
+        return pos - padded[above], padded[below] - pos
+
+
+class FreeCells:
+    """
+    Set of the free cells (no object, no agent) of one area of a 1-D map, as a swap-remove array: the members sit in no
+    particular order in cells[:size] and slots[x] is the place of x there, or -1. Adding, removing and picking the k-th
+    member are O(1), so spawning does not have to scan the area for free cells.
+    """
+
+    def __init__(self, area, cells=()):
+        cells = np.asarray(cells, dtype=np.int64)
+        self.cells = np.zeros(area, dtype=np.int64)
+        self.slots = np.full(area, -1, dtype=np.int64)
+        self.size = len(cells)
+        self.cells[:self.size] = cells
+        self.slots[cells] = np.arange(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, pos):
+        return self.slots.item(pos) >= 0
+
+    def members(self):
+        """
+        The free cells in set order, as a view that changes with the set.
+        """
+        return self.cells[:self.size]
+
+    def add(self, pos):
+        if self.slots.item(pos) < 0:
+            self.cells[self.size] = pos
+            self.slots[pos] = self.size
+            self.size += 1
+
+    def discard(self, pos):
+        slot = self.slots.item(pos)
+        if slot >= 0:
+            self.size -= 1
+            last = self.cells.item(self.size)
+            self.cells[slot] = last
+            self.slots[last] = slot
+            self.slots[pos] = -1
+
+    def set(self, pos, free):
+        if free:
+            self.add(pos)
+        else:
+            self.discard(pos)
+
+    def snapshot(self):
+        return self.cells.copy(), self.slots.copy(), self.size
+
+    def restore(self, snapshot):
+        cells, slots, size = snapshot
+        self.cells[:] = cells
+        self.slots[:] = slots
+        self.size = int(size)
+
+
+class PositionIndex:
+    """
+    Sorted-position indices over the four maps of a OneDCleanupEnv, and the free cells of each area, kept in sync by the
+    environment as cells change. len(apples) and len(waste) are the number of apples and dirt on the maps.
+    """
+
+    def __init__(self, apple_map, waste_map, apple_agent_map, waste_agent_map):
+        self.apples = SortedPositions(np.flatnonzero(apple_map))
+        self.waste = SortedPositions(np.flatnonzero(waste_map))
+        self.apple_agents = SortedPositions(np.flatnonzero(apple_agent_map))
+        self.waste_agents = SortedPositions(np.flatnonzero(waste_agent_map))
+        self.free_apples = FreeCells(len(apple_map), np.flatnonzero((apple_map == 0) & (apple_agent_map == 0)))
+        self.free_waste = FreeCells(len(waste_map), np.flatnonzero((waste_map == 0) & (waste_agent_map == 0)))
+        # name -> (positions, free cells of its area, the area's object and agent maps)
+        self.entries = {
+            'apples': (self.apples, self.free_apples, apple_map, apple_agent_map),
+            'apple_agents': (self.apple_agents, self.free_apples, apple_map, apple_agent_map),
+            'waste': (self.waste, self.free_waste, waste_map, waste_agent_map),
+            'waste_agents': (self.waste_agents, self.free_waste, waste_map, waste_agent_map),
+        }
+
+    def set(self, name, pos, occupied):
+        """
+        Mark pos as occupied or not in the named positions (apples, waste, apple_agents or waste_agents), once the cell
+        has been written, and update the free cells of its area.
+        """
+        positions, free, map, agent_map = self.entries[name]
+        positions.set(pos, occupied)
+        if map.item(pos) or agent_map.item(pos):
+            free.discard(pos)
+        else:
+            free.add(pos)
+
+    def closest_objectives(self, pos, in_apple):
+        """
+        Vectorised OneDCleanupEnv.closest_objective: (u, d) arrays for agents at pos, in the apple area where in_apple is set.
+        """
+        apple_u, apple_d = self.apples.closest_many(pos)
+        waste_u, waste_d = self.waste.closest_many(pos)
+        return np.where(in_apple, apple_u, waste_u), np.where(in_apple, apple_d, waste_d)
+
+    def closest_agents(self, pos, in_apple):
+        """
+        Vectorised OneDCleanupEnv.closest_agents: (u, d) arrays for agents at pos, in the apple area where in_apple is set.
+        """
+        apple_u, apple_d = self.apple_agents.closest_many(pos, inclusive=False)
+        waste_u, waste_d = self.waste_agents.closest_many(pos, inclusive=False)
+        return np.where(in_apple, apple_u, waste_u), np.where(in_apple, apple_d, waste_d)
+
+
+class SortedGridPositions:
+    """
+    Occupied cells of a 2-D grid, kept as one SortedPositions per row.
+    nearest() searches rows outward from the query row and stops once the row offset alone exceeds the best Manhattan
+    distance found, so a query costs O(rows searched * log width) instead of a scan of the whole grid.
+    """
+
+    def __init__(self, mask):
+        self.rows = [SortedPositions(np.flatnonzero(row)) for row in mask]
+
+    def __len__(self):
+        return sum(len(row) for row in self.rows)
+
+    def set(self, i, j, occupied):
+        self.rows[i].set(j, occupied)
+
+    def nearest(self, x, y):
+        """
+        Returns ([i, j], distance) for the occupied cell closest to (x, y) in Manhattan distance, or ([-1, -1], inf).
+        Ties go to the last such cell in row-major order, as in a full scan with <=.
+        """
+        x, y = int(x), int(y)
+        best_distance, best = float('inf'), [-1, -1]
+        for offset in range(max(x, len(self.rows) - 1 - x) + 1):
+            if offset > best_distance:
+                break
+            for i in ((x + offset, x - offset) if offset else (x,)):
+                if i < 0 or i >= len(self.rows) or len(self.rows[i]) == 0:
+                    continue
+                left, right = self.rows[i].above(y), self.rows[i].below(y)
+                j, distance = (y + right, offset + right) if right <= left else (y - left, offset + left)
+                if distance < best_distance or (distance == best_distance and i > best[0]):
+                    best_distance, best = distance, [i, j]
+        return best, best_distance
+
+
+class GridIndex:
+    """
+    Nearest-object indices over the map of a CleanupEnv (1 = apple, -1 = waste), kept in sync by the environment as
+    cells change.
+    """
+
+    def __init__(self, map):
+        self.apples = SortedGridPositions(map == 1)
+        self.waste = SortedGridPositions(map == -1)
+
+    def set(self, i, j, old, new):
+        if old == 1 or new == 1:
+            self.apples.set(i, j, new == 1)
+        if old == -1 or new == -1:
+            self.waste.set(i, j, new == -1)
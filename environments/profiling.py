@@ -0,0 +1,127 @@
+import functools
+import json
+import time
+
+
+class PhaseTimer:
+    """
+    Context manager adding the wall-clock time of its block to one named phase of a PhaseProfiler.
+    """
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class PhaseProfiler:
+    """
+    Named phase timers and event counters accumulated over an episode.
+    Environments and coordinators wrap each phase of their work in `with profiler.phase(name):` and count events with
+    profiler.count(name). end_episode returns the per-episode summary, appends it as one line to the JSONL file at path
+    (if given) and starts a new episode.
+    """
+    enabled = True
+
+    def __init__(self, path=None):
+        self.path = path
+        self.timers = {}
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.episode = 0
+
+    def phase(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = PhaseTimer(self, name)
+        return timer
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """
+        Returns {"episode", "phases": {name: {"calls", "total_s", "mean_us"}}, "counters": {name: count}} so far.
+        """
+        phases = {
+            name: {"calls": self.calls[name], "total_s": total, "mean_us": total / self.calls[name] * 1e6}
+            for name, total in self.times.items()
+        }
+        return {"episode": self.episode, "phases": phases, "counters": dict(self.counters)}
+
+    def end_episode(self, **extra):
+        """
+        Close the current episode. Returns its summary with extra merged in.
+        """
+        summary = self.summary()
+        summary.update(extra)
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.episode += 1
+        return summary
+
+
+class NullProfiler:
+    """
+    Stand-in used when profiling is off: phases are shared no-op context managers and nothing is recorded.
+    """
+    enabled = False
+
+    def phase(self, name):
+        return NULL_TIMER
+
+    def count(self, name, n=1):
+        pass
+
+    def summary(self):
+        return None
+
+    def end_episode(self, **extra):
+        return None
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def profiled(name):
+    """
+    Method decorator timing every call as the named phase of the instance's profiler attribute.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
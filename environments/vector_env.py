@@ -0,0 +1,161 @@
+import functools
+
+import gymnasium as gym
+import numpy as np
+from gymnasium.spaces import Box, Dict, Discrete, MultiBinary, MultiDiscrete
+
+from environments.cleanup_env import CleanupEnv
+from environments.one_d_cleanup_env import CleanupRegion, OneDCleanupEnv
+from environments.zero_d_cleanup_env import ZeroDCleanupEnv
+
+
+def agent_order(agent_ids):
+    """
+    The agent ids in the order of the rows of array actions and observations: numeric ids in numeric order.
+    """
+    agent_ids = list(agent_ids)
+    if all(agent_id.isdigit() for agent_id in agent_ids):
+        return sorted(agent_ids, key=int)
+    return sorted(agent_ids)
+
+
+class ZeroDCleanupArrayEnv(gym.Env):
+    """
+    ZeroDCleanupEnv as a single-agent gymnasium env with array observations and actions.
+    With control="coordinator" the action is the number of cleaners, the first agents in agent_order cleaning; with
+    control="agents" it is a (num_agents,) binary array, 1 for cleaning. The observation is (apples, dirt, pickers,
+    cleaners) and the reward is the step's apple reward.
+    """
+
+    def __init__(self, control="coordinator", num_agents=10, **env_kwargs):
+        env_kwargs.setdefault("agent_ids", [str(i) for i in range(num_agents)])
+        self.env = ZeroDCleanupEnv(num_agents=num_agents, **env_kwargs)
+        self.agent_ids = agent_order(self.env.get_agent_ids())
+        self.control = control
+        num_agents = len(self.agent_ids)
+        self.action_space = Discrete(num_agents + 1) if control == "coordinator" else MultiBinary(num_agents)
+        self.observation_space = Box(low=0, high=np.inf, shape=(4,), dtype=np.float32)
+
+    def reset(self, *, seed=None, options=None):
+        super().reset(seed=seed)
+        observations, info = self.env.reset(seed=seed)
+        return np.asarray(observations[self.agent_ids[0]], dtype=np.float32), info
+
+    def step(self, action):
+        if self.control == "coordinator":
+            num_cleaners = int(action)
+            actions = {agent_id: int(k < num_cleaners) for k, agent_id in enumerate(self.agent_ids)}
+        else:
+            actions = dict(zip(self.agent_ids, np.asarray(action).tolist()))
+        observations, reward, dones, truncateds, info = self.env.step(actions)
+        observation = np.asarray(observations[self.agent_ids[0]], dtype=np.float32)
+        return observation, float(reward), dones["__all__"], truncateds["__all__"], info
+
+
+class OneDCleanupArrayEnv(gym.Env):
+    """
+    OneDCleanupEnv as a single-agent gymnasium env with array observations and actions.
+    With control="coordinator" the action is the number of cleaners, and agents are assigned and moved greedily as in
+    u_script.py; with control="agents" it is a (num_agents, 2) array of (region, direction) rows in agent_order, region 0
+    for apples and 1 for waste, direction 0 for -1 and 1 for +1.
+    The observation is {"coordinator": (apples, dirt, pickers, cleaners), "agents": (num_agents, 4) rows of
+    (objective_u, objective_d, agent_u, agent_d)}, with inf where there is nothing in that direction. The reward is the
+    sum over agents; info["agent_rewards"] has them per agent.
+    """
+
+    regions = (CleanupRegion.APPLE, CleanupRegion.WASTE)
+
+    def __init__(self, control="coordinator", num_agents=10, **env_kwargs):
+        # agent maps hold int(agent_id) with 0 for an empty cell, so ids start at 1
+        env_kwargs.setdefault("agent_ids", [str(i + 1) for i in range(num_agents)])
+        env_kwargs.setdefault("info_maps", None)
+        env_kwargs.setdefault("sentinel", np.inf)
+        env_kwargs["observation_mode"] = "array"
+        self.env = OneDCleanupEnv(num_agents=num_agents, **env_kwargs)
+        self.agent_ids = agent_order(self.env.get_agent_ids())
+        # the env's buffers have a row per agent of its agent table; rows[k] is the one of agent_ids[k]
+        self.rows = np.array([self.env._agents.slots[agent_id] for agent_id in self.agent_ids])
+        self.control = control
+        num_agents = len(self.agent_ids)
+        if control == "coordinator":
+            self.action_space = Discrete(num_agents + 1)
+        else:
+            self.action_space = MultiDiscrete(np.full((num_agents, 2), 2))
+        self.observation_space = Dict({
+            "coordinator": Box(low=0, high=np.inf, shape=(4,), dtype=np.float32),
+            "agents": Box(low=0, high=np.inf, shape=(num_agents, 4), dtype=np.float32),
+        })
+
+    def observe(self, observations):
+        # copies, as the env refills its observation buffers on every step
+        return {"coordinator": observations["coordinator"].copy(), "agents": observations["agents"][self.rows]}
+
+    def reset(self, *, seed=None, options=None):
+        super().reset(seed=seed)
+        observations, info = self.env.reset(seed=seed)
+        return self.observe(observations), info
+
+    def step(self, action):
+        if self.control == "coordinator":
+            num_cleaners = int(action)
+            actions = self.env.get_greedy_action_arrays(self.env.get_greedy_roles(len(self.agent_ids) - num_cleaners, num_cleaners))
+        else:
+            actions = {agent_id: (self.regions[region], 2 * direction - 1) for agent_id, (region, direction) in zip(self.agent_ids, np.asarray(action).tolist())}
+        observations, rewards, dones, truncateds, info = self.env.step(actions)
+        agent_rewards = np.array([rewards[agent_id] for agent_id in self.agent_ids], dtype=np.float32)
+        info["agent_rewards"] = agent_rewards
+        return self.observe(observations), float(agent_rewards.sum()), dones["__all__"], truncateds["__all__"], info
+
+
+class CleanupArrayEnv(gym.Env):
+    """
+    CleanupEnv as a single-agent gymnasium env with array observations and actions.
+    With control="agents" the action is a (num_agents,) array of moves (0 up, 1 right, 2 down, 3 left), agent k in row k;
+    with control="greedy" the action is ignored and every agent moves to its closest objective.
+    The observation is {"positions": (num_agents, 2), "map": (height, width)}. The reward is the sum over agents;
+    info["agent_rewards"] has them per agent.
+    """
+
+    def __init__(self, control="agents", **env_kwargs):
+        if control == "greedy":
+            env_kwargs["greedy"] = True
+        self.env = CleanupEnv(**env_kwargs)
+        self.agent_ids = agent_order(self.env.get_agent_ids())
+        self.control = control
+        num_agents = len(self.agent_ids)
+        self.action_space = Discrete(1) if control == "greedy" else MultiDiscrete(np.full(num_agents, 4))
+        self.observation_space = Dict({
+            "positions": Box(low=0, high=max(self.env.height, self.env.width) - 1, shape=(num_agents, 2), dtype=np.float32),
+            "map": Box(low=-1, high=1, shape=(self.env.height, self.env.width), dtype=np.float32),
+        })
+
+    def observe(self):
+        return {"positions": self.env.agents.pos.astype(np.float32), "map": self.env.map.astype(np.float32)}
+
+    def reset(self, *, seed=None, options=None):
+        super().reset(seed=seed)
+        _, info = self.env.reset(seed=seed, options=options)
+        return self.observe(), info
+
+    def step(self, action):
+        if self.control == "greedy":
+            actions = self.env.greedily_move_to_closest_object()
+        else:
+            actions = dict(zip(self.agent_ids, np.asarray(action).tolist()))
+        _, rewards, dones, truncateds, info = self.env.step(actions)
+        agent_rewards = np.array([rewards[agent_id] for agent_id in self.agent_ids], dtype=np.float32)
+        info["agent_rewards"] = agent_rewards
+        return self.observe(), float(agent_rewards.sum()), dones["__all__"], truncateds["__all__"], info
+
+
+def make_vector_env(env_cls, num_envs, asynchronous=False, **env_kwargs):
+    """
+    A gymnasium vector env of num_envs copies of one of the array envs above, built with env_kwargs.
+    Sub-environments reset themselves when their episode ends (the last observation and info go to
+    info["final_observation"] and info["final_info"]); reset(seed=s) seeds copy i with s + i. asynchronous runs every
+    copy in its own process.
+    """
+    env_fns = [functools.partial(env_cls, **env_kwargs)] * num_envs
+    if asynchronous:
+        return gym.vector.AsyncVectorEnv(env_fns)
+    return gym.vector.SyncVectorEnv(env_fns)
@@ -2,9 +2,72 @@ from ray.rllib.env import MultiAgentEnv
 
 import numpy as np
 import torch
-from scipy.special import comb
+from scipy.special import gammaln
 
 import random
+from functools import lru_cache
+
+from environments.profiling import NULL_PROFILER
+
+
+@lru_cache(maxsize=None)
+def log_factorial_table(area):
+    """
+    Returns log(n!) for n = 0..area, computed once per area.
+    """
+    table = gammaln(np.arange(area + 1) + 1.0)
+    table.flags.writeable = False
+    return table
+
+
+def log_factorial(x, area):
+    """
+    log(x!) elementwise. Integral x in [0, area] is looked up in the table; anything else (the 0-D counts are expected
+    values and need not be integers) falls back to gammaln.
+    """
+    table = log_factorial_table(area)
+    x = np.asarray(x, dtype=np.float64)
+    index = np.clip(np.rint(x), 0, area).astype(np.int64)
+    result = table[index]
+    off_table = x != index
+    if np.any(off_table):
+        result = np.where(off_table, gammaln(np.where(off_table, x, 0.0) + 1.0), result)
+    return result
+
+
+def log_comb(n, k, area):
+    """
+    log of the binomial coefficient C(n, k), elementwise, with -inf wherever scipy.special.comb would return 0.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    k = np.asarray(k, dtype=np.float64)
+    valid = (k >= 0) & (k <= n) & (n >= 0)
+    n_safe, k_safe = np.where(valid, n, 0.0), np.where(valid, k, 0.0)
+    result = log_factorial(n_safe, area) - log_factorial(k_safe, area) - log_factorial(n_safe - k_safe, area)
+    return np.where(valid, result, -np.inf)
+
+
+def transition_matrix(area, s0, candidate_s1s):
+    """
+    Hypergeometric probabilities of moving from state s0 to each of the candidate states, in one call.
+    s0 is (apples, dirt, ...) and candidate_s1s is (K, 4) of (apples, dirt, pickers, cleaners); returns a (K,) array.
+    Computed in log space, so it stays finite for large areas.
+    """
+    s1 = np.atleast_2d(np.asarray(candidate_s1s, dtype=np.float64))
+    apples, dirt = float(s0[0]), float(s0[1])
+    delta_a = apples - s1[:, 0]
+    delta_d = dirt - s1[:, 1]
+    log_p1 = log_comb(apples, delta_a, area) + log_comb(area - apples, s1[:, 2] - delta_a, area) - log_comb(area, s1[:, 2], area)
+    log_p2 = log_comb(dirt, delta_d, area) + log_comb(area - dirt, s1[:, 3] - delta_d, area) - log_comb(area, s1[:, 3], area)
+    return np.exp(log_p1 + log_p2)
+
+
+@lru_cache(maxsize=65536)
+def cached_transition_P(area, s0, s1):
+    """
+    transition_matrix for a single (s0, s1) pair given as tuples, memoised for planners that revisit the same pairs.
+    """
+    return float(transition_matrix(area, s0, [s1])[0])
 
 class ZeroDCleanupEnv(MultiAgentEnv):
     """
@@ -15,9 +78,11 @@ class ZeroDCleanupEnv(MultiAgentEnv):
     amount of dirt cleaned or apples picked is determined probabilistically.
     """
 
-    def __init__(self, agent_ids, num_agents=10, area=150, thresholdDepletion: float=0.4, thresholdRestoration: float=0, wasteSpawnProbability: float=0.5, appleRespawnProbability: float=0.05, dirt_multiplier=10, use_heuristic=False):
+    def __init__(self, agent_ids, num_agents=10, area=150, thresholdDepletion: float=0.4, thresholdRestoration: float=0, wasteSpawnProbability: float=0.5, appleRespawnProbability: float=0.05, dirt_multiplier=10, use_heuristic=False, profiler=None):
         """
         Initialise the environment.
+        profiler is an optional environments.profiling.PhaseProfiler timing the phases of every step; its per-episode
+        summary is added to the info of the last step as info["profile"].
         """
         self._agent_ids = set(agent_ids)
         self.num_agents = num_agents
@@ -49,6 +114,7 @@ class ZeroDCleanupEnv(MultiAgentEnv):
         self.epoch = 0
         # self.total_reward_by_agent = {id: 0 for id in self.get_agent_ids()}
         self.use_heuristic = use_heuristic
+        self.profiler = NULL_PROFILER if profiler is None else profiler
 
     def reset(self, seed: int | None = None, options: dict = {}) -> tuple:
         """
@@ -56,6 +122,8 @@ class ZeroDCleanupEnv(MultiAgentEnv):
         """
         # Set seed
         super().reset(seed=seed)
+        if self.profiler.enabled and 0 < self.timestamp < 1000:
+            self.profiler.end_episode(timestamp=self.timestamp)
         self.timestamp = 0
 
         self.num_dirt = 78
@@ -95,29 +163,34 @@ class ZeroDCleanupEnv(MultiAgentEnv):
         
         self.timestamp += 1
         self.step_apple_consumed = 0
+        profiler = self.profiler
 
-        if self.use_heuristic:
-            agent_frequency_in_dirt = self.num_dirt / (self.num_apples + self.num_dirt)
-            num_agents_to_be_assigned_to_dirt = round(self.num_agents * agent_frequency_in_dirt)
-            agents = list(self.get_agent_ids())
-            apple_agents = agents[num_agents_to_be_assigned_to_dirt:]
-            dirt_agents = agents[:num_agents_to_be_assigned_to_dirt]
+        with profiler.phase("assign_roles"):
+            if self.use_heuristic:
+                agent_frequency_in_dirt = self.num_dirt / (self.num_apples + self.num_dirt)
+                num_agents_to_be_assigned_to_dirt = round(self.num_agents * agent_frequency_in_dirt)
+                agents = list(self.get_agent_ids())
+                apple_agents = agents[num_agents_to_be_assigned_to_dirt:]
+                dirt_agents = agents[:num_agents_to_be_assigned_to_dirt]
 
-        else:
-            apple_agents = [agent_id for agent_id in self.get_agent_ids() if action_dict[agent_id] == 0]
-            dirt_agents = [agent_id for agent_id in self.get_agent_ids() if action_dict[agent_id] == 1]
-
-        step_reward = self.step_reward_calculation(apple_agents)
-        total_reward = step_reward
-        self.step_apple_consumed = total_reward
-        self.total_apple_consumed += total_reward
-        self.step_dirt_calculation(dirt_agents)
-        self.compute_probabilities()
-        new_apple, new_dirt = self.spawn_apples_and_waste()
+            else:
+                apple_agents = [agent_id for agent_id in self.get_agent_ids() if action_dict[agent_id] == 0]
+                dirt_agents = [agent_id for agent_id in self.get_agent_ids() if action_dict[agent_id] == 1]
 
-        observations = {
-            id: np.array([self.num_apples, self.num_dirt, len(apple_agents), len(dirt_agents)]) for id in self.get_agent_ids()
-        }
+        with profiler.phase("consume"):
+            step_reward = self.step_reward_calculation(apple_agents)
+            total_reward = step_reward
+            self.step_apple_consumed = total_reward
+            self.total_apple_consumed += total_reward
+            self.step_dirt_calculation(dirt_agents)
+        with profiler.phase("spawn"):
+            self.compute_probabilities()
+            new_apple, new_dirt = self.spawn_apples_and_waste()
+
+        with profiler.phase("observe"):
+            observations = {
+                id: np.array([self.num_apples, self.num_dirt, len(apple_agents), len(dirt_agents)]) for id in self.get_agent_ids()
+            }
         rewards = step_reward
         dones["__all__"] = self.timestamp == 1000
 
@@ -130,6 +203,8 @@ class ZeroDCleanupEnv(MultiAgentEnv):
             "cleaner": len(dirt_agents),
             # "total_reward_by_agent": self.total_reward_by_agent,
         }
+        if dones["__all__"] and profiler.enabled:
+            infos["profile"] = profiler.end_episode(total_apple_consumed=self.total_apple_consumed)
         return observations, rewards, dones, {"__all__": False}, infos
 
     def uniform_distribute(self, num_items, num_spots):
@@ -185,12 +260,10 @@ class ZeroDCleanupEnv(MultiAgentEnv):
         return new_apple, new_dirt
     
     def transition_P(self, s0, s1):
-        delta_a = s0[0] - s1[0]
-        delta_d = s0[1] - s1[1]
-        p1 = float(comb(s0[0], delta_a)*comb(self.area-s0[0], s1[2]-delta_a)) / comb(self.area, s1[2])
-        p2 = float(comb(s0[1], delta_d)*comb(self.area-s0[1], s1[3]-delta_d)) / comb(self.area, s1[3])
-        p = p1 * p2
-        return p
+        return cached_transition_P(self.area, (float(s0[0]), float(s0[1])), tuple(float(x) for x in s1[:4]))
+
+    def transition_matrix(self, s0, candidate_s1s):
+        return transition_matrix(self.area, s0, candidate_s1s)
     
     def simulate_future_state(self, new_p, new_c):
         apple_left = self.num_apples - ((self.num_apples * new_p) / self.area)
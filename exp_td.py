@@ -25,7 +25,6 @@ import torch.nn.functional as F
 
 from tqdm import tqdm
 from collections import defaultdict
-from scipy.special import comb
 
 from gymnasium.spaces import Box, Dict, Discrete, MultiDiscrete, Tuple
 import seaborn as sns
@@ -35,6 +34,9 @@ from matplotlib import colors
 from ray.rllib.env import MultiAgentEnv
 
 from agents.cleanup_agent import CleanupAgent, GreedyCleanUpAgent
+from environments.zero_d_cleanup_env import cached_transition_P
+from agents.metrics import MetricsLogger
+from agents.checkpoint import CheckpointManager
 
 # set up matplotlib
 is_ipython = 'inline' in matplotlib.get_backend()
@@ -433,12 +435,7 @@ class CleanupEnv(MultiAgentEnv):
         return dirt_reward
 
     def transition_P(self, s0, s1):
-        delta_a = s0[0] - s1[0]
-        delta_d = s0[1] - s1[1]
-        p1 = float(comb(s0[0], delta_a)*comb(self.area-s0[0], s1[2]-delta_a)) / comb(self.area, s1[2])
-        p2 = float(comb(s0[1], delta_d)*comb(self.area-s0[1], s1[3]-delta_d)) / comb(self.area, s1[3])
-        p = p1 * p2
-        return p
+        return cached_transition_P(self.area, (float(s0[0]), float(s0[1])), tuple(float(x) for x in s1[:4]))
 
     def generate_info(self):
         return {"apple": self.num_apples, "dirt": self.num_dirt, "x1": 0,
@@ -520,94 +517,83 @@ centralAgent = CentralizedAgent(num_agents, action_size)
 
 # Training loop
 f = open("log_td.txt", "w")
-f_good = open("good_log_td.txt", "w")
-for epoch in range(num_epochs):
-    print(f"=============== episode {epoch} ===============")
-    f.write(f"=============== episode {epoch} ===============\n")
-    # Reset environment and get initial state
-    epoch_reward = 0
-    max_epoch_reward = 0
-    env_states, info = env.reset()
-    states = preprocess_inputs(env_states)
-    cur_step_apple_reward = 0
-    info_vec = np.array([info["apple"], info["dirt"], info["picker"], info["cleaner"]])
-
-    good_epoch_apple = []
-    good_epoch_dirt = []
-    good_epoch_x1 = []
-    good_epoch_x2 = []
-    good_epoch_x3 = []
-
-    print(f"num apple: {env.num_apples}, num dirt: {env.num_dirt}")
-    print(env.epsilon)
-
-    if epoch > verbose_episode:
-        verbose = True
-    for step in tqdm(range(max_steps_per_epoch)):
-        # Environment responds
-        next_env_states, env_rewards, dones, _, info = env.step()
-        # if info["dirt"] == 0:
-        #     good_epoch_apple.append(info["apple"])
-        # else:
-        #     good_epoch_apple.append(info["apple"]/info["dirt"])
-        good_epoch_apple.append(info["apple"])
-        good_epoch_dirt.append(info["dirt"])
-        good_epoch_x1.append(env.dirt_agent)
-        good_epoch_x2.append(info["x2"])
-        good_epoch_x3.append(env.apple_agent)
-
-        new_info_vec = np.array([info["apple"], info["dirt"], info["picker"], info["cleaner"]])
-        epoch_reward = env_rewards["apple"]
-        cur_step_apple_reward = env_rewards["step_apple"]
-
-        if not env.heuristic:
-            # print("Training feeding....")
-            # print(cur_step_apple_reward, info_vec, new_info_vec)
-            centralAgent.step(cur_step_apple_reward, info_vec, new_info_vec)
-
-        # Update state
-        info_vec = new_info_vec
-
-        if dones["__all__"]:
-            break
-    env.epoch += 1
-    centralAgent.scheduler.step()
-    if epoch_reward >= 0:
-        f_good.write(f"Epoch number: {epoch}\n")
-        f_good.write(f"Epoch reward: {epoch_reward}\n")
-        f_good.write(f"Epoch apple/dirt\n")
-        f_good.write(f"{[round(elem, 2) for elem in good_epoch_apple]}\n\n")
-        f_good.write(f"Epoch dirt\n")
-        f_good.write(f"{[round(elem, 2) for elem in good_epoch_dirt]}\n\n")
-        f_good.write(f"Epoch x1\n")
-        f_good.write(f"{good_epoch_x1}\n\n")
-        f_good.write(f"Epoch x2\n")
-        f_good.write(f"{good_epoch_x2}\n\n")
-        f_good.write(f"Epoch x3\n")
-        f_good.write(f"{good_epoch_x3}\n\n")
-    if epoch_reward > 2600 and epoch_reward >= max_epoch_reward and env.epoch > 10:
-        max_epoch_reward = epoch_reward
-        torch.save(centralAgent.u_network.state_dict(), "model_save_td")
-
-    print(f"Epoch reward: {epoch_reward}")
-    reward_graph.append(epoch_reward)
-    print("Reward graph: ")
-    print([round(elem, 2) for elem in reward_graph])
-    f.write("Reward graph: \n")
-    f.write(f"{reward_graph}\n")
-
-    weight1 = torch.norm(centralAgent.u_network._modules['coord2'].weight).item()
-    weight_graph[1].append(weight1)
-    print(weight_graph[1])
-
-    print(f"Ending num apple: {env.num_apples}, num dirt: {env.num_dirt}")
-    print(f"Ending agents apple : {env.apple_agent}, dirt: {env.dirt_agent}")
-
-
-    print(f"Epoch reward: {epoch_reward}")
-    if (epoch + 1) % 100 == 0:
-        print(f"Epoch {epoch} completed")
-        f.write("Weight Graph: \n")
-
-f.close()
-f_good.close()
+metrics = MetricsLogger("metrics_td")
+checkpoints = CheckpointManager("checkpoints_td", keep=3)
+try:
+    for epoch in range(num_epochs):
+        print(f"=============== episode {epoch} ===============")
+        f.write(f"=============== episode {epoch} ===============\n")
+        # Reset environment and get initial state
+        epoch_reward = 0
+        env_states, info = env.reset()
+        states = preprocess_inputs(env_states)
+        cur_step_apple_reward = 0
+        info_vec = np.array([info["apple"], info["dirt"], info["picker"], info["cleaner"]])
+
+        good_epoch_apple = []
+        good_epoch_dirt = []
+        good_epoch_x1 = []
+        good_epoch_x2 = []
+        good_epoch_x3 = []
+
+        print(f"num apple: {env.num_apples}, num dirt: {env.num_dirt}")
+        print(env.epsilon)
+
+        if epoch > verbose_episode:
+            verbose = True
+        for step in tqdm(range(max_steps_per_epoch)):
+            # Environment responds
+            next_env_states, env_rewards, dones, _, info = env.step()
+            # if info["dirt"] == 0:
+            #     good_epoch_apple.append(info["apple"])
+            # else:
+            #     good_epoch_apple.append(info["apple"]/info["dirt"])
+            good_epoch_apple.append(info["apple"])
+            good_epoch_dirt.append(info["dirt"])
+            good_epoch_x1.append(env.dirt_agent)
+            good_epoch_x2.append(info["x2"])
+            good_epoch_x3.append(env.apple_agent)
+
+            new_info_vec = np.array([info["apple"], info["dirt"], info["picker"], info["cleaner"]])
+            epoch_reward = env_rewards["apple"]
+            cur_step_apple_reward = env_rewards["step_apple"]
+
+            if not env.heuristic:
+                # print("Training feeding....")
+                # print(cur_step_apple_reward, info_vec, new_info_vec)
+                centralAgent.step(cur_step_apple_reward, info_vec, new_info_vec)
+
+            # Update state
+            info_vec = new_info_vec
+
+            if dones["__all__"]:
+                break
+        env.epoch += 1
+        centralAgent.scheduler.step()
+        checkpoints.save({"u_network": centralAgent.u_network.state_dict(), "u_optimizer": centralAgent.u_optimizer.state_dict(),
+                          "scheduler": centralAgent.scheduler.state_dict(), "epsilon": env.epsilon}, epoch, epoch_reward)
+        # the network alone, in the format downstream loading expects
+        if epoch_reward > 2600 and env.epoch > 10:
+            torch.save(centralAgent.u_network.state_dict(), "model_save_td")
+
+        print(f"Epoch reward: {epoch_reward}")
+        reward_graph.append(epoch_reward)
+
+        weight1 = torch.norm(centralAgent.u_network._modules['coord2'].weight).item()
+        weight_graph[1].append(weight1)
+        print(f"coord2 weight norm: {weight1}")
+        metrics.log_episode(epoch, epoch_reward, {"apple": good_epoch_apple, "dirt": good_epoch_dirt, "x1": good_epoch_x1, "x2": good_epoch_x2, "x3": good_epoch_x3}, coord2_weight_norm=weight1)
+        print(metrics.summary())
+
+        print(f"Ending num apple: {env.num_apples}, num dirt: {env.num_dirt}")
+        print(f"Ending agents apple : {env.apple_agent}, dirt: {env.dirt_agent}")
+
+
+        print(f"Epoch reward: {epoch_reward}")
+        if (epoch + 1) % 100 == 0:
+            print(f"Epoch {epoch} completed")
+            f.write("Weight Graph: \n")
+finally:
+    f.close()
+    metrics.close()
+    checkpoints.close()
@@ -34,6 +34,8 @@ from matplotlib import colors
 from ray.rllib.env import MultiAgentEnv
 
 from agents.cleanup_agent import CleanupAgent, GreedyCleanUpAgent
+from agents.metrics import MetricsLogger
+from agents.checkpoint import CheckpointManager
 
 # set up matplotlib
 is_ipython = 'inline' in matplotlib.get_backend()
@@ -646,156 +648,146 @@ centralAgent = CentralizedAgent(num_agents, action_size)
 
 # Training loop
 f = open("log_qu2.txt", "w")
-f_good = open("good_log_qu2.txt", "w")
-for epoch in range(num_epochs):
-    print(f"=============== episode {epoch} ===============")
-    f.write(f"=============== episode {epoch} ===============\n")
-    # Reset environment and get initial state
-    epoch_reward = 0
-    # epoch_garbage = 0
-    env_states, info = env.reset()
-    states = preprocess_inputs(env_states)
-    # info_vec = np.array([info["apple"], info["dirt"], info["x1"], info["x2"], info["x3"]])
-    info_vec = np.array([info["apple"], info["dirt"]])
-    # p = info["pos"].flatten()
-    # info_vec = np.concatenate((info_vec, p))
-
-    good_epoch_apple = []
-    good_epoch_dirt = []
-    good_epoch_x1 = []
-    good_epoch_x2 = []
-    good_epoch_x3 = []
-
-    print(f"num apple: {env.num_apples}, num dirt: {env.num_dirt}")
-    print(f"Starting rewards apple : {env.apple_reward}, dirt (should be big): {env.dirt_reward}")
-    dirt_reward_graph.append(env.dirt_reward)
-    print(dirt_reward_graph)
-    if epoch > verbose_episode:
-        verbose = True
-    for step in tqdm(range(max_steps_per_epoch)):
-        # Agent takes action
-        actions = centralAgent.get_actions(states)
-        apple_picker, dirt_cleaner = 0, 0
-        for i in range(num_agents):
-            str_i = str(i)
-            role = actions[0][i]
-            if role == 0:  # apple to apple
-                env.agents[str_i].region = 1
-                apple_picker += 1
-            elif role == 1:  # apple to dirt
-                env.agents[str_i].region = -1
-                dirt_cleaner += 1
-        if verbose:
-            print(f"{step}: Apple picker: {apple_picker}, dirt cleaner: {dirt_cleaner}")
-        # env_actions = {}
-        # for i in range(num_agents):
-        #     env_actions[str(i)] = actions[0][i]
-
-        env_actions = env.greedily_move_to_closest_object()
-        # Environment responds
-        next_env_states, env_rewards, dones, _, info = env.step(env_actions)
-        if info["dirt"] == 0:
-            good_epoch_apple.append(info["apple"])
-        else:
-            good_epoch_apple.append(info["apple"]/info["dirt"])
-        good_epoch_dirt.append(info["dirt"])
-        good_epoch_x1.append(info["x1"])
-        good_epoch_x2.append(info["x2"])
-        good_epoch_x3.append(info["x3"])
-
-        # new_info_vec = np.array([info["apple"], info["dirt"], info["x1"], info["x2"], info["x3"]])
-        new_info_vec = np.array([info["apple"], info["dirt"]])
+metrics = MetricsLogger("metrics_qu2")
+checkpoints = CheckpointManager("checkpoints_qu2", keep=3)
+try:
+    for epoch in range(num_epochs):
+        print(f"=============== episode {epoch} ===============")
+        f.write(f"=============== episode {epoch} ===============\n")
+        # Reset environment and get initial state
+        epoch_reward = 0
+        # epoch_garbage = 0
+        env_states, info = env.reset()
+        states = preprocess_inputs(env_states)
+        # info_vec = np.array([info["apple"], info["dirt"], info["x1"], info["x2"], info["x3"]])
+        info_vec = np.array([info["apple"], info["dirt"]])
         # p = info["pos"].flatten()
-        # new_info_vec = np.concatenate((new_info_vec, p))
-        next_states = preprocess_inputs(next_env_states)
-        rewards = np.zeros((1, num_agents))
-        # normalized_uReward = torch.nn.functional.normalize(agent.q_network.U_Reward, dim=0)
-        for i in range(num_agents):  # 0 is garbage man, we don't count
-            reward_i = env_rewards[str(i)]
-            rewards[0][i] = reward_i
-        epoch_reward = env_rewards["apple"]
-        step_apple_reward = env_rewards["step_apple"]
-
-        centralAgent.step(states, actions, rewards, step_apple_reward, next_states, info_vec, new_info_vec, True)
-
-        # Update state
-        states = next_states
-        info_vec = new_info_vec
-        if verbose:
-            print(f"{step}: num apple: {env.num_apples}, num dirt: {env.num_dirt}")
-            print(f"{step}: rewards apple : {env.apple_reward}, dirt: {env.dirt_reward}")
-
-        if dones["__all__"]:
-            break
-    # agent.scheduler.step()
-
-    if epoch_reward > 3500:
-        f_good.write(f"Epoch number: {epoch}\n")
-        f_good.write(f"Epoch reward: {epoch_reward}\n")
-        f_good.write(f"Epoch apple/dirt\n")
-        f_good.write(f"{good_epoch_apple}\n\n")
-        f_good.write(f"Epoch dirt\n")
-        f_good.write(f"{good_epoch_dirt}\n\n")
-        f_good.write(f"Epoch x1\n")
-        f_good.write(f"{good_epoch_x1}\n\n")
-        f_good.write(f"Epoch x2\n")
-        f_good.write(f"{good_epoch_x2}\n\n")
-        f_good.write(f"Epoch x3\n")
-        f_good.write(f"{good_epoch_x3}\n\n")
-
-    print(f"Epoch reward: {epoch_reward}")
-    reward_graph.append(epoch_reward)
-    print("Reward graph: ")
-    print(reward_graph)
-    f.write("Reward graph: \n")
-    f.write(f"{reward_graph}\n")
-
-    # garbage_collected.append(epoch_garbage)
-    # print("garbage graph: ")
-    # print(garbage_collected)
-    # f.write("garbage graph: \n")
-    # f.write(f"{garbage_collected}\n")
-
-    weight1_1 = centralAgent.q_network._modules['fc1'].weight[0][0]
-    weight1_2 = centralAgent.q_network._modules['fc1'].weight[1][1]
-    weight1_3 = centralAgent.q_network._modules['fc1'].weight[10][10]
-    weight1_4 = centralAgent.q_network._modules['fc1'].weight[12][2]
-    # weight2_1 = centralAgent.q_network._modules['fc2'].weight[0][0]
-    # weight2_2 = centralAgent.q_network._modules['fc2'].weight[3][3]
-    # weight2_3 = centralAgent.q_network._modules['fc2'].weight[14][12]
-    weight3_1 = centralAgent.q_network._modules['fc3'].weight[0][0]
-    weight3_2 = centralAgent.q_network._modules['fc3'].weight[5][5]
-    weight3_3 = centralAgent.q_network._modules['fc3'].weight[14][12]
-    weight_graph[11].append(weight1_1.item())
-    weight_graph[12].append(weight1_2.item())
-    weight_graph[13].append(weight1_3.item())
-    weight_graph[14].append(weight1_4.item())
-    # weight_graph[21].append(weight2_1.item())
-    # weight_graph[22].append(weight2_2.item())
-    # weight_graph[23].append(weight2_3.item())
-    weight_graph[31].append(weight3_1.item())
-    weight_graph[32].append(weight3_2.item())
-    weight_graph[33].append(weight3_3.item())
-
-    print(weight_graph[13])
-
-    print(f"Ending num apple: {env.num_apples}, num dirt: {env.num_dirt}")
-    print(f"Ending rewards apple : {env.apple_reward}, dirt(should be small): {env.dirt_reward}")
-
-    print(f"Epoch reward: {epoch_reward}")
-    if (epoch + 1) % 100 == 0:
-        print(f"Epoch {epoch} completed")
-        f.write("Weight Graph: \n")
-        f.write(f"{weight_graph[11]}\n\n")
-        f.write(f"{weight_graph[12]}\n\n")
-        f.write(f"{weight_graph[13]}\n\n")
-        f.write(f"{weight_graph[14]}\n\n")
-        # f.write(f"{weight_graph[21]}\n\n")
-        # f.write(f"{weight_graph[22]}\n\n")
-        # f.write(f"{weight_graph[23]}\n\n")
-        f.write(f"{weight_graph[31]}\n\n")
-        f.write(f"{weight_graph[32]}\n\n")
-        f.write(f"{weight_graph[33]}\n\n")
-f.close()
-f_good.close()
+        # info_vec = np.concatenate((info_vec, p))
+
+        good_epoch_apple = []
+        good_epoch_dirt = []
+        good_epoch_x1 = []
+        good_epoch_x2 = []
+        good_epoch_x3 = []
+
+        print(f"num apple: {env.num_apples}, num dirt: {env.num_dirt}")
+        print(f"Starting rewards apple : {env.apple_reward}, dirt (should be big): {env.dirt_reward}")
+        dirt_reward_graph.append(env.dirt_reward)
+        if epoch > verbose_episode:
+            verbose = True
+        for step in tqdm(range(max_steps_per_epoch)):
+            # Agent takes action
+            actions = centralAgent.get_actions(states)
+            apple_picker, dirt_cleaner = 0, 0
+            for i in range(num_agents):
+                str_i = str(i)
+                role = actions[0][i]
+                if role == 0:  # apple to apple
+                    env.agents[str_i].region = 1
+                    apple_picker += 1
+                elif role == 1:  # apple to dirt
+                    env.agents[str_i].region = -1
+                    dirt_cleaner += 1
+            if verbose:
+                print(f"{step}: Apple picker: {apple_picker}, dirt cleaner: {dirt_cleaner}")
+            # env_actions = {}
+            # for i in range(num_agents):
+            #     env_actions[str(i)] = actions[0][i]
+
+            env_actions = env.greedily_move_to_closest_object()
+            # Environment responds
+            next_env_states, env_rewards, dones, _, info = env.step(env_actions)
+            if info["dirt"] == 0:
+                good_epoch_apple.append(info["apple"])
+            else:
+                good_epoch_apple.append(info["apple"]/info["dirt"])
+            good_epoch_dirt.append(info["dirt"])
+            good_epoch_x1.append(info["x1"])
+            good_epoch_x2.append(info["x2"])
+            good_epoch_x3.append(info["x3"])
+
+            # new_info_vec = np.array([info["apple"], info["dirt"], info["x1"], info["x2"], info["x3"]])
+            new_info_vec = np.array([info["apple"], info["dirt"]])
+            # p = info["pos"].flatten()
+            # new_info_vec = np.concatenate((new_info_vec, p))
+            next_states = preprocess_inputs(next_env_states)
+            rewards = np.zeros((1, num_agents))
+            # normalized_uReward = torch.nn.functional.normalize(agent.q_network.U_Reward, dim=0)
+            for i in range(num_agents):  # 0 is garbage man, we don't count
+                reward_i = env_rewards[str(i)]
+                rewards[0][i] = reward_i
+            epoch_reward = env_rewards["apple"]
+            step_apple_reward = env_rewards["step_apple"]
+
+            centralAgent.step(states, actions, rewards, step_apple_reward, next_states, info_vec, new_info_vec, True)
+
+            # Update state
+            states = next_states
+            info_vec = new_info_vec
+            if verbose:
+                print(f"{step}: num apple: {env.num_apples}, num dirt: {env.num_dirt}")
+                print(f"{step}: rewards apple : {env.apple_reward}, dirt: {env.dirt_reward}")
+
+            if dones["__all__"]:
+                break
+        # agent.scheduler.step()
+
+        print(f"Epoch reward: {epoch_reward}")
+        reward_graph.append(epoch_reward)
+
+        # garbage_collected.append(epoch_garbage)
+        # print("garbage graph: ")
+        # print(garbage_collected)
+        # f.write("garbage graph: \n")
+        # f.write(f"{garbage_collected}\n")
+
+        weight1_1 = centralAgent.q_network._modules['fc1'].weight[0][0]
+        weight1_2 = centralAgent.q_network._modules['fc1'].weight[1][1]
+        weight1_3 = centralAgent.q_network._modules['fc1'].weight[10][10]
+        weight1_4 = centralAgent.q_network._modules['fc1'].weight[12][2]
+        # weight2_1 = centralAgent.q_network._modules['fc2'].weight[0][0]
+        # weight2_2 = centralAgent.q_network._modules['fc2'].weight[3][3]
+        # weight2_3 = centralAgent.q_network._modules['fc2'].weight[14][12]
+        weight3_1 = centralAgent.q_network._modules['fc3'].weight[0][0]
+        weight3_2 = centralAgent.q_network._modules['fc3'].weight[5][5]
+        weight3_3 = centralAgent.q_network._modules['fc3'].weight[14][12]
+        weight_graph[11].append(weight1_1.item())
+        weight_graph[12].append(weight1_2.item())
+        weight_graph[13].append(weight1_3.item())
+        weight_graph[14].append(weight1_4.item())
+        # weight_graph[21].append(weight2_1.item())
+        # weight_graph[22].append(weight2_2.item())
+        # weight_graph[23].append(weight2_3.item())
+        weight_graph[31].append(weight3_1.item())
+        weight_graph[32].append(weight3_2.item())
+        weight_graph[33].append(weight3_3.item())
+
+        metrics.log_episode(epoch, epoch_reward, {"apple_per_dirt": good_epoch_apple, "dirt": good_epoch_dirt, "x1": good_epoch_x1, "x2": good_epoch_x2, "x3": good_epoch_x3},
+                            starting_dirt_reward=dirt_reward_graph[-1], fc1_weight_10_10=weight_graph[13][-1])
+        print(metrics.summary())
+        checkpoints.save({"q_network": centralAgent.q_network.state_dict(), "q_optimizer": centralAgent.q_optimizer.state_dict(),
+                          "u_network": centralAgent.u_network.state_dict(), "u_optimizer": centralAgent.u_optimizer.state_dict(),
+                          "epsilon": centralAgent.epsilon}, epoch, epoch_reward)
+
+        print(f"Ending num apple: {env.num_apples}, num dirt: {env.num_dirt}")
+        print(f"Ending rewards apple : {env.apple_reward}, dirt(should be small): {env.dirt_reward}")
+
+        print(f"Epoch reward: {epoch_reward}")
+        if (epoch + 1) % 100 == 0:
+            print(f"Epoch {epoch} completed")
+            f.write("Weight Graph: \n")
+            f.write(f"{weight_graph[11]}\n\n")
+            f.write(f"{weight_graph[12]}\n\n")
+            f.write(f"{weight_graph[13]}\n\n")
+            f.write(f"{weight_graph[14]}\n\n")
+            # f.write(f"{weight_graph[21]}\n\n")
+            # f.write(f"{weight_graph[22]}\n\n")
+            # f.write(f"{weight_graph[23]}\n\n")
+            f.write(f"{weight_graph[31]}\n\n")
+            f.write(f"{weight_graph[32]}\n\n")
+            f.write(f"{weight_graph[33]}\n\n")
+finally:
+    f.close()
+    metrics.close()
+    checkpoints.close()
 torch.save(centralAgent.q_network.state_dict(), "model_savequ2")
@@ -1,4 +1,6 @@
 from environments.one_d_cleanup_env import OneDCleanupEnv
+from environments.one_d_step_kernel import heuristic_episode, NUMBA_AVAILABLE
+from agents.rollout import RolloutWorkers
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
@@ -13,70 +15,101 @@ thresholdRestoration = 0.0
 wasteSpawnProbability = 0.5
 appleRespawnProbability = 0.05
 dirt_multiplier = 10
+num_workers = 0  # run episodes in this many worker processes; 0 runs them serially in this process
+use_kernel = NUMBA_AVAILABLE  # run serial episodes with the compiled step kernel
 
 area = 150
-env = OneDCleanupEnv(agent_ids=agent_ids,
-                     num_agents=num_agents,
-                     area=area,
-                     thresholdDepletion=thresholdDepletion,
-                     thresholdRestoration=thresholdRestoration,
-                     wasteSpawnProbability=wasteSpawnProbability,
-                     appleRespawnProbability=appleRespawnProbability,
-                     dirt_multiplier=dirt_multiplier, use_randomness=False)
+env_kwargs = dict(agent_ids=agent_ids,
+                  num_agents=num_agents,
+                  area=area,
+                  thresholdDepletion=thresholdDepletion,
+                  thresholdRestoration=thresholdRestoration,
+                  wasteSpawnProbability=wasteSpawnProbability,
+                  appleRespawnProbability=appleRespawnProbability,
+                  dirt_multiplier=dirt_multiplier, use_randomness=False)
+env = OneDCleanupEnv(**env_kwargs)
 test_stats = []
 ending_ep_rewards = []
-for episode in range(num_episodes):
-    test_stats.append({
-        "num_apples": [],
-        "num_dirt": [],
-        "pickers": [],
-        "cleaners": [],
-        "total_reward": 0,
-    })
 
-    print(f"========= Episode {episode} =========")
+if num_workers > 0:
+    workers = RolloutWorkers(num_workers, env_kwargs, steps_per_episode=steps_per_episode)
+    for episode, (states, rewards, next_states, ending_reward) in enumerate(tqdm(workers.episodes(num_episodes), total=num_episodes)):
+        test_stats.append({
+            "num_apples": [states[0, 0]] + next_states[:, 0].tolist(),
+            "num_dirt": [states[0, 1]] + next_states[:, 1].tolist(),
+            "pickers": [states[0, 2]] + next_states[:, 2].tolist(),
+            "cleaners": [states[0, 3]] + next_states[:, 3].tolist(),
+            "total_reward": ending_reward,
+        })
+        ending_ep_rewards.append(ending_reward)
+        print(f"Ending reward of episode {episode}: {ending_reward}")
+    workers.close()
+elif use_kernel:
+    for episode in range(num_episodes):
+        env.reset()
+        trajectory, ending_reward = heuristic_episode(env, steps_per_episode)
+        test_stats.append({
+            "num_apples": [trajectory[0, 0]] + trajectory[:, 5].tolist(),
+            "num_dirt": [trajectory[0, 1]] + trajectory[:, 6].tolist(),
+            "pickers": [trajectory[0, 2]] + trajectory[:, 7].tolist(),
+            "cleaners": [trajectory[0, 3]] + trajectory[:, 8].tolist(),
+            "total_reward": ending_reward,
+        })
+        ending_ep_rewards.append(ending_reward)
+        print(f"Ending reward of episode {episode}: {ending_reward}")
+else:
+    for episode in range(num_episodes):
+        test_stats.append({
+            "num_apples": [],
+            "num_dirt": [],
+            "pickers": [],
+            "cleaners": [],
+            "total_reward": 0,
+        })
 
-    states, info = env.reset()
-    state = states["coordinator"]
-    test_stats[-1]["num_apples"].append(info["apple"])
-    test_stats[-1]["num_dirt"].append(info["dirt"])
-    test_stats[-1]["pickers"].append(info["picker"])
-    test_stats[-1]["cleaners"].append(info["cleaner"])
-
-    for step in tqdm(range(steps_per_episode)):
-        #env.render()
-        num_apples, num_dirt, _, _ = state
-        agent_frequency_in_dirt = num_dirt / (num_apples + num_dirt)
-        num_cleaner = round(num_agents * agent_frequency_in_dirt)
-        num_picker = num_agents - num_cleaner
-        # num_cleaner = 6
-        # num_picker = 4
-        assignments = env.get_greedy_assignments(num_picker, num_cleaner)
-        actions = env.get_greedy_actions(assignments)
-        next_states, reward, dones, info = env.step(actions)
-        next_state = next_states["coordinator"]
+        print(f"========= Episode {episode} =========")
 
+        states, info = env.reset()
+        state = states["coordinator"]
         test_stats[-1]["num_apples"].append(info["apple"])
         test_stats[-1]["num_dirt"].append(info["dirt"])
         test_stats[-1]["pickers"].append(info["picker"])
         test_stats[-1]["cleaners"].append(info["cleaner"])
-        #reward = sum(rewards.values())
 
-        state = next_state
+        for step in tqdm(range(steps_per_episode)):
+            #env.render()
+            num_apples, num_dirt, _, _ = state
+            agent_frequency_in_dirt = num_dirt / (num_apples + num_dirt)
+            num_cleaner = round(num_agents * agent_frequency_in_dirt)
+            num_picker = num_agents - num_cleaner
+            # num_cleaner = 6
+            # num_picker = 4
+            assignments = env.get_greedy_assignments(num_picker, num_cleaner)
+            actions = env.get_greedy_actions(assignments)
+            next_states, reward, dones, _, info = env.step(actions)
+            next_state = next_states["coordinator"]
+
+            test_stats[-1]["num_apples"].append(info["apple"])
+            test_stats[-1]["num_dirt"].append(info["dirt"])
+            test_stats[-1]["pickers"].append(info["picker"])
+            test_stats[-1]["cleaners"].append(info["cleaner"])
+            #reward = sum(rewards.values())
+
+            state = next_state
 
-        if episode > verbose_episode:
-            print(f"========= Step {step} =========")
-            print(f"info: {info}")
+            if episode > verbose_episode:
+                print(f"========= Step {step} =========")
+                print(f"info: {info}")
 
-        if dones["__all__"]:
-            break
+            if dones["__all__"]:
+                break
 
-    ending_reward = info["total_apple_consumed"]
+        ending_reward = info["total_apple_consumed"]
 
-    test_stats[-1]["total_reward"] = ending_reward
-    ending_ep_rewards.append(ending_reward)
+        test_stats[-1]["total_reward"] = ending_reward
+        ending_ep_rewards.append(ending_reward)
 
-    print(f"Ending reward: {ending_reward}")
-    #print(f"reward graph: {reward_graph}")
-    print(f"========= End of Episode {episode} =========")
-    print(ending_ep_rewards)
+        print(f"Ending reward: {ending_reward}")
+        #print(f"reward graph: {reward_graph}")
+        print(f"========= End of Episode {episode} =========")
+        print(ending_ep_rewards)
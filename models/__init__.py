@@ -1,2 +1,3 @@
 from .qnet import *
-from .unet import *
\ No newline at end of file
+from .unet import *
+from .inference import *
\ No newline at end of file
@@ -0,0 +1,143 @@
+import asyncio
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+
+class InferenceServer:
+    """
+    Serves forward passes of a UNetwork or QNetwork to many environments at once.
+    Callers (threads, or asyncio tasks through infer_async) submit a (rows, ...) batch of inputs each, e.g. one state for
+    QAgent.act or the num_agents + 1 split states of OneDUCoordinator.generate_roles. A server thread gathers the queued
+    requests until it has max_requests of them or max_rows rows, or max_wait seconds have passed since the first, runs one
+    forward over their concatenation under torch.inference_mode and scatters the output rows back to each caller's future.
+    The server runs a private copy of the model; update builds a new copy with the pushed weights and swaps it in, so
+    batches never wait on the copy and take the new weights from the next one. A server serves one model: the first
+    owner to push weights claims it, and pushes from any other owner are refused.
+    Requests submitted after close fail with a RuntimeError instead of waiting forever.
+    """
+
+    def __init__(self, model, device=torch.device("cpu"), max_rows=4096, max_requests=None, max_wait=0.0005):
+        self.model = copy.deepcopy(model).to(device).eval()
+        self.device = device
+        self.owner = None
+        self.max_rows = max_rows
+        self.max_requests = max_requests
+        self.max_wait = max_wait
+
+        self.requests = queue.SimpleQueue()
+        # orders submit against close, so no request is queued behind the stop marker
+        self.submit_lock = threading.Lock()
+        self.closed = False
+        self.num_batches = 0
+        self.num_requests = 0
+
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def submit(self, inputs):
+        """
+        Queue a (rows, ...) batch of inputs. Returns a concurrent.futures.Future of the (rows, ...) output on the CPU.
+        """
+        future = Future()
+        inputs = torch.as_tensor(inputs, dtype=torch.float32)
+        with self.submit_lock:
+            if self.closed:
+                future.set_exception(RuntimeError("inference server is closed"))
+            else:
+                self.requests.put((inputs, future))
+        return future
+
+    def __call__(self, inputs):
+        return self.submit(inputs).result()
+
+    async def infer_async(self, inputs):
+        return await asyncio.wrap_future(self.submit(inputs))
+
+    def infer_many(self, inputs):
+        """
+        Run a list of input batches in one forward in the calling thread, for vectorised loops that already hold every
+        environment's request. Returns the list of outputs.
+        """
+        inputs = [torch.as_tensor(x, dtype=torch.float32) for x in inputs]
+        return list(torch.split(self.forward(torch.cat(inputs)), [len(x) for x in inputs]))
+
+    def update(self, state_dict, owner=None):
+        """
+        Serve the weights of state_dict from the next batch on. The weights are copied, so training may go on meanwhile.
+        Raises ValueError if another owner already pushed weights to this server.
+        """
+        if owner is not None:
+            if self.owner is not None and self.owner is not owner:
+                raise ValueError("inference server already serves the weights of another owner")
+            self.owner = owner
+        model = copy.deepcopy(self.model)
+        model.load_state_dict(state_dict)
+        # batches in flight keep the model they started with
+        self.model = model
+
+    def forward(self, inputs):
+        model = self.model
+        with torch.inference_mode():
+            return model(inputs.to(self.device)).cpu()
+
+    def gather(self, first):
+        """
+        Collect the requests to batch with first. Returns (batch, stop) where stop is set if close was called.
+        """
+        batch = [first]
+        rows = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_rows and (self.max_requests is None or len(batch) < self.max_requests):
+            try:
+                item = self.requests.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            rows += len(item[0])
+        return batch, False
+
+    def serve(self):
+        stop = False
+        while not stop:
+            first = self.requests.get()
+            if first is None:
+                break
+            batch, stop = self.gather(first)
+            try:
+                outputs = self.forward(torch.cat([inputs for inputs, _ in batch]))
+                for (_, future), output in zip(batch, torch.split(outputs, [len(inputs) for inputs, _ in batch])):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.num_batches += 1
+            self.num_requests += len(batch)
+        while True:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("inference server is closed"))
+
+    def close(self):
+        with self.submit_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
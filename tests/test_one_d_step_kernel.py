@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from environments.one_d_cleanup_env import OneDCleanupEnv
+from environments.one_d_step_kernel import heuristic_episode, observe_agents
+
+NUM_AGENTS = 10
+SEED = 5
+NUM_STEPS = 1000
+
+
+def make_env(use_randomness):
+    env = OneDCleanupEnv([str(i + 1) for i in range(NUM_AGENTS)], num_agents=NUM_AGENTS, area=150, use_randomness=use_randomness)
+    env.reset(seed=SEED)
+    return env
+
+
+def step_episode(env, num_steps):
+    """
+    The dirt-ratio heuristic of heuristic_script.py through env.step, as rows of (state, reward, next_state).
+    """
+    state = (env.num_apples, env.num_dirt, env.num_pickers, env.num_cleaners)
+    rows = []
+    for _ in range(num_steps):
+        num_apples, num_dirt, _, _ = state
+        num_cleaners = round(NUM_AGENTS * (num_dirt / (num_apples + num_dirt)))
+        actions = env.get_greedy_actions(env.get_greedy_assignments(NUM_AGENTS - num_cleaners, num_cleaners))
+        next_states, rewards, _, _, _ = env.step(actions)
+        next_state = next_states["coordinator"]
+        rows.append([*state, sum(rewards.values()), *next_state])
+        state = next_state
+    return np.array(rows, dtype=np.float64)
+
+
+@pytest.mark.parametrize("use_randomness", [True, False])
+def test_heuristic_episode_matches_step(use_randomness):
+    stepped, compiled = make_env(use_randomness), make_env(use_randomness)
+    expected = step_episode(stepped, NUM_STEPS)
+    trajectory, total_reward = heuristic_episode(compiled, NUM_STEPS)
+
+    np.testing.assert_array_equal(trajectory, expected)
+    assert total_reward == stepped.total_apple_consumed == compiled.total_apple_consumed
+    for name in ("apple_map", "waste_map", "apple_agent_map", "waste_agent_map"):
+        np.testing.assert_array_equal(getattr(compiled, name), getattr(stepped, name))
+    np.testing.assert_array_equal(compiled._agents.pos, stepped._agents.pos)
+    np.testing.assert_array_equal(compiled._agents.region, stepped._agents.region)
+    assert compiled.np_random.bit_generator.state == stepped.np_random.bit_generator.state
+    # later steps of both environments spawn from the same free cells
+    np.testing.assert_array_equal(compiled.index.free_apples.members(), stepped.index.free_apples.members())
+    np.testing.assert_array_equal(compiled.index.free_waste.members(), stepped.index.free_waste.members())
+
+
+def test_observe_agents_matches_observe():
+    env = make_env(True)
+    step_episode(env, 50)
+    agents = env._agents
+    out = np.empty((len(agents.ids), 4))
+    observe_agents(env.apple_map, env.waste_map, env.apple_agent_map, env.waste_agent_map, agents.pos, agents.region, out)
+
+    observations = env.observe()
+    np.testing.assert_array_equal(out, np.array([observations[id] for id in agents.ids]))
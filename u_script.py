@@ -1,9 +1,8 @@
-from environments import OneDCleanupEnv
+from environments import OneDCleanupEnv, PhaseProfiler
 import numpy as np
 import torch
-from agents import OneDUCoordinator
+from agents import OneDUCoordinator, RolloutWorkers, MetricsLogger, CheckpointManager
 from tqdm import tqdm
-from collections import deque
 import matplotlib.pyplot as plt
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -16,6 +15,8 @@ reward_multiplier = 1
 pp = False
 verbose = False
 verbose_episode = 2000  # start printing at which epoch
+resume = False  # continue from the latest checkpoint in checkpoints_oned_u
+profile = False  # time the phases of every step and append a summary per episode to profile_oned_u.jsonl
 
 # env param
 num_agents = 10
@@ -33,17 +34,26 @@ epsilon_decay = 0.99995
 epsilon_min = 0.05
 lr = 0.0001
 batch_size = 10
+prioritized_replay = False
+num_workers = 0  # collect episodes in this many worker processes; 0 runs them serially in this process
 agent_ids = [str(i+1) for i in range(num_agents)]
 state_dim = 4
 num_roles = 2
-env = OneDCleanupEnv(agent_ids=agent_ids,
-                     num_agents=num_agents,
-                     thresholdDepletion=thresholdDepletion,
-                     thresholdRestoration=thresholdRestoration,
-                     wasteSpawnProbability=wasteSpawnProbability,
-                     appleRespawnProbability=appleRespawnProbability,
-                     dirt_multiplier=dirt_multiplier,
-                     area=150, use_randomness=False)
+env_kwargs = dict(agent_ids=agent_ids,
+                  num_agents=num_agents,
+                  thresholdDepletion=thresholdDepletion,
+                  thresholdRestoration=thresholdRestoration,
+                  wasteSpawnProbability=wasteSpawnProbability,
+                  appleRespawnProbability=appleRespawnProbability,
+                  dirt_multiplier=dirt_multiplier,
+                  area=150, use_randomness=False)
+env = OneDCleanupEnv(**env_kwargs, profiler=PhaseProfiler("profile_oned_u.jsonl") if profile else None)
+u_layers = [
+    (state_dim, 200),
+    (200, 100),
+    (100, 50),
+    (50, 1)
+]
 
 agentCoordinator = OneDUCoordinator(device=device,
                                     env=env,
@@ -56,88 +66,94 @@ agentCoordinator = OneDUCoordinator(device=device,
                                     epsilon=epsilon,
                                     epsilon_decay=epsilon_decay,
                                     epsilon_min=epsilon_min,
-                                    u_layers=[
-                                        (state_dim, 200),
-                                        (200, 100),
-                                        (100, 50),
-                                        (50, 1)
-                                    ])
+                                    prioritized_replay=prioritized_replay,
+                                    u_layers=u_layers)
 ending_ep_rewards = []
 num_episodes = 2000
 steps_per_epsiode = 1000
-max_reward = 0
-
-model_saves = deque()
-
-f_good = open("good_oned_u.txt", "w")  # record good results (set your threshold)
-
-for episode in range(num_episodes):
-    print(f"========= Episode {episode} =========")
-
-    states, info = env.reset()
-    state = states["coordinator"]
-
-    good_epoch_apple = []
-    good_epoch_dirt = []
-    good_epoch_x1 = []
-    # good_epoch_x2 = []
-    good_epoch_x3 = []
-
-
-    for step in tqdm(range(steps_per_epsiode)):
-        num_cleaners, num_pickers = agentCoordinator.generate_roles()
-        assignments = env.get_greedy_assignments(num_pickers, num_cleaners)
-        actions = env.get_greedy_actions(assignments)
-        next_states, rewards, dones, info = env.step(actions)
-        next_state = next_states["coordinator"]
-        reward = sum(rewards.values())
-
-        agentCoordinator.step(state, reward, next_state)
-
-        good_epoch_apple.append(info["apple"])
-        good_epoch_dirt.append(info["dirt"])
-        good_epoch_x1.append(info["cleaner"])
-        good_epoch_x3.append(info["picker"])
-
-        if episode > verbose_episode:
-            print(f"========= Step {step} =========")
-            print(f"info: {info}")
-
-        state = next_state
-
-        if dones["__all__"]:
-            break
-
-    ending_reward = info["total_apple_consumed"]
-
-    print(f"ending reward: {ending_reward}")
-    print(f"Current Epsilon: {agentCoordinator.epsilon}")
-    print(f"========= End of Episode {episode} =========")
-
-    ending_ep_rewards.append(ending_reward)
-    print(ending_ep_rewards)
-
-    if ending_reward >= 0:
-        f_good.write(f"Epoch number: {episode}\n")
-        f_good.write(f"Epoch reward: {ending_reward}\n")
-        f_good.write(f"Epoch apple\n")
-        f_good.write(f"{good_epoch_apple}\n\n")
-        f_good.write(f"Epoch dirt\n")
-        f_good.write(f"{good_epoch_dirt}\n\n")
-        f_good.write(f"Epoch dirt cleaners\n")
-        f_good.write(f"{good_epoch_x1}\n\n")
-        f_good.write(f"Epoch apple pickers\n")
-        f_good.write(f"{good_epoch_x3}\n\n")
-
-    agentCoordinator.scheduler.step()
-
-    # saving results
-    model_saves.append((ending_reward, agentCoordinator.u_network.state_dict()))
-    if len(model_saves) > 3:
-        model_saves.popleft()
-
-    if ending_reward > 2200 and episode > 10 and model_saves[0][0] > 2200:
-        max_reward = ending_reward
-        torch.save(model_saves[0][1], "model_save_oned")
-        torch.save(model_saves[1][1], "model_save_oned1")
 
+# forked before the checkpoint and metrics writer threads start
+workers = None
+if num_workers > 0:
+    workers = RolloutWorkers(num_workers, env_kwargs, u_layers=u_layers, steps_per_episode=steps_per_epsiode)
+
+checkpoints = CheckpointManager("checkpoints_oned_u", keep=3, resume=resume)
+start_episode = 0
+if resume and checkpoints.exists():
+    start_episode = checkpoints.restore(agentCoordinator, restore_rng=True)["episode"] + 1
+
+metrics = MetricsLogger("metrics_oned_u", resume=resume)  # per-step series and episode rewards, read back with agents.read_metrics
+
+if workers is not None:
+    workers.broadcast(agentCoordinator.u_network.state_dict(), agentCoordinator.epsilon)
+    worker_episodes = workers.episodes(num_episodes - start_episode)
+
+try:
+    for episode in range(start_episode, num_episodes):
+        print(f"========= Episode {episode} =========")
+
+        good_epoch_apple = []
+        good_epoch_dirt = []
+        good_epoch_x1 = []
+        # good_epoch_x2 = []
+        good_epoch_x3 = []
+
+        if workers is not None:
+            # the episode was played by a worker with recent weights; train on its transitions here
+            states, rewards, next_states, ending_reward = next(worker_episodes)
+            for state, reward, next_state in zip(states, rewards, next_states):
+                agentCoordinator.step(state, reward, next_state)
+            good_epoch_apple = next_states[:, 0].tolist()
+            good_epoch_dirt = next_states[:, 1].tolist()
+            good_epoch_x1 = next_states[:, 3].tolist()
+            good_epoch_x3 = next_states[:, 2].tolist()
+            workers.broadcast(agentCoordinator.u_network.state_dict(), agentCoordinator.epsilon)
+        else:
+            states, info = env.reset()
+            state = states["coordinator"]
+
+            for step in tqdm(range(steps_per_epsiode)):
+                num_cleaners, num_pickers = agentCoordinator.generate_roles()
+                actions = env.get_greedy_action_arrays(env.get_greedy_roles(num_pickers, num_cleaners))
+                next_states, rewards, dones, _, info = env.step(actions)
+                next_state = next_states["coordinator"]
+                reward = sum(rewards.values())
+
+                agentCoordinator.step(state, reward, next_state)
+
+                good_epoch_apple.append(info["apple"])
+                good_epoch_dirt.append(info["dirt"])
+                good_epoch_x1.append(info["cleaner"])
+                good_epoch_x3.append(info["picker"])
+
+                if episode > verbose_episode:
+                    print(f"========= Step {step} =========")
+                    print(f"info: {info}")
+
+                state = next_state
+
+                if dones["__all__"]:
+                    break
+
+            ending_reward = info["total_apple_consumed"]
+
+        print(f"ending reward: {ending_reward}")
+        print(f"Current Epsilon: {agentCoordinator.epsilon}")
+        print(f"========= End of Episode {episode} =========")
+
+        ending_ep_rewards.append(ending_reward)
+        metrics.log_episode(episode, ending_reward, {"apple": good_epoch_apple, "dirt": good_epoch_dirt, "cleaner": good_epoch_x1, "picker": good_epoch_x3}, epsilon=agentCoordinator.epsilon)
+        print(metrics.summary())
+
+        agentCoordinator.scheduler.step()
+
+        # saving results: a snapshot of this episode's weights, kept if it is among the 3 best
+        checkpoints.save(agentCoordinator, episode, ending_reward)
+        # the network alone, in the format downstream loading expects
+        if ending_reward > 2200 and episode > 10:
+            torch.save(agentCoordinator.u_network.state_dict(), "model_save_oned")
+finally:
+    if workers is not None:
+        workers.close()
+    metrics.close()
+    checkpoints.close()